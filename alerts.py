@@ -0,0 +1,152 @@
+import operator
+import time
+
+from records import HealthSample
+
+SEVERITIES = ("warning", "critical")
+
+# (name, field, comparison, threshold, severity, message)
+# "outside" takes a (low, high) pair; mirrors validate_health_data and the status thresholds
+ALERT_RULES = (
+    ("heart_rate_critical", "heart_rate", ">", 180, "critical",
+     "Heart rate above 180 bpm, stop and recover now"),
+    ("heart_rate_high", "heart_rate", ">", 160, "warning",
+     "Heart rate above 160 bpm, ease off the pace"),
+    ("blood_oxygen_critical", "blood_oxygen", "<", 90, "critical",
+     "Blood oxygen below 90%, stop exercising"),
+    ("blood_oxygen_low", "blood_oxygen", "<", 95, "warning",
+     "Blood oxygen below 95%, slow down and breathe deeply"),
+    ("systolic_critical", "blood_pressure_systolic", ">", 180, "critical",
+     "Systolic blood pressure above 180 mmHg, stop exercising"),
+    ("diastolic_critical", "blood_pressure_diastolic", ">", 120, "critical",
+     "Diastolic blood pressure above 120 mmHg, stop exercising"),
+    ("heart_rate_sensor", "heart_rate", "outside", (40, 200), "warning",
+     "Heart rate reading out of range, check the sensor"),
+    ("systolic_sensor", "blood_pressure_systolic", "outside", (85, 200), "warning",
+     "Systolic pressure reading out of range, check the sensor"),
+    ("heat_stress", "temperature", ">", 32, "warning",
+     "High temperature, hydrate and reduce intensity"),
+)
+
+_COMPARISONS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+
+class Alert:
+    """One triggered rule"""
+
+    __slots__ = ("rule", "severity", "message", "field", "value", "timestamp", "detected_at")
+
+    def __init__(self, rule, severity, message, field, value, timestamp, detected_at):
+        self.rule = rule
+        self.severity = severity
+        self.message = message
+        self.field = field
+        self.value = value
+        self.timestamp = timestamp
+        self.detected_at = detected_at
+
+    def __str__(self):
+        return f"[{self.severity.upper()}] {self.message} ({self.field}={self.value})"
+
+    def __repr__(self):
+        return f"Alert({self.rule!r}, {self.severity!r}, {self.field}={self.value!r})"
+
+
+def _compile_rule(comparison, threshold):
+    if comparison == "outside":
+        low, high = threshold
+        return lambda value: value < low or value > high
+    compare = _COMPARISONS[comparison]
+    return lambda value: compare(value, threshold)
+
+
+class AlertEngine:
+    """
+    Deterministic safety alerts evaluated on every sample
+
+    Rules are compiled once into plain comparisons, so evaluating a
+    sample takes a few microseconds. Alerts are edge-triggered: a rule
+    fires when it starts matching and again every `repeat_after`
+    seconds while it keeps matching. When several rules on the same
+    field match (e.g. heart rate above 160 and above 180) only the most
+    severe one is reported.
+
+    parameters:
+        rules (tuple): rule table, see ALERT_RULES
+        repeat_after (float): seconds before a still-active alert fires again
+        clock (callable): time source in seconds
+    """
+
+    def __init__(self, rules=ALERT_RULES, repeat_after=30.0, clock=time.monotonic):
+        self.repeat_after = repeat_after
+        self.clock = clock
+        self._rules = []
+        for name, field, comparison, threshold, severity, message in rules:
+            if severity not in SEVERITIES:
+                raise ValueError(f"Unknown severity for rule {name}: {severity}")
+            if comparison != "outside" and comparison not in _COMPARISONS:
+                raise ValueError(f"Unknown comparison for rule {name}: {comparison}")
+            self._rules.append((name, field, _compile_rule(comparison, threshold),
+                                SEVERITIES.index(severity), message))
+        # most severe rules first so they win per field
+        self._rules.sort(key=lambda rule: -rule[3])
+
+        self._active = {}
+        self._alerts = {}    # rule name -> last Alert fired while it keeps matching
+        self.stats = {"samples": 0, "alerts": 0, "warning": 0, "critical": 0}
+
+    def evaluate(self, sample):
+        """
+        Check one sample against the rule table
+
+        Returns: list of newly fired Alerts, most severe first
+        """
+        sample = HealthSample.from_dict(sample)
+        now = self.clock()
+        self.stats["samples"] += 1
+
+        fired = []
+        matched_fields = set()
+        matched_rules = set()
+        for name, field, matches, level, message in self._rules:
+            if field in matched_fields:
+                continue
+            value = getattr(sample, field)
+            if not matches(value):
+                continue
+            matched_fields.add(field)
+            matched_rules.add(name)
+            last = self._active.get(name)
+            if last is not None and now - last < self.repeat_after:
+                continue
+            self._active[name] = now
+            severity = SEVERITIES[level]
+            alert = self._alerts[name] = Alert(name, severity, message, field, value, sample.timestamp, now)
+            fired.append(alert)
+            self.stats["alerts"] += 1
+            self.stats[severity] += 1
+
+        # rules that stopped matching fire again as soon as they match again
+        for name in [name for name in self._active if name not in matched_rules]:
+            del self._active[name]
+            del self._alerts[name]
+        return fired
+
+    @property
+    def active(self):
+        """Names of rules currently matching"""
+        return tuple(self._active)
+
+    @property
+    def current_alerts(self):
+        """Latest Alert of every rule currently matching, most severe first"""
+        return sorted(self._alerts.values(), key=lambda alert: -SEVERITIES.index(alert.severity))
+
+    def reset(self):
+        self._active.clear()
+        self._alerts.clear()
@@ -0,0 +1,117 @@
+"""
+Sample-to-alert latency of the rule-based alert engine
+
+    python benchmarks/alert_latency.py --samples 100000
+
+Part 1 times AlertEngine.evaluate() on its own. Part 2 runs a
+CoachPipeline with a slow fake LLM and injects a heart rate spike every
+few samples, then compares the time from sample generation to the alert
+callback with the time until the LLM analysis of that sample arrives.
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from alerts import AlertEngine
+from coach_pipeline import CoachPipeline
+from terminal import HealthDataSimulator
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summary(label, seconds):
+    micro = [value * 1e6 for value in seconds]
+    print(f"{label:<28} n={len(micro):<7} mean={statistics.mean(micro):10.1f}us  "
+          f"p50={percentile(micro, 0.5):10.1f}us  p99={percentile(micro, 0.99):10.1f}us")
+
+
+class SpikingSimulator(HealthDataSimulator):
+    """Simulator that forces a critical heart rate every `spike_every` samples"""
+
+    def __init__(self, spike_every=10):
+        super().__init__()
+        self.spike_every = spike_every
+        self.generated_at = {}
+
+    def generate_health_data(self):
+        sample = super().generate_health_data()
+        if self.data_history.total_count % self.spike_every == 0:
+            sample.heart_rate = 185
+        else:
+            sample.heart_rate = min(sample.heart_rate, 150)
+        self.generated_at[id(sample)] = time.perf_counter()
+        return sample
+
+
+def bench_engine(n_samples):
+    simulator = HealthDataSimulator()
+    samples = [simulator.generate_health_data() for _ in range(n_samples)]
+    for i in range(0, n_samples, 7):
+        samples[i].heart_rate = 185
+    # repeat_after=0 so every spiking sample fires
+    engine = AlertEngine(repeat_after=0)
+
+    timings = []
+    for sample in samples:
+        started = time.perf_counter()
+        engine.evaluate(sample)
+        timings.append(time.perf_counter() - started)
+    summary("AlertEngine.evaluate", timings)
+    print(f"{'alerts fired':<28} {engine.stats['alerts']}")
+
+
+async def fake_llm(prompt, delay):
+    await asyncio.sleep(delay)
+    return "analysis"
+
+
+def bench_pipeline(duration, sample_interval, llm_delay):
+    simulator = SpikingSimulator()
+    alert_latency = []
+    analysis_latency = []
+
+    def on_alert(sample, alert):
+        alert_latency.append(time.perf_counter() - simulator.generated_at[id(sample)])
+
+    def on_analysis(sample, analysis):
+        if sample.heart_rate > 180:
+            analysis_latency.append(time.perf_counter() - simulator.generated_at[id(sample)])
+
+    pipeline = CoachPipeline(
+        simulator,
+        sample_interval=sample_interval,
+        analysis_interval=3600,
+        stale_after=None,
+        on_alert=on_alert,
+        on_analysis=on_analysis,
+        llm=lambda prompt: fake_llm(prompt, llm_delay),
+        alerts=AlertEngine(repeat_after=0),
+    )
+    asyncio.run(pipeline.run(duration=duration))
+    summary("sample -> alert callback", alert_latency)
+    if analysis_latency:
+        summary("sample -> LLM analysis", analysis_latency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Alert engine latency benchmark')
+    parser.add_argument('--samples', type=int, default=100_000, help='Samples for the engine benchmark')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds to run the pipeline benchmark')
+    parser.add_argument('--sample-interval', type=float, default=0.02)
+    parser.add_argument('--llm-delay', type=float, default=2.0, help='Latency of the fake LLM in seconds')
+    args = parser.parse_args()
+
+    bench_engine(args.samples)
+    bench_pipeline(args.duration, args.sample_interval, args.llm_delay)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Benchmark suite for the sample-to-feedback hot path
+
+    python benchmarks/hot_path.py
+    python benchmarks/hot_path.py --quick --compare benchmarks/results/<older>.json
+
+Runs without network: the AI coach is the local stub server from
+llm_stub_server.py with --llm-latency seconds before each reply. Random
+seeds are fixed so every run generates the same samples.
+
+Measured:
+  simulator       HealthDataSimulator.generate_health_data() throughput and p50/p99
+  analysis        analyze_trends() + analyze_health_data() prompt building per sample
+  end_to_end      CoachPipeline sample -> stored -> LLM feedback latency p50/p99
+  memory          traced memory growth over a long session (simulator + CSV writer)
+  storage         samples/sec and bytes/sec written by each storage backend
+
+Results are written as JSON (default benchmarks/results/hot_path-<commit>.json)
+together with the commit and Python version. --compare prints the change
+of every metric against an earlier results file.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from coach_pipeline import CoachPipeline
+from data_storage import create_storage_backend, save_data_to_csv, close_all_writers
+from fetch_llm import analyze_trends, analyze_health_data, configure_llm_client, run_async
+from llm_stub_server import start_stub_server
+from terminal import HealthDataSimulator
+
+# metrics where a larger value is better, used by --compare
+HIGHER_IS_BETTER = ("per_sec",)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def latency_stats(seconds):
+    """mean/p50/p99 in microseconds"""
+    micro = [value * 1e6 for value in seconds]
+    return {
+        "mean_us": statistics.mean(micro),
+        "p50_us": percentile(micro, 0.5),
+        "p99_us": percentile(micro, 0.99),
+    }
+
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def directory_size(path):
+    return sum(file.stat().st_size for file in Path(path).rglob("*") if file.is_file())
+
+
+def bench_simulator(n_samples):
+    simulator = HealthDataSimulator(history_capacity=1000)
+    timings = []
+    started = time.perf_counter()
+    for _ in range(n_samples):
+        sample_started = time.perf_counter()
+        simulator.generate_health_data()
+        timings.append(time.perf_counter() - sample_started)
+    elapsed = time.perf_counter() - started
+    return {"samples": n_samples, "samples_per_sec": n_samples / elapsed, **latency_stats(timings)}
+
+
+def bench_analysis(n_samples):
+    simulator = HealthDataSimulator(history_capacity=1000)
+    samples = [simulator.generate_health_data() for _ in range(n_samples)]
+    # rebuild the trends sample by sample, as the pipeline does
+    simulator = HealthDataSimulator(history_capacity=1000)
+    timings = []
+    started = time.perf_counter()
+    for sample in samples:
+        simulator.trend_tracker.update(sample)
+        prompt_started = time.perf_counter()
+        trends = analyze_trends(simulator.trend_tracker)
+        analyze_health_data(sample, None, trends=trends)
+        timings.append(time.perf_counter() - prompt_started)
+    elapsed = time.perf_counter() - started
+    return {"samples": n_samples, "prompts_per_sec": n_samples / elapsed, **latency_stats(timings)}
+
+
+class TimedSimulator(HealthDataSimulator):
+    """Remembers when each sample was generated"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.generated_at = {}
+
+    def generate_health_data(self):
+        sample = super().generate_health_data()
+        self.generated_at[id(sample)] = time.perf_counter()
+        return sample
+
+
+def bench_end_to_end(duration, sample_interval, analysis_interval, directory):
+    simulator = TimedSimulator(history_capacity=1000)
+    writer = create_storage_backend("csv", csv_path=os.path.join(directory, "end_to_end.csv"),
+                                    flush_interval=None, max_size_mb=None)
+    feedback_latency = []
+
+    def on_analysis(sample, analysis):
+        feedback_latency.append(time.perf_counter() - simulator.generated_at.pop(id(sample)))
+
+    pipeline = CoachPipeline(
+        simulator,
+        writer=writer,
+        sample_interval=sample_interval,
+        analysis_interval=analysis_interval,
+        stale_after=None,
+        on_analysis=on_analysis,
+    )
+    started = time.perf_counter()
+    run_async(pipeline.run(duration=duration))
+    elapsed = time.perf_counter() - started
+    writer.close()
+
+    stats = pipeline.metrics()
+    result = {
+        "samples": stats["samples"],
+        "samples_per_sec": stats["samples"] / elapsed,
+        "analyses": stats["completed"],
+        "dropped": stats["dropped"],
+        "errors": stats["errors"],
+    }
+    if feedback_latency:
+        result.update({f"feedback_{key}": value for key, value in latency_stats(feedback_latency).items()})
+    return result
+
+
+def bench_memory(n_samples, directory, checkpoints=10):
+    """Traced memory after each tenth of the session; growth is end minus the first checkpoint"""
+    simulator = HealthDataSimulator(history_capacity=1000)
+    writer = create_storage_backend("csv", csv_path=os.path.join(directory, "memory.csv"),
+                                    flush_interval=None, max_size_mb=None)
+    step = max(1, n_samples // checkpoints)
+    readings = []
+    tracemalloc.start()
+    try:
+        for i in range(1, n_samples + 1):
+            writer.write(simulator.generate_health_data())
+            if i % step == 0:
+                readings.append(tracemalloc.get_traced_memory()[0])
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        writer.close()
+    growth = readings[-1] - readings[0]
+    return {
+        "samples": n_samples,
+        "first_checkpoint_bytes": readings[0],
+        "final_bytes": readings[-1],
+        "peak_bytes": peak,
+        "growth_bytes": growth,
+        "growth_bytes_per_1k_samples": growth / max(1, n_samples - step) * 1000,
+    }
+
+
+def _write_samples(write, samples):
+    started = time.perf_counter()
+    for sample in samples:
+        write(sample)
+    return started
+
+
+def bench_storage(n_samples, directory):
+    simulator = HealthDataSimulator(history_capacity=1000)
+    samples = [simulator.generate_health_data() for _ in range(n_samples)]
+    results = {}
+
+    backends = {
+        "csv": lambda path: create_storage_backend("csv", csv_path=os.path.join(path, "data.csv"),
+                                                   flush_interval=None, max_size_mb=None),
+        "parquet": lambda path: create_storage_backend("parquet", root_dir=path, session_id="bench",
+                                                       flush_interval=None),
+    }
+    for name, create in backends.items():
+        path = os.path.join(directory, f"storage_{name}")
+        os.makedirs(path)
+        writer = create(path)
+        started = _write_samples(writer.write, samples)
+        writer.close()
+        elapsed = time.perf_counter() - started
+        size = directory_size(path)
+        results[name] = {"samples_per_sec": n_samples / elapsed, "bytes": size,
+                         "bytes_per_sec": size / elapsed}
+
+    # the legacy helper goes through the shared per-path writer
+    path = os.path.join(directory, "storage_save_data_to_csv")
+    os.makedirs(path)
+    csv_path = os.path.join(path, "data.csv")
+    started = _write_samples(lambda sample: save_data_to_csv(sample, csv_path, max_size_mb=None), samples)
+    close_all_writers()
+    elapsed = time.perf_counter() - started
+    size = directory_size(path)
+    results["save_data_to_csv"] = {"samples_per_sec": n_samples / elapsed, "bytes": size,
+                                   "bytes_per_sec": size / elapsed}
+    return results
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nChange against {baseline_path} (commit {baseline['meta']['commit']}):")
+    old = flatten(baseline["results"])
+    for name, value in flatten(results["results"]).items():
+        if name not in old or not old[name]:
+            continue
+        change = (value - old[name]) / abs(old[name]) * 100
+        better = change > 0 if any(tag in name for tag in HIGHER_IS_BETTER) else change < 0
+        marker = "" if abs(change) < 5 else (" (better)" if better else " (worse)")
+        print(f"  {name:<48} {old[name]:>14.1f} -> {value:>14.1f}  {change:+7.1f}%{marker}")
+
+
+def print_results(results):
+    for section, values in results["results"].items():
+        print(f"\n[{section}]")
+        for name, value in flatten(values).items():
+            print(f"  {name:<40} {value:>16.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sample-to-feedback hot path benchmarks')
+    parser.add_argument('--samples', type=int, default=20_000, help='Samples for the simulator, analysis and storage benchmarks')
+    parser.add_argument('--memory-samples', type=int, default=100_000, help='Samples in the long session memory benchmark')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run the end-to-end pipeline')
+    parser.add_argument('--sample-interval', type=float, default=0.01)
+    parser.add_argument('--analysis-interval', type=float, default=0.5)
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='Stub LLM seconds before each reply')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--quick', action='store_true', help='Smaller sizes for a fast smoke run')
+    parser.add_argument('--output', type=str, default=None, help='JSON results file (default benchmarks/results/hot_path-<commit>.json)')
+    parser.add_argument('--compare', type=str, default=None, help='Earlier JSON results file to compare with')
+    args = parser.parse_args()
+    if args.quick:
+        args.samples, args.memory_samples, args.duration = 2_000, 10_000, 3.0
+
+    server, base_url = start_stub_server(latency=args.llm_latency)
+    configure_llm_client(base_url=base_url)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        seed_everything(args.seed)
+        results["simulator"] = bench_simulator(args.samples)
+        seed_everything(args.seed)
+        results["analysis"] = bench_analysis(args.samples)
+        seed_everything(args.seed)
+        results["end_to_end"] = bench_end_to_end(args.duration, args.sample_interval,
+                                                 args.analysis_interval, directory)
+        seed_everything(args.seed)
+        results["memory"] = bench_memory(args.memory_samples, directory)
+        seed_everything(args.seed)
+        results["storage"] = bench_storage(args.samples, directory)
+    server.shutdown()
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    print_results(report)
+
+    output = args.output or str(ROOT / "benchmarks" / "results" / f"hot_path-{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Throughput benchmark for the ingestion server
+
+    python benchmarks/ingest_throughput.py
+    python benchmarks/ingest_throughput.py --athletes 1000 --batch 100 --storage parquet
+
+Starts an IngestServer on a free TCP port in this process and a load
+generator in a second process, which streams pre-encoded packet arrays
+(newline-delimited JSON) as fast as the socket accepts them. The AI coach
+is the local stub server from llm_stub_server.py, so no network is needed.
+
+Reports samples/sec accepted by the server, samples/sec processed by the
+per-athlete pipelines, buffer depth and how many samples the overflow
+policy dropped or coalesced. Results are written as JSON like hot_path.py.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fetch_llm import configure_llm_client, run_async
+from ingest_server import IngestServer, OVERFLOW_POLICIES
+from llm_stub_server import start_stub_server
+from hot_path import git_commit
+
+
+def make_payloads(athletes, batch, count, seed):
+    """`count` newline-terminated JSON arrays of `batch` packets each"""
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(count):
+        packets = []
+        for j in range(batch):
+            athlete = (i * batch + j) % athletes
+            packets.append({
+                "athlete": f"athlete-{athlete}",
+                "timestamp": "2025-01-01 10:00:00",
+                "heart_rate": rng.randint(120, 175),
+                "blood_pressure_systolic": rng.randint(110, 150),
+                "blood_pressure_diastolic": rng.randint(70, 95),
+                "blood_oxygen": rng.randint(94, 100),
+                "pace": round(rng.uniform(4.5, 7.0), 2),
+                "stride": round(rng.uniform(0.9, 1.3), 2),
+                "cadence": rng.randint(150, 185),
+                "duration": i,
+                "distance": round(i * 0.003, 3),
+                "calories": i,
+                "altitude": 40,
+                "temperature": 20,
+                "pressure": 1012,
+                "humidity": 55,
+            })
+        payloads.append(json.dumps(packets, separators=(",", ":")).encode() + b"\n")
+    return payloads
+
+
+def generate_load(port, athletes, batch, duration, seed, ready):
+    """Load generator process: send the payloads in a loop for `duration` seconds"""
+    payloads = make_payloads(athletes, batch, 64, seed)
+    ready.wait()
+    sent = 0
+    with socket.create_connection(("127.0.0.1", port)) as connection:
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            for payload in payloads:
+                connection.sendall(payload)
+            sent += len(payloads) * batch
+    return sent
+
+
+async def run_benchmark(args, directory):
+    server = IngestServer(tcp_port=0, http_port=None, queue_size=args.queue_size,
+                          policy=args.policy, storage=args.storage)
+    if args.storage is not None:
+        os.chdir(directory)    # storage paths are relative to the working directory
+    await server.start()
+
+    ready = multiprocessing.Event()
+    generator = multiprocessing.Process(
+        target=generate_load,
+        args=(server.ports["tcp"], args.athletes, args.batch, args.duration, args.seed, ready),
+        daemon=True,
+    )
+    generator.start()
+    server.metrics()
+    ready.set()
+    started = time.monotonic()
+
+    rates = []
+    while generator.is_alive() or time.monotonic() - started < args.duration:
+        await asyncio.sleep(1.0)
+        metrics = server.metrics()
+        rates.append(metrics["ingest_rate"])
+        print(f"  {metrics['ingest_rate']:>10.0f} samples/s  athletes={metrics['athletes']}"
+              f"  queue={metrics['queue_depth']} (max {metrics['max_queue_depth']})"
+              f"  dropped={metrics['dropped']}  coalesced={metrics['coalesced']}", flush=True)
+        if not generator.is_alive():
+            break
+    elapsed = time.monotonic() - started
+    generator.join()
+
+    metrics = server.metrics()
+    drain_started = time.monotonic()
+    await server.close()
+    drain = time.monotonic() - drain_started
+    final = server.metrics()
+    return {
+        "samples": final["samples"],
+        "samples_per_sec": final["samples"] / elapsed,
+        "peak_samples_per_sec": max(rates, default=0.0),
+        "processed": final["processed"],
+        "processed_per_sec": metrics["processed"] / elapsed,
+        "athletes": final["athletes"],
+        "max_queue_depth_at_end": metrics["max_queue_depth"],
+        "dropped": final["dropped"],
+        "coalesced": final["coalesced"],
+        "decode_errors": final["decode_errors"],
+        "analyses": final["analyses"],
+        "drain_seconds": drain,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingestion server throughput benchmark')
+    parser.add_argument('--athletes', type=int, default=100)
+    parser.add_argument('--batch', type=int, default=50, help='Packets per JSON array sent')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load')
+    parser.add_argument('--queue-size', type=int, default=64)
+    parser.add_argument('--policy', type=str, default='drop_oldest', choices=OVERFLOW_POLICIES)
+    parser.add_argument('--storage', type=str, default=None, choices=['parquet', 'csv'],
+                        help='Store every sample (default: no storage)')
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='Stub LLM seconds before each reply')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None,
+                        help='JSON results file (default benchmarks/results/ingest-<commit>.json)')
+    args = parser.parse_args()
+
+    stub, base_url = start_stub_server(latency=args.llm_latency)
+    configure_llm_client(base_url=base_url)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            results = run_async(run_benchmark(args, directory))
+        finally:
+            os.chdir(cwd)
+    stub.shutdown()
+
+    for name, value in results.items():
+        print(f"  {name:<32} {value:>14.1f}")
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": {"ingest": results},
+    }
+    output = args.output or str(ROOT / "benchmarks" / "results" / f"ingest-{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
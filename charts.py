@@ -0,0 +1,169 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# panel title -> fields plotted in it (same layout as the old 3x2 Plotly figure)
+CHART_PANELS = (
+    ("Vital Signs", ("heart_rate", "blood_oxygen")),
+    ("Blood Pressure", ("blood_pressure_systolic", "blood_pressure_diastolic")),
+    ("Performance", ("pace",)),
+    ("Progress", ("distance",)),
+    ("Environment", ("temperature",)),
+    ("Status", ("humidity",)),
+)
+
+
+def lttb_indices(y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling of an evenly spaced series
+
+    Keeps the first and last point and, from each of threshold - 2
+    buckets in between, the point forming the largest triangle with the
+    previously kept point and the mean of the next bucket. Peaks survive,
+    unlike with plain striding.
+
+    Returns: sorted indices of the kept points
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        mean_x = (next_start + next_end - 1) / 2
+        mean_y = y[next_start:next_end].mean() if next_end > next_start else y[-1]
+        x = np.arange(start, end)
+        areas = np.abs((a - mean_x) * (y[start:end] - y[a]) - (a - x) * (mean_y - y[a]))
+        a = start + int(np.argmax(areas))
+        kept[i + 1] = a
+    return kept
+
+
+def history_frame(history, fields, last=None, start=None, max_points=None):
+    """
+    DataFrame of some history fields indexed by sample number
+
+    parameters:
+        history (HistoryBuffer): sample source
+        fields (tuple): columns to include
+        last (int): only the newest `last` samples
+        start (int): only samples numbered start and later
+        max_points (int): LTTB-downsample to at most this many rows; every field
+            keeps its own share of the points, so a spike in any of them survives
+    """
+    total, columns = history.snapshot(fields, last=last, start=start)
+    count = len(columns[fields[0]])
+    index = np.arange(total - count, total)
+    if max_points is not None and count > max_points:
+        per_field = max(3, max_points // len(fields))
+        keep = np.unique(np.concatenate([lttb_indices(columns[field], per_field) for field in fields]))
+        index = index[keep]
+        data = {field: columns[field][keep] for field in fields}
+    else:
+        data = {field: columns[field] for field in fields}
+    return pd.DataFrame(data, index=pd.Index(index, name="sample"))
+
+
+class IncrementalChart:
+    """
+    Keeps a chart element in sync with a HistoryBuffer
+
+    The first update draws the whole (LTTB-downsampled) history. Later
+    updates only send the samples appended since then through the
+    element's add_rows(), and nothing at all when there are none. Once
+    the chart holds `max_points` * 2 rows, or samples it has not shown
+    yet were overwritten, it is redrawn from scratch, downsampled back to
+    `max_points`, so the number of points in the browser stays bounded.
+
+    In Streamlit the placeholder must be created outside the fragment
+    calling update(), otherwise every fragment rerun clears the chart.
+
+    parameters:
+        placeholder: Streamlit placeholder the chart is drawn into
+        fields (tuple): history fields plotted in this chart
+        max_points (int): points kept after a full redraw
+        draw (callable): (placeholder, frame) -> element supporting add_rows
+        full_frame (callable): () -> downsampled frame for redraws, e.g. from
+            SharedChartFrames.frame; defaults to history_frame
+    """
+
+    def __init__(self, placeholder, fields, max_points=500, draw=None, full_frame=None):
+        self.placeholder = placeholder
+        self.fields = fields
+        self.max_points = max_points
+        self.draw = draw or (lambda placeholder, frame: placeholder.line_chart(frame))
+        self.full_frame = full_frame
+        self.element = None
+        self.sent_until = None     # number of the first sample not sent yet
+        self.rows = 0
+        self.stats = {"redraws": 0, "appends": 0, "points_sent": 0}
+
+    def update(self, history):
+        if history.total_count == self.sent_until:
+            return
+        redraw = self.element is None
+        if not redraw:
+            frame = history_frame(history, self.fields, start=self.sent_until)
+            if not len(frame):
+                return
+            redraw = frame.index[0] != self.sent_until or self.rows + len(frame) > 2 * self.max_points
+        if redraw:
+            if self.full_frame is not None:
+                frame = self.full_frame()
+            else:
+                frame = history_frame(history, self.fields, max_points=self.max_points)
+            if frame is None or not len(frame):
+                return
+            self.element = self.draw(self.placeholder, frame)
+            self.rows = len(frame)
+            self.stats["redraws"] += 1
+        else:
+            self.element.add_rows(frame)
+            self.rows += len(frame)
+            self.stats["appends"] += 1
+        self.stats["points_sent"] += len(frame) * len(self.fields)
+        self.sent_until = int(frame.index[-1]) + 1
+
+
+class SharedChartFrames:
+    """
+    Downsampled chart frames shared by every viewer of one history
+
+    The frames are rebuilt at most once per new sample, however many
+    browser tabs ask for them, and each holds at most `max_points` rows.
+
+    parameters:
+        history (HistoryBuffer): sample source
+        panels (tuple): (title, fields) pairs, see CHART_PANELS
+        max_points (int): LTTB-downsample each frame to this many rows
+    """
+
+    def __init__(self, history, panels=CHART_PANELS, max_points=500):
+        self.history = history
+        self.panels = panels
+        self.max_points = max_points
+        self._lock = threading.Lock()
+        self._total = None
+        self._frames = []
+
+    def frames(self):
+        """Returns: list of (title, DataFrame), empty until the first sample"""
+        with self._lock:
+            total = self.history.total_count
+            if total != self._total:
+                self._frames = [(title, history_frame(self.history, fields, max_points=self.max_points))
+                                for title, fields in self.panels] if total else []
+                self._total = total
+            return self._frames
+
+    def frame(self, title):
+        """The current frame of one panel, None before the first sample"""
+        return dict(self.frames()).get(title)
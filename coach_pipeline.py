@@ -0,0 +1,357 @@
+import asyncio
+import threading
+import time
+from contextlib import suppress
+
+from fetch_llm import analyze_health_data, get_llm_response_async, run_async, stream_llm_response_async
+
+
+class CoachPipeline:
+    """
+    Asyncio pipeline that keeps sampling independent of LLM analysis
+
+    The sampler generates a sample every `sample_interval` seconds on a
+    fixed schedule, stores it and hands it to `on_sample`. Every
+    `analysis_interval` seconds (or whenever `trigger` says so) it puts a
+    snapshot (sample + trends) into a bounded queue. When the queue is
+    full the oldest snapshot is dropped, so the analyzer always works on
+    recent data.
+
+    The analyzer runs one LLM request at a time. Once a newer snapshot is
+    queued, the request in flight gets until it is `stale_after` seconds
+    old; then it is cancelled and the newest snapshot is analyzed instead.
+
+    With an `alerts` engine every sample is checked against its rule
+    table before anything else happens, new alerts go straight to
+    `on_alert`, and a critical alert also queues an analysis right away
+    so the LLM can explain it.
+
+    If the simulator's generate_health_data() returns None (a finite
+    source such as a replay has run out), run() waits for the queued
+    snapshots to be analyzed, as long as `duration` allows, and returns.
+
+    A push source (see ingest_server.StreamSimulator) provides a
+    coroutine next_sample() instead. The sampler then awaits each sample
+    as it arrives and `sample_interval` is ignored.
+
+    Samples that failed the simulator's validation (its `last_violations`)
+    are still stored and checked for alerts, but never analyzed: they are
+    counted as "invalid" and passed to `on_invalid`.
+
+    With `stream=True` the reply is read as a stream of deltas: each one
+    is passed to `on_delta` and accumulated in `partial_analysis`, and the
+    time to first token and decode rate are recorded in the stats.
+
+    parameters:
+        simulator (HealthDataSimulator): sample source
+        writer (StorageBackend): where samples are stored, None to skip
+        sample_interval (float): seconds between samples
+        analysis_interval (float): seconds between analysis snapshots
+        queue_size (int): max snapshots waiting for analysis
+        stale_after (float): cancel an in-flight request older than this
+            once a newer snapshot is waiting (None never cancels)
+        on_sample (callable): called with each sample
+        on_analysis (callable): called with (sample, analysis) when a reply arrives
+        llm (coroutine function): prompt -> reply, defaults to get_llm_response_async
+        cache (CoachResponseCache): reuse analyses for near-identical inputs, None to disable
+        trigger (TriggerPolicy): decides per sample whether to analyze; replaces
+            the fixed `analysis_interval` schedule when set
+        stream (bool): stream the reply instead of waiting for all of it
+        on_delta (callable): called with (sample, delta) for each streamed delta
+        llm_stream (async generator function): prompt -> deltas, defaults to
+            stream_llm_response_async
+        alerts (AlertEngine): rule-based safety alerts, None to disable
+        on_alert (callable): called with (sample, alert) for each new alert
+        on_invalid (callable): called with (sample, violations) for each invalid sample
+        profile (bool): record per-stage timings in `timings`
+    """
+
+    def __init__(self, simulator, writer=None, sample_interval=1.0,
+                 analysis_interval=10.0, queue_size=1, stale_after=20.0,
+                 on_sample=None, on_analysis=None, llm=get_llm_response_async,
+                 cache=None, trigger=None, stream=False, on_delta=None,
+                 llm_stream=stream_llm_response_async, alerts=None, on_alert=None,
+                 on_invalid=None, profile=False):
+        self.simulator = simulator
+        self.writer = writer
+        self.sample_interval = sample_interval
+        self.analysis_interval = analysis_interval
+        self.queue_size = queue_size
+        self.stale_after = stale_after
+        self.on_sample = on_sample
+        self.on_analysis = on_analysis
+        self.llm = llm
+        self.cache = cache
+        self.trigger = trigger
+        self.stream = stream
+        self.on_delta = on_delta
+        self.llm_stream = llm_stream
+        self.alerts = alerts
+        self.on_alert = on_alert
+        self.on_invalid = on_invalid
+
+        self.latest_sample = None
+        self.latest_analysis = None
+        self.latest_analysis_sample = None
+        self.partial_analysis = None     # text received so far while streaming
+        self.streaming_sample = None
+        self.latest_alerts = []
+        # stage -> [count, total seconds, max seconds]
+        self.timings = {} if profile else None
+
+        self.stats = {
+            "samples": 0,
+            "snapshots": 0,
+            "dropped": 0,      # snapshots pushed out of a full queue
+            "cancelled": 0,    # stale in-flight requests
+            "completed": 0,
+            "errors": 0,
+            "invalid": 0,      # samples kept away from the LLM by validation
+            "max_queue_depth": 0,
+            "last_latency": None,
+            "last_ttft": None,
+            "last_tokens_per_sec": None,
+            "last_chunks_per_sec": None,   # when the server reported no token usage
+        }
+
+        self._queue = None
+        self._loop = None
+        self._stop_event = None
+        self._snapshot_ready = None
+        self._inflight = None
+        self._started = threading.Event()
+        self._thread = None
+        # push sources hand samples over as they arrive instead of on a schedule
+        self._push_source = asyncio.iscoroutinefunction(getattr(simulator, "next_sample", None))
+
+    def metrics(self):
+        """Copy of the counters plus the current queue depth"""
+        stats = dict(self.stats)
+        stats["queue_depth"] = self._queue.qsize() if self._queue is not None else 0
+        if self.trigger is not None:
+            stats["llm_calls_issued"] = self.trigger.stats["issued"]
+            stats["llm_calls_skipped"] = self.trigger.stats["skipped"]
+        return stats
+
+    def _time_stage(self, stage, started):
+        if self.timings is None:
+            return
+        elapsed = time.perf_counter() - started
+        timing = self.timings.setdefault(stage, [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += elapsed
+        timing[2] = max(timing[2], elapsed)
+
+    def _enqueue(self, snapshot):
+        if self._queue.full():
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self.stats["dropped"] += 1
+        self._queue.put_nowait(snapshot)
+        self.stats["snapshots"] += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self._queue.qsize())
+        self._snapshot_ready.set()
+
+    async def _sampler(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        next_analysis = next_tick
+        while not self._stop_event.is_set():
+            if self._push_source:
+                # waits until the next sample arrives
+                sample = await self.simulator.next_sample()
+                started = time.perf_counter()
+            else:
+                started = time.perf_counter()
+                sample = self.simulator.generate_health_data()
+            if sample is None:
+                # finite source exhausted
+                break
+            self._time_stage("generate", started)
+
+            # safety alerts first, they must not wait for storage or the LLM
+            urgent = False
+            if self.alerts is not None:
+                started = time.perf_counter()
+                new_alerts = self.alerts.evaluate(sample)
+                if new_alerts or len(self.latest_alerts) != len(self.alerts.active):
+                    # alerts still matching; cleared once the vitals recover
+                    self.latest_alerts = self.alerts.current_alerts
+                if new_alerts:
+                    urgent = any(alert.severity == "critical" for alert in new_alerts)
+                    if self.on_alert is not None:
+                        for alert in new_alerts:
+                            self.on_alert(sample, alert)
+                self._time_stage("alerts", started)
+            self.latest_sample = sample
+            self.stats["samples"] += 1
+            if self.writer is not None:
+                started = time.perf_counter()
+                self.writer.write(sample)
+                self._time_stage("storage", started)
+            if self.on_sample is not None:
+                self.on_sample(sample)
+
+            violations = self.simulator.last_violations
+            if violations:
+                self.stats["invalid"] += 1
+                if self.on_invalid is not None:
+                    self.on_invalid(sample, violations)
+            else:
+                started = time.perf_counter()
+                trends = self.simulator.trend_tracker.trends()
+                if self.trigger is not None:
+                    should_analyze, _ = self.trigger.evaluate(sample, trends)
+                else:
+                    should_analyze = loop.time() >= next_analysis
+                    if should_analyze:
+                        next_analysis += self.analysis_interval
+                if should_analyze or urgent:
+                    self._enqueue((sample, trends))
+                self._time_stage("trigger", started)
+
+            if self._push_source:
+                # paced by the arriving samples, just let other tasks run
+                await asyncio.sleep(0)
+                continue
+            # fixed cadence: schedule against the clock, not against the last sleep
+            next_tick += self.sample_interval
+            delay = next_tick - loop.time()
+            if delay > 0:
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._stop_event.wait(), delay)
+            else:
+                # behind schedule (or unthrottled): just let other tasks run
+                await asyncio.sleep(0)
+
+    async def _stream_reply(self, sample, prompt):
+        metrics = {}
+        parts = []
+        self.streaming_sample = sample
+        self.partial_analysis = ""
+        try:
+            async for delta in self.llm_stream(prompt, metrics=metrics):
+                parts.append(delta)
+                self.partial_analysis += delta
+                if self.on_delta is not None:
+                    self.on_delta(sample, delta)
+        finally:
+            self.streaming_sample = None
+        self.stats["last_ttft"] = metrics.get("ttft")
+        self.stats["last_tokens_per_sec"] = metrics.get("tokens_per_sec")
+        self.stats["last_chunks_per_sec"] = metrics.get("chunks_per_sec")
+        return "".join(parts)
+
+    async def _analyze(self, snapshot):
+        sample, trends = snapshot
+        started = time.perf_counter()
+        prompt = analyze_health_data(sample, None, trends=trends)
+        if self.stream:
+            compute = lambda: self._stream_reply(sample, prompt)
+        else:
+            compute = lambda: self.llm(prompt)
+        try:
+            if self.cache is not None:
+                analysis = await self.cache.get_or_compute_async(sample, trends, compute)
+            else:
+                analysis = await compute()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["errors"] += 1
+            analysis = f"AI Coach unavailable: {e}"
+        else:
+            self.stats["completed"] += 1
+            self.stats["last_latency"] = time.perf_counter() - started
+            self._time_stage("analysis", started)
+
+        self.latest_analysis = analysis
+        self.latest_analysis_sample = sample
+        if self.on_analysis is not None:
+            self.on_analysis(sample, analysis)
+
+    async def _analyzer(self):
+        loop = asyncio.get_running_loop()
+        while not self._stop_event.is_set():
+            snapshot = await self._queue.get()
+            started = loop.time()
+            task = self._inflight = asyncio.create_task(self._analyze(snapshot))
+            while True:
+                if self.stale_after is not None and not self._queue.empty():
+                    # a newer snapshot is waiting, drop the request once it goes stale
+                    remaining = self.stale_after - (loop.time() - started)
+                    if remaining > 0:
+                        done, _ = await asyncio.wait({task}, timeout=remaining)
+                        if task in done:
+                            break
+                    task.cancel()
+                    with suppress(asyncio.CancelledError):
+                        await task
+                    self.stats["cancelled"] += 1
+                    break
+                self._snapshot_ready.clear()
+                waiter = asyncio.create_task(self._snapshot_ready.wait())
+                try:
+                    done, _ = await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    waiter.cancel()
+                if task in done:
+                    break
+            self._queue.task_done()
+
+    async def run(self, duration=None):
+        """Run until stop() is called, `duration` seconds have passed or the source runs out"""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._stop_event = asyncio.Event()
+        self._snapshot_ready = asyncio.Event()
+
+        sampler = asyncio.create_task(self._sampler())
+        analyzer = asyncio.create_task(self._analyzer())
+        tasks = [sampler, analyzer]
+        stop_waiter = asyncio.create_task(self._stop_event.wait())
+        self._started.set()
+        started = self._loop.time()
+        try:
+            done, _ = await asyncio.wait({sampler, analyzer, stop_waiter}, timeout=duration,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            # the analyzer only ends before stop() when it failed, re-raise its error
+            if analyzer in done:
+                analyzer.result()
+            if sampler in done and not self._stop_event.is_set():
+                sampler.result()
+                # let the analyzer finish what is still queued, within what is left of `duration`
+                remaining = None if duration is None else duration - (self._loop.time() - started)
+                if remaining is None or remaining > 0:
+                    drained = asyncio.create_task(self._queue.join())
+                    tasks.append(drained)
+                    done, _ = await asyncio.wait({drained, analyzer}, timeout=remaining,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    if analyzer in done:
+                        analyzer.result()
+        finally:
+            stop_waiter.cancel()
+            self._stop_event.set()
+            if self._inflight is not None:
+                tasks.append(self._inflight)
+            for task in tasks:
+                task.cancel()
+            # errors were raised above already, do not let them skip the flush
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.writer is not None:
+                self.writer.flush()
+
+    def stop(self):
+        """Stop the pipeline, safe to call from any thread"""
+        if self._loop is None or self._stop_event is None:
+            return
+        self._loop.call_soon_threadsafe(self._stop_event.set)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def start_in_thread(self):
+        """Run the pipeline on its own event loop in a daemon thread"""
+        self._thread = threading.Thread(target=run_async, args=(self.run(),), daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self._thread
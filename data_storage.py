@@ -1,62 +1,717 @@
 import os
+import io
+import re
 import csv
+import glob
+import gzip
+import shutil
+import atexit
+import logging
+import threading
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as pads
+import pyarrow.parquet as pq
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from datetime import datetime
 from pathlib import Path
+from records import SAMPLE_FIELDS, TIMESTAMP_FORMAT, HealthSample, to_sample_tuple
+import instrumentation
 
-def save_data_to_csv(health_data, csv_path="./data/data.csv"):
+try:
+    import zstandard
+except ImportError:  # optional, only needed for compression="zstd"
+    zstandard = None
+
+FIELDNAMES = list(SAMPLE_FIELDS)
+
+logger = logging.getLogger(__name__)
+
+
+def flatten_health_data(health_data):
+    """Flatten a HealthSample or nested health data dict into a single CSV row"""
+    return HealthSample.from_dict(health_data).to_row()
+
+
+_compressor = None
+_compressor_lock = threading.Lock()
+# rotated segments still waiting for compression, retention leaves them alone
+_pending_segments = set()
+
+
+def _get_compressor():
+    """Single background worker shared by all writers for segment compression"""
+    global _compressor
+    with _compressor_lock:
+        if _compressor is None:
+            _compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="csv-compress")
+        return _compressor
+
+
+def _segment_pattern(csv_path):
+    root, ext = os.path.splitext(os.path.basename(csv_path))
+    return re.compile(rf"{re.escape(root)}-(\d{{8}}-\d{{6}})(?:-(\d+))?{re.escape(ext)}(?:\.gz|\.zst)?")
+
+
+def _segment_order(csv_path):
+    """Sort key (rotation time, sequence number) of a segment path, None for other files"""
+    pattern = _segment_pattern(csv_path)
+
+    def order(path):
+        match = pattern.fullmatch(os.path.basename(path))
+        if match is None:
+            return None
+        return match.group(1), int(match.group(2) or 0)
+    return order
+
+
+def rotate_file(csv_path):
+    """
+    Move the active CSV file aside as a timestamped segment
+
+    ./data/data.csv becomes ./data/data-20240101-120000.csv, a second
+    rotation within the same second ./data/data-20240101-120000-1.csv.
+    The sequence number is always above the ones already on disk, so
+    names sort in rotation order even after retention deleted some.
+
+    Returns: path of the rotated segment, or None if there was nothing to rotate
+    """
+    if not os.path.isfile(csv_path):
+        return None
+    root, ext = os.path.splitext(csv_path)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    order = _segment_order(csv_path)
+    taken = [key[1] for key in map(order, glob.glob(f"{glob.escape(root)}-{stamp}*")) if key is not None]
+    if taken:
+        segment = f"{root}-{stamp}-{max(taken) + 1}{ext}"
+    else:
+        segment = f"{root}-{stamp}{ext}"
+    os.replace(csv_path, segment)
+    return segment
+
+
+def compress_segment(segment, compression="gzip"):
+    """
+    Compress a rotated segment in place and remove the uncompressed file
+
+    Returns: path of the compressed file
+    """
+    if compression == "gzip":
+        target = segment + ".gz"
+        with open(segment, 'rb') as src, gzip.open(target, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+    elif compression == "zstd":
+        target = segment + ".zst"
+        with open(segment, 'rb') as src, open(target, 'wb') as dst:
+            zstandard.ZstdCompressor().copy_stream(src, dst)
+    else:
+        raise ValueError(f"Unknown compression: {compression}")
+    os.remove(segment)
+    return target
+
+
+def list_segments(csv_path):
+    """
+    Return rotated segments of csv_path, oldest first
+
+    Ordered by the rotation time and sequence number in their names, not
+    by mtime, which compression resets.
+    """
+    root, ext = os.path.splitext(csv_path)
+    order = _segment_order(csv_path)
+    segments = [(order(path), path) for path in glob.glob(f"{glob.escape(root)}-*{ext}*")]
+    return [path for key, path in sorted(segment for segment in segments if segment[0] is not None)]
+
+
+def apply_retention(csv_path, max_total_size_mb):
+    """
+    Delete the oldest rotated segments until they fit in max_total_size_mb
+
+    Segments still queued for compression are never deleted.
+
+    Returns: list of deleted segment paths
+    """
+    limit = max_total_size_mb * 1024 * 1024
+    segments = []
+    for path in list_segments(csv_path):
+        try:
+            segments.append((path, os.path.getsize(path)))
+        except FileNotFoundError:
+            pass    # compressed meanwhile
+    total = sum(size for _, size in segments)
+
+    deleted = []
+    for path, size in segments:
+        if total <= limit:
+            break
+        with _compressor_lock:
+            if path in _pending_segments:
+                continue
+        os.remove(path)
+        total -= size
+        deleted.append(path)
+    return deleted
+
+
+def _finish_segment(segment, csv_path, compression, max_total_size_mb):
+    try:
+        if compression:
+            compress_segment(segment, compression)
+    finally:
+        with _compressor_lock:
+            _pending_segments.discard(segment)
+    if max_total_size_mb:
+        apply_retention(csv_path, max_total_size_mb)
+
+
+def _log_segment_failure(future):
+    if future.exception() is not None:
+        logger.error("Finishing a rotated segment failed", exc_info=future.exception())
+
+
+def _submit_segment(segment, csv_path, compression, max_total_size_mb):
+    """Compress and apply retention on the background worker"""
+    with _compressor_lock:
+        _pending_segments.add(segment)
+    future = _get_compressor().submit(_finish_segment, segment, csv_path, compression, max_total_size_mb)
+    future.add_done_callback(_log_segment_failure)
+    return future
+
+
+class StorageBackend:
+    """
+    Base class for buffered health data storage backends
+
+    Records are flattened to SAMPLE_FIELDS tuples and kept in memory, then
+    handed to `_write_batch` either when `batch_size` rows are pending or every
+    `flush_interval` seconds from a background thread. Subclasses
+    implement `_write_batch(rows)` and `_close_output()`; `_write_batch`
+    writes all rows or, when it fails, rolls back what it wrote, so a
+    retried batch is never stored twice.
+
+    With a `validator`, records that break its rules are not stored: they
+    are counted in `rejected` and handed to the `quarantine` backend if
+    there is one, otherwise dropped.
+
+    If writing a batch fails, every row is checked with `_check_row` and
+    the ones the backend cannot store are logged, counted in `failed` and
+    moved to `quarantine` (or dropped) before the rest is written again.
+    A batch that still fails is logged and dropped, so one bad row never
+    keeps the buffer growing.
+
+    parameters:
+        batch_size (int): number of buffered rows that triggers a flush
+        flush_interval (float): max seconds a row may stay buffered
+        validator (Validator): reject invalid records, None to store everything
+        quarantine (StorageBackend): where rejected records go, None to drop them
+    """
+
+    backend = "base"    # label of this backend's storage timings
+
+    def __init__(self, batch_size=32, flush_interval=5.0, validator=None, quarantine=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.validator = validator
+        self.quarantine = quarantine
+        self.rejected = 0
+        self.failed = 0
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self._stop_event = threading.Event()
+        self._thread = None
+        if flush_interval:
+            self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._thread.start()
+
+        # make sure buffered rows reach the disk on interpreter shutdown
+        atexit.register(self.close)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def _write_batch(self, rows):
+        raise NotImplementedError
+
+    def _close_output(self):
+        pass
+
+    def _check_row(self, row):
+        """Raise if this backend cannot store `row`"""
+
+    def _set_aside_bad_rows(self, rows):
+        good = []
+        for row in rows:
+            try:
+                self._check_row(row)
+            except Exception as e:
+                self.failed += 1
+                logger.warning("%s cannot store row %r: %s", type(self).__name__, row, e)
+                if self.quarantine is not None:
+                    self.quarantine.write(HealthSample(*row))
+            else:
+                good.append(row)
+        return good
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        with instrumentation.timer("storage_flush", self.backend):
+            try:
+                self._write_batch(rows)
+            except Exception as e:
+                logger.warning("%s failed to write a batch of %d rows: %s", type(self).__name__, len(rows), e)
+                rows = self._set_aside_bad_rows(rows)
+                if not rows:
+                    return
+                try:
+                    self._write_batch(rows)
+                except Exception:
+                    self.failed += len(rows)
+                    logger.exception("%s dropped %d rows", type(self).__name__, len(rows))
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def write(self, health_data):
+        """Buffer one HealthSample or nested health data dict"""
+        if self.validator is not None and self.validator.validate(health_data):
+            self.rejected += 1
+            if self.quarantine is not None:
+                self.quarantine.write(health_data)
+            return
+        with instrumentation.timer("storage_write", self.backend):
+            row = to_sample_tuple(health_data)
+            with self._lock:
+                if self._closed:
+                    raise ValueError(f"{type(self).__name__} is closed")
+                self._buffer.append(row)
+                if len(self._buffer) >= self.batch_size:
+                    self._flush_locked()
+
+    def flush(self):
+        """Write all buffered rows to disk"""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        """Flush pending rows, stop the flush thread and close the output"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._flush_locked()
+            self._close_output()
+
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CSVWriter(StorageBackend):
+    """
+    Long-lived buffered CSV writer
+
+    The file stays open between batches. The active file is rotated when
+    it grows past `max_size_mb` or when the calendar day changes. Size is
+    tracked with a running byte counter instead of stat calls. Rotated
+    segments are compressed on a background worker and the oldest ones
+    are deleted once all segments together exceed `max_total_size_mb`.
+
+    parameters:
+        csv_path (str): CSV file saving path
+        batch_size (int): number of buffered rows that triggers a flush
+        flush_interval (float): max seconds a row may stay buffered
+        fsync (bool): call os.fsync after every flush
+        max_size_mb (float): rotate once the file reaches this size (None to disable)
+        rotate_daily (bool): rotate when the date changes
+        compression (str): "gzip", "zstd" or None
+        max_total_size_mb (float): disk cap for rotated segments (None to disable)
+        validator, quarantine: see StorageBackend
+    """
+
+    backend = "csv"
+
+    def __init__(self, csv_path="./data/data.csv", batch_size=32,
+                 flush_interval=5.0, fsync=False, max_size_mb=10,
+                 rotate_daily=True, compression="gzip", max_total_size_mb=500,
+                 validator=None, quarantine=None):
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("compression='zstd' requires the zstandard package")
+        if compression not in (None, "gzip", "zstd"):
+            raise ValueError(f"Unknown compression: {compression}")
+
+        self.csv_path = csv_path
+        self.fsync = fsync
+        self.max_size_mb = max_size_mb
+        self.rotate_daily = rotate_daily
+        self.compression = compression
+        self.max_total_size_mb = max_total_size_mb
+
+        self._file = None
+        self._bytes_written = 0
+        self._file_date = None
+
+        super().__init__(batch_size=batch_size, flush_interval=flush_interval,
+                         validator=validator, quarantine=quarantine)
+
+    def _open(self):
+        directory = os.path.dirname(self.csv_path)
+        if directory:
+            Path(directory).mkdir(parents=True, exist_ok=True)
+
+        self._file = open(self.csv_path, mode='ab')
+        # stat once here, afterwards the counter is kept up to date by _write_batch
+        stat = os.fstat(self._file.fileno())
+        self._bytes_written = stat.st_size
+        if stat.st_size:
+            self._file_date = datetime.fromtimestamp(stat.st_mtime).date()
+        else:
+            self._file_date = datetime.now().date()
+
+    def _needs_rotation(self):
+        if self.max_size_mb and self._bytes_written >= self.max_size_mb * 1024 * 1024:
+            return True
+        if self.rotate_daily and self._file_date != datetime.now().date():
+            return True
+        return False
+
+    def _rotate_locked(self):
+        self._file.close()
+        self._file = None
+        segment = rotate_file(self.csv_path)
+        if segment is not None:
+            _submit_segment(segment, self.csv_path, self.compression, self.max_total_size_mb)
+        self._open()
+
+    def _write_batch(self, rows):
+        if self._file is None:
+            self._open()
+        if self._bytes_written and self._needs_rotation():
+            self._rotate_locked()
+
+        text = io.StringIO()
+        writer = csv.writer(text)
+        # every new or rotated file starts with a header
+        if self._bytes_written == 0:
+            writer.writerow(FIELDNAMES)
+        writer.writerows(rows)
+        data = text.getvalue().encode('utf-8')
+
+        try:
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except Exception:
+            # cut off a partly written batch, the next write reopens the file
+            with suppress(Exception):
+                self._file.close()
+            self._file = None
+            with suppress(OSError):
+                os.truncate(self.csv_path, self._bytes_written)
+            raise
+        self._bytes_written += len(data)
+
+    def _close_output(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Arrow types for the flattened CSV schema
+PARQUET_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("s")),
+    ("heart_rate", pa.int16()),
+    ("blood_pressure_systolic", pa.int16()),
+    ("blood_pressure_diastolic", pa.int16()),
+    ("blood_oxygen", pa.float32()),
+    ("pace", pa.float32()),
+    ("stride", pa.float32()),
+    ("cadence", pa.int16()),
+    ("duration", pa.float32()),
+    ("distance", pa.float32()),
+    ("calories", pa.float32()),
+    ("altitude", pa.int16()),
+    ("temperature", pa.float32()),
+    ("pressure", pa.int16()),
+    ("humidity", pa.int16()),
+    ("status", pa.dictionary(pa.int8(), pa.string())),
+])
+
+class ParquetWriter(StorageBackend):
+    """
+    Columnar storage backend writing a Hive-partitioned Parquet dataset
+
+    Every flush converts the buffered rows into one Arrow record batch
+    with typed columns and writes it as a new file under
+
+        <root_dir>/date=YYYY-MM-DD/session=<session_id>/part-00000.parquet
+
+    so readers can prune by date/session and load only the columns they need.
+
+    parameters:
+        root_dir (str): dataset root directory
+        session_id (str): session partition value (defaults to the start time)
+        batch_size (int): number of buffered rows that triggers a flush
+        flush_interval (float): max seconds a row may stay buffered
+        compression (str): Parquet compression codec
+        validator, quarantine: see StorageBackend
+    """
+
+    backend = "parquet"
+
+    def __init__(self, root_dir="./data/parquet", session_id=None,
+                 batch_size=1024, flush_interval=60.0, compression="zstd",
+                 validator=None, quarantine=None):
+        self.root_dir = root_dir
+        self.session_id = session_id or datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.compression = compression
+        self._part = 0
+
+        super().__init__(batch_size=batch_size, flush_interval=flush_interval,
+                         validator=validator, quarantine=quarantine)
+
+    def _to_record_batch(self, rows):
+        columns = list(zip(*rows))
+        arrays = []
+        for field, values in zip(PARQUET_SCHEMA, columns):
+            if field.name == "timestamp":
+                array = pc.strptime(pa.array(values, pa.string()), format=TIMESTAMP_FORMAT, unit="s")
+            elif field.name == "status":
+                array = pa.array(values, pa.string()).dictionary_encode().cast(field.type)
+            else:
+                array = pa.array(values, field.type)
+            arrays.append(array)
+        return pa.RecordBatch.from_arrays(arrays, schema=PARQUET_SCHEMA)
+
+    def _check_row(self, row):
+        self._to_record_batch([row])
+
+    def _write_batch(self, rows):
+        # convert first: a row that does not parse must not leave a directory behind
+        table = pa.Table.from_batches([self._to_record_batch(rows)])
+        # a batch can cross midnight, so split it by date partition,
+        # named after the parsed timestamps rather than the raw strings
+        dates = pc.strftime(table.column("timestamp"), format="%Y-%m-%d")
+        written = []
+        try:
+            for date in pc.unique(dates).to_pylist():
+                directory = os.path.join(self.root_dir, f"date={date}", f"session={self.session_id}")
+                Path(directory).mkdir(parents=True, exist_ok=True)
+                while True:
+                    path = os.path.join(directory, f"part-{self._part:05d}.parquet")
+                    self._part += 1
+                    if not os.path.exists(path):
+                        break
+                written.append(path)
+                pq.write_table(table.filter(pc.equal(dates, date)), path, compression=self.compression)
+        except Exception:
+            # remove the partitions of this batch already written, the whole batch is retried
+            for path in written:
+                with suppress(OSError):
+                    os.remove(path)
+            raise
+
+
+def read_parquet_dataset(root_dir="./data/parquet", columns=None, filters=None):
+    """
+    Load a Parquet dataset written by ParquetWriter into a DataFrame
+
+    parameters:
+        root_dir (str): dataset root directory
+        columns (list): columns to load, None for all
+        filters (pyarrow.compute.Expression): row filter, e.g. pc.field("date") == "2024-01-01"
+    """
+    dataset = pads.dataset(root_dir, format="parquet", partitioning="hive")
+    return dataset.to_table(columns=columns, filter=filters).to_pandas()
+
+
+def create_storage_backend(kind="csv", **kwargs):
+    """
+    Create a storage backend by name
+
+    parameters:
+        kind (str): "csv" or "parquet"
+        **kwargs: passed to the backend constructor
+    """
+    if kind == "csv":
+        return CSVWriter(**kwargs)
+    if kind == "parquet":
+        return ParquetWriter(**kwargs)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+class CSVTailReader:
+    """
+    Incremental reader for the last rows of a growing CSV file
+
+    The first read seeks backward from the end of the file instead of
+    parsing it from the start. The reader remembers the offset it has
+    consumed, so later reads only look at bytes appended since then. A
+    rotated or truncated file is detected and read from scratch.
+
+    parameters:
+        csv_path (str): CSV file to follow
+        max_rows (int): number of trailing rows to keep
+        block_size (int): bytes read per backward seek
+    """
+
+    def __init__(self, csv_path, max_rows=10, block_size=64 * 1024):
+        self.csv_path = csv_path
+        self.max_rows = max_rows
+        self.block_size = block_size
+        self._reset()
+
+    def _reset(self):
+        self._header = None
+        self._offset = 0
+        self._inode = None
+        self._rows = deque(maxlen=self.max_rows)
+
+    def _read_new_lines(self, file, size):
+        if self._header is None:
+            file.seek(0)
+            header = file.readline()
+            if not header.endswith(b"\n"):
+                return
+            self._header = header.rstrip(b"\r\n")
+            self._offset = len(header)
+
+        # walk backward from the end, but never past what was already consumed
+        start = self._offset
+        pos = size
+        buf = b""
+        while pos > start:
+            step = min(self.block_size, pos - start)
+            pos -= step
+            file.seek(pos)
+            buf = file.read(step) + buf
+            if buf.count(b"\n") > self.max_rows:
+                break
+
+        # ignore a trailing line the writer has not finished yet
+        last_newline = buf.rfind(b"\n")
+        if last_newline == -1:
+            return
+        lines = buf[:last_newline].split(b"\n")
+        if pos > start:
+            # the first line was cut by the backward seek
+            lines = lines[1:]
+        self._rows.extend(line.rstrip(b"\r") for line in lines[-self.max_rows:])
+        self._offset = pos + last_newline + 1
+
+    def read(self):
+        """
+        Return the last `max_rows` rows as a DataFrame
+
+        Returns: pandas.DataFrame (empty if the file does not exist yet)
+        """
+        try:
+            file = open(self.csv_path, 'rb')
+        except FileNotFoundError:
+            self._reset()
+            return pd.DataFrame()
+
+        with file:
+            stat = os.fstat(file.fileno())
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                self._reset()
+                self._inode = stat.st_ino
+            if stat.st_size > self._offset:
+                self._read_new_lines(file, stat.st_size)
+
+        if self._header is None:
+            return pd.DataFrame()
+        text = b"\n".join([self._header, *self._rows]).decode('utf-8')
+        return pd.read_csv(io.StringIO(text))
+
+
+def iter_file_chunks(path, chunk_size=1024 * 1024):
+    """Yield the contents of a file in chunks of chunk_size bytes"""
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def gzip_file_bytes(path, chunk_size=1024 * 1024):
+    """
+    Gzip a file chunk by chunk
+
+    Only the compressed output is held in memory, never the whole source file.
+
+    Returns: bytes
+    """
+    output = io.BytesIO()
+    with gzip.GzipFile(fileobj=output, mode='wb') as compressed:
+        for chunk in iter_file_chunks(path, chunk_size):
+            compressed.write(chunk)
+    return output.getvalue()
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_csv_writer(csv_path="./data/data.csv", **kwargs):
+    """Return the shared CSVWriter for `csv_path`, creating it on first use"""
+    key = os.path.abspath(csv_path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None or writer.closed:
+            writer = CSVWriter(csv_path, **kwargs)
+            _writers[key] = writer
+        return writer
+
+
+def flush_all_writers():
+    """Flush every shared CSVWriter"""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.flush()
+
+
+def close_all_writers():
+    """Flush and close every shared CSVWriter"""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+def save_data_to_csv(health_data, csv_path="./data/data.csv", max_size_mb=10):
     """
     save data into the CSV file
-    
+
+    Rows go through the shared buffered writer for `csv_path`, so the
+    file is not reopened for every record. Call flush_all_writers() when
+    the data has to be visible on disk immediately.
+
     parameters:
         health_data (dict): directory with data
         csv_path (str): CSV file saving path
+        max_size_mb (float): size at which the file is rotated
     """
+    get_csv_writer(csv_path, max_size_mb=max_size_mb).write(health_data)
 
-    directory = os.path.dirname(csv_path)
-    Path(directory).mkdir(parents=True, exist_ok=True)
-    
-    flat_data = {
-        "timestamp": health_data["timestamp"],
-        "heart_rate": health_data["heart_rate"],
-        "blood_pressure_systolic": health_data["blood_pressure"]["systolic"],
-        "blood_pressure_diastolic": health_data["blood_pressure"]["diastolic"],
-        "blood_oxygen": health_data["blood_oxygen"],
-        "pace": health_data["performance"]["pace"],
-        "stride": health_data["performance"]["stride"],
-        "cadence": health_data["performance"]["cadence"],
-        "duration": health_data["performance"]["duration"],
-        "distance": health_data["performance"]["distance"],
-        "calories": health_data["performance"]["calories"],
-        "altitude": health_data["environment"]["altitude"],
-        "temperature": health_data["environment"]["temperature"],
-        "pressure": health_data["environment"]["pressure"],
-        "humidity": health_data["environment"]["humidity"],
-        "status": health_data["status"]
-    }
-
-    
-    def manage_file_rotation(csv_path, max_size_mb=10):
-        # ==========================================================
-        # Add your code here 
-        # Task2 : File Management
-        # Modify your code here to:
-        # - Implement file rotation based on size or date
-        # - Add backup functionality
-        # - Check and manage file size
-        # ==========================================================
-        pass
-
-    # check if the file exists
-    file_exists = os.path.isfile(csv_path)
-    
-    # writr into CSV
-    with open(csv_path, mode='a', newline='') as file:
-        fieldnames = flat_data.keys()
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        
-        if not file_exists:
-            writer.writeheader()
-        
-        writer.writerow(flat_data)
-    
-    return csv_path
\ No newline at end of file
+    return csv_path
@@ -1,141 +1,359 @@
 import os
+import time
+import asyncio
+import weakref
+import threading
+import httpx
 import openai
 from dotenv import load_dotenv
-# Setting the environment variable
-os.environ["SYSTEM_MESSAGE"] = """You are a professional healthcare and sports medicine expert who specializes in real-time exercise monitoring.
-
-Core Guidelines:
-1. Monitor vital signs and performance metrics
-2. Provide instant safety assessments
-3. Give personalized exercise guidance
-4. Use clear, actionable language
-5. Focus on athlete safety and performance
-
-Exercise Reference Ranges:
-• Heart Rate Zones:
-- Zone 1 (50-60%): Warm-up
-- Zone 2 (60-70%): Fat burn
-- Zone 3 (70-80%): Aerobic
-- Zone 4 (80-90%): Anaerobic
-- Zone 5 (90-100%): Maximum
-
-• Blood Pressure Response:
-- Normal exercise increase: +20-40/+10-20 mmHg
-- Warning levels: >180/120 mmHg
-
-• Other Metrics:
-- SpO2: Should stay >95%
-- RPE: 6-20 scale (Borg)
-"""
-
-os.environ["EXERCISE_ANALYSIS_TEMPLATE"] = """
-REAL-TIME EXERCISE DATA:
-Vitals: HR {heart_rate}bpm, BP {systolic}/{diastolic}, SpO2 {blood_oxygen}%
-Performance: {pace} min/km, {distance} km
-
-10-Record Trends:
-❤️ HR: {heart_rate_trend}
-🩺 BP: {blood_pressure_trend}
-🫁 SpO2: {blood_oxygen_trend}
-⚡ Pace: {pace_trend}
-
-Provide a 50-100 word analysis covering:
-1. Safety status & risks
-2. Performance trends
-3. Key recommendations
-
-Focus on critical changes and immediate action items. Be concise and direct.
-"""
-
-# Reading the environment variable
-system_message = os.environ.get("SYSTEM_MESSAGE")
+from trends import TrendTracker
+from prompts import get_system_message, render_analysis_prompt, check_prompt_budget
+import instrumentation
+
+# Loaded once from prompt_templates/, see prompts.py
+system_message = get_system_message()
+
+# Connection settings, read from the environment (or .env) when the client is first created
+DEFAULT_LLM_SETTINGS = {
+    "base_url": "https://api.sambanova.ai/v1",
+    "model": "Meta-Llama-3.1-70B-Instruct",
+    "timeout": 30.0,          # seconds for the whole request
+    "connect_timeout": 5.0,   # seconds to establish a connection
+    "max_retries": 2,         # retries with exponential backoff (handled by the openai client)
+    "max_connections": 20,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry": 60.0,  # seconds an idle connection is kept open
+    "max_prompt_tokens": 0,    # reject prompts over this many tokens, 0 for no limit
+}
+
+_client = None
+_client_settings = None
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_llm_settings(**overrides):
+    """
+    Resolve LLM connection settings
+
+    Each key can be set with an LLM_<KEY> environment variable
+    (e.g. LLM_BASE_URL, LLM_MODEL, LLM_TIMEOUT); keyword overrides win.
+    """
+    load_dotenv()
+    settings = {}
+    for key, default in DEFAULT_LLM_SETTINGS.items():
+        value = os.environ.get(f"LLM_{key.upper()}")
+        if value is None:
+            settings[key] = default
+        elif isinstance(default, str):
+            settings[key] = value
+        else:
+            settings[key] = type(default)(value)
+    settings.update(overrides)
+    return settings
+
+
+def configure_llm_client(**settings):
+    """
+    Replace the shared client with one built from the given settings
+
+    Useful for pointing at a local OpenAI-compatible stub server:
+        configure_llm_client(base_url="http://127.0.0.1:8000/v1")
+    """
+    global _client, _client_settings
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _async_clients.clear()
+        _client_settings = get_llm_settings(**settings)
+
+
+def get_llm_client():
+    """Return the process-wide OpenAI client, creating it on first use"""
+    global _client, _client_settings
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            if _client_settings is None:
+                _client_settings = get_llm_settings()
+            settings = _client_settings
+            # one connection pool shared by every terminal/UI session in this process
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=settings["max_connections"],
+                    max_keepalive_connections=settings["max_keepalive_connections"],
+                    keepalive_expiry=settings["keepalive_expiry"],
+                ),
+                timeout=httpx.Timeout(settings["timeout"], connect=settings["connect_timeout"]),
+            )
+            _client = openai.OpenAI(
+                api_key=os.environ.get("SAMBANOVA_API_KEY") or "EMPTY",
+                base_url=settings["base_url"],
+                max_retries=settings["max_retries"],
+                http_client=http_client,
+            )
+        return _client
+
+
+def _build_async_client(settings):
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings["max_connections"],
+            max_keepalive_connections=settings["max_keepalive_connections"],
+            keepalive_expiry=settings["keepalive_expiry"],
+        ),
+        timeout=httpx.Timeout(settings["timeout"], connect=settings["connect_timeout"]),
+    )
+    return openai.AsyncOpenAI(
+        api_key=os.environ.get("SAMBANOVA_API_KEY") or "EMPTY",
+        base_url=settings["base_url"],
+        max_retries=settings["max_retries"],
+        http_client=http_client,
+    )
+
+
+def get_async_llm_client():
+    """
+    Return the AsyncOpenAI client for the running event loop
+
+    httpx async pools are bound to the loop that created them, so there is
+    one client per event loop. Run loops with run_async (or await
+    close_async_llm_client) so the client is closed with its loop.
+    """
+    global _client_settings
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        with _client_lock:
+            if _client_settings is None:
+                _client_settings = get_llm_settings()
+            client = _build_async_client(_client_settings)
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_llm_client():
+    """Close the AsyncOpenAI client of the running event loop, if it has one"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+def run_async(main):
+    """
+    asyncio.run(main), closing the loop's AsyncOpenAI client before the loop goes away
+
+    Every new event loop gets its own client and connection pool, see
+    get_async_llm_client; without this the pooled connections leak.
+    """
+    async def run():
+        try:
+            return await main
+        finally:
+            await close_async_llm_client()
+    return asyncio.run(run())
+
+
+async def get_llm_response_async(prompt, system_message=system_message):
+    """Async version of get_llm_response"""
+    client = get_async_llm_client()
+    _check_budget(prompt, system_message)
+    started = time.perf_counter()
+
+    try:
+        response = await client.chat.completions.create(
+            model=_client_settings["model"],
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.1,
+            top_p=0.1
+        )
+    except Exception:
+        instrumentation.record_llm_call(time.perf_counter() - started, outcome="error")
+        raise
+    _record_response_metrics(response, started)
+
+    return response.choices[0].message.content
+
 
 def get_llm_response(prompt, system_message=system_message):
     """Get LLM model response"""
-    load_dotenv()
-    api_key = os.environ.get("SAMBANOVA_API_KEY")
+    client = get_llm_client()
+    _check_budget(prompt, system_message)
+    started = time.perf_counter()
     
-    client = openai.OpenAI(
-        api_key=api_key,
-        base_url="https://api.sambanova.ai/v1",
-    )
+    try:
+        response = client.chat.completions.create(
+            model=_client_settings["model"],
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.1,
+            top_p=0.1
+        )
+    except Exception:
+        instrumentation.record_llm_call(time.perf_counter() - started, outcome="error")
+        raise
+    _record_response_metrics(response, started)
     
-    response = client.chat.completions.create(
-        model="Meta-Llama-3.1-70B-Instruct",
+    return response.choices[0].message.content
+
+def _check_budget(prompt, system_message):
+    limit = _client_settings["max_prompt_tokens"]
+    if limit:
+        check_prompt_budget(prompt, limit, system_message)
+
+
+def _record_response_metrics(response, started):
+    usage = getattr(response, "usage", None)
+    instrumentation.record_llm_call(time.perf_counter() - started,
+                                    tokens=usage.completion_tokens if usage is not None else None)
+
+
+def _record_stream_metrics(metrics, started, first_token, tokens, chunks, outcome="ok"):
+    finished = time.perf_counter()
+    ttft = first_token - started if first_token is not None else None
+    instrumentation.record_llm_call(finished - started, ttft=ttft, tokens=tokens, outcome=outcome)
+    if metrics is None:
+        return
+    metrics["ttft"] = ttft
+    metrics["duration"] = finished - started
+    metrics["tokens"] = tokens
+    metrics["chunks"] = chunks
+    # decode rate after the first token, the part the reader actually watches
+    generating = finished - first_token if first_token is not None else 0.0
+    # without a usage count only the chunks are known, and one chunk may hold several tokens
+    metrics["tokens_per_sec"] = _decode_rate(tokens, generating)
+    metrics["chunks_per_sec"] = _decode_rate(chunks, generating) if tokens is None else None
+
+
+def _decode_rate(count, seconds):
+    return (count - 1) / seconds if count is not None and count > 1 and seconds > 0 else None
+
+
+def _chunk_text(chunk):
+    if not chunk.choices:
+        return None
+    return chunk.choices[0].delta.content
+
+
+def stream_llm_response(prompt, system_message=system_message, metrics=None):
+    """
+    Stream the LLM response as text deltas
+
+    parameters:
+        metrics (dict): if given, filled with ttft, duration, tokens, chunks and
+            the decode rate once the stream ends. tokens and tokens_per_sec come
+            from the usage count the server reports at the end of the stream;
+            servers that send none leave them None and set chunks_per_sec instead.
+    """
+    client = get_llm_client()
+    _check_budget(prompt, system_message)
+    started = time.perf_counter()
+    first_token = None
+    chunks = 0
+    usage_tokens = None
+    outcome = "incomplete"   # stream stopped early by an error or the consumer
+
+    stream = client.chat.completions.create(
+        model=_client_settings["model"],
         messages=[
             {"role": "system", "content": system_message},
             {"role": "user", "content": prompt}
         ],
         temperature=0.1,
-        top_p=0.1
+        top_p=0.1,
+        stream=True,
+        stream_options={"include_usage": True}
     )
-    
-    return response.choices[0].message.content
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage_tokens = chunk.usage.completion_tokens
+            text = _chunk_text(chunk)
+            if text:
+                if first_token is None:
+                    first_token = time.perf_counter()
+                chunks += 1
+                yield text
+        outcome = "ok"
+    finally:
+        stream.close()
+        _record_stream_metrics(metrics, started, first_token, usage_tokens, chunks, outcome)
+
+
+async def stream_llm_response_async(prompt, system_message=system_message, metrics=None):
+    """Async version of stream_llm_response"""
+    client = get_async_llm_client()
+    _check_budget(prompt, system_message)
+    started = time.perf_counter()
+    first_token = None
+    chunks = 0
+    usage_tokens = None
+    outcome = "incomplete"   # stream stopped early by an error or the consumer
+
+    stream = await client.chat.completions.create(
+        model=_client_settings["model"],
+        messages=[
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.1,
+        top_p=0.1,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    try:
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage_tokens = chunk.usage.completion_tokens
+            text = _chunk_text(chunk)
+            if text:
+                if first_token is None:
+                    first_token = time.perf_counter()
+                chunks += 1
+                yield text
+        outcome = "ok"
+    finally:
+        await stream.close()
+        _record_stream_metrics(metrics, started, first_token, usage_tokens, chunks, outcome)
+
 
 def analyze_trends(data_history):
+    """
+    Trend labels for the recent records
+
+    parameters:
+        data_history: a TrendTracker (O(1), preferred) or a list of health data dicts
+    """
+    if isinstance(data_history, TrendTracker):
+        return data_history.trends()
     if not data_history:
         return {}
-        
-    trends = {
-        "heart_rate": [],
-        "blood_pressure_systolic": [],
-        "blood_pressure_diastolic": [],
-        "blood_oxygen": [],
-        "pace": [],
-        "distance": [],
-        "calories": []
-    }
-    
+
+    tracker = TrendTracker(window=len(data_history))
     for data in data_history:
-        trends["heart_rate"].append(data["heart_rate"])
-        trends["blood_pressure_systolic"].append(data["blood_pressure"]["systolic"])
-        trends["blood_pressure_diastolic"].append(data["blood_pressure"]["diastolic"])
-        trends["blood_oxygen"].append(data["blood_oxygen"])
-        trends["pace"].append(data["performance"]["pace"])
-        trends["distance"].append(data["performance"]["distance"])
-        trends["calories"].append(data["performance"]["calories"])
-    
-    def calculate_trend(values):
-        if len(values) < 2:
-            return "stable"
-        diff = values[-1] - values[0]
-        if abs(diff) < 0.05 * values[0]: 
-            return "stable"
-        return "increasing" if diff > 0 else "decreasing"
-    
-    return {
-        "heart_rate_trend": calculate_trend(trends["heart_rate"]),
-        "blood_pressure_trend": calculate_trend(trends["blood_pressure_systolic"]),
-        "blood_oxygen_trend": calculate_trend(trends["blood_oxygen"]),
-        "pace_trend": calculate_trend(trends["pace"]),
-        "performance_trend": calculate_trend(trends["distance"])
-    }
-
-def analyze_health_data(data, data_history):
+        tracker.update(data)
+    return tracker.trends()
+
+def analyze_health_data(data, data_history, trends=None):
     """Generate exercise analysis prompt with trend analysis"""
-    trends = analyze_trends(data_history)
-    
-    prompt_template = os.environ.get("EXERCISE_ANALYSIS_TEMPLATE")
-    
-    formatted_prompt = prompt_template.format(
-        heart_rate=data["heart_rate"],
-        systolic=data["blood_pressure"]["systolic"],
-        diastolic=data["blood_pressure"]["diastolic"],
-        blood_oxygen=data["blood_oxygen"],
-        pace=data["performance"]["pace"],
-        distance=data["performance"]["distance"],
-        heart_rate_trend=trends["heart_rate_trend"],
-        blood_pressure_trend=trends["blood_pressure_trend"],
-        blood_oxygen_trend=trends["blood_oxygen_trend"],
-        pace_trend=trends["pace_trend"]
-    )
+    if trends is None:
+        trends = analyze_trends(data_history)
     
-    return formatted_prompt
+    with instrumentation.timer("prompt_build"):
+        return render_analysis_prompt(data, trends)
 
 def main():
     prompt = "Hello"
-    response = get_llm_response(prompt)
-    print(response)
+    for delta in stream_llm_response(prompt):
+        print(delta, end="", flush=True)
+    print()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,205 @@
+import threading
+
+import numpy as np
+from records import SAMPLE_FIELDS, COLUMN_DTYPES, HealthSample, to_sample_tuple
+
+STATUS_CODES = {"normal": 0, "warning": 1, "critical": 2}
+STATUS_NAMES = ("normal", "warning", "critical")
+
+# fields that get min/max/mean in the downsampled tier
+NUMERIC_FIELDS = tuple(name for name in SAMPLE_FIELDS if name not in ("timestamp", "status"))
+
+HISTORY_DTYPE = np.dtype([
+    (name, np.int8 if name == "status" else COLUMN_DTYPES[name])
+    for name in SAMPLE_FIELDS
+])
+
+
+class DownsampledHistory:
+    """
+    Long-retention tier keeping min/max/mean per bucket of samples
+
+    parameters:
+        bucket_size (int): raw samples aggregated into one bucket
+        capacity (int): number of buckets kept
+    """
+
+    def __init__(self, bucket_size=60, capacity=10_000):
+        self.bucket_size = bucket_size
+        self.capacity = capacity
+        n_fields = len(NUMERIC_FIELDS)
+        # every bucket is written twice so ordered views never wrap
+        self._min = np.zeros((2 * capacity, n_fields))
+        self._max = np.zeros((2 * capacity, n_fields))
+        self._mean = np.zeros((2 * capacity, n_fields))
+        self._start = np.zeros(2 * capacity, dtype="datetime64[s]")
+        self._count = 0
+        self._reset_bucket()
+
+    def _reset_bucket(self):
+        n_fields = len(NUMERIC_FIELDS)
+        self._bucket_min = np.full(n_fields, np.inf)
+        self._bucket_max = np.full(n_fields, -np.inf)
+        self._bucket_sum = np.zeros(n_fields)
+        self._bucket_n = 0
+        self._bucket_start = None
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def add(self, timestamp, values):
+        """Add one raw sample (numeric values ordered like NUMERIC_FIELDS)"""
+        if self._bucket_n == 0:
+            self._bucket_start = timestamp
+        np.minimum(self._bucket_min, values, out=self._bucket_min)
+        np.maximum(self._bucket_max, values, out=self._bucket_max)
+        self._bucket_sum += values
+        self._bucket_n += 1
+        if self._bucket_n == self.bucket_size:
+            self._close_bucket()
+
+    def _close_bucket(self):
+        pos = self._count % self.capacity
+        mean = self._bucket_sum / self._bucket_n
+        for index in (pos, pos + self.capacity):
+            self._min[index] = self._bucket_min
+            self._max[index] = self._bucket_max
+            self._mean[index] = mean
+            self._start[index] = self._bucket_start
+        self._count += 1
+        self._reset_bucket()
+
+    def view(self, field, stat="mean"):
+        """Ordered zero-copy view of one statistic for one field"""
+        n = len(self)
+        end = (self._count - 1) % self.capacity + self.capacity + 1 if n else 0
+        data = {"min": self._min, "max": self._max, "mean": self._mean}[stat]
+        return data[end - n:end, NUMERIC_FIELDS.index(field)]
+
+    def timestamps(self):
+        n = len(self)
+        end = (self._count - 1) % self.capacity + self.capacity + 1 if n else 0
+        return self._start[end - n:end]
+
+
+class HistoryBuffer:
+    """
+    Preallocated ring buffer of health samples
+
+    Samples are stored in a NumPy structured array (one typed field per
+    SAMPLE_FIELDS entry, status as an int8 code). Appends are O(1) and
+    never move existing data. Each sample is written to two slots, i and
+    i + capacity, so the last n samples are always one contiguous slice
+    and view()/columns() can return ordered views without copying.
+
+    Also behaves like a read-only sequence of HealthSample objects
+    (len(), iteration, indexing and slicing) so it can stand in for the
+    old data_history list.
+
+    Views are only stable on the thread that appends. Other threads
+    (the Streamlit charts) read through snapshot(), which copies under
+    the same lock append() takes.
+
+    parameters:
+        capacity (int): number of samples kept (1e3 - 1e6 is typical)
+        downsample_bucket (int): if set, also feed a DownsampledHistory
+            with buckets of this many samples
+        downsample_capacity (int): number of buckets kept in that tier
+    """
+
+    def __init__(self, capacity=1000, downsample_bucket=None, downsample_capacity=10_000):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._data = np.zeros(2 * capacity, dtype=HISTORY_DTYPE)
+        self._count = 0
+        self._lock = threading.Lock()
+        self.downsampled = None
+        if downsample_bucket:
+            self.downsampled = DownsampledHistory(downsample_bucket, downsample_capacity)
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def total_count(self):
+        """Number of samples appended since creation, including overwritten ones"""
+        return self._count
+
+    def append(self, sample):
+        """Add a HealthSample or nested health data dict"""
+        row = list(to_sample_tuple(sample))
+        row[-1] = STATUS_CODES[row[-1]]
+        row = tuple(row)
+
+        with self._lock:
+            pos = self._count % self.capacity
+            self._data[pos] = row
+            self._data[pos + self.capacity] = row
+            self._count += 1
+
+        if self.downsampled is not None:
+            self.downsampled.add(self._data[pos]["timestamp"], row[1:-1])
+
+    def clear(self):
+        with self._lock:
+            self._count = 0
+
+    def _window(self, last=None):
+        n = len(self)
+        if last is not None:
+            n = min(n, last)
+        if n == 0:
+            return self._data[:0]
+        end = (self._count - 1) % self.capacity + self.capacity + 1
+        return self._data[end - n:end]
+
+    def view(self, field, last=None):
+        """Ordered zero-copy view of one field, oldest first"""
+        return self._window(last)[field]
+
+    def columns(self, last=None):
+        """Dict of ordered zero-copy views for every field"""
+        window = self._window(last)
+        return {name: window[name] for name in SAMPLE_FIELDS}
+
+    def snapshot(self, fields, last=None, start=None):
+        """
+        Copies of some fields, consistent with each other, for readers on other threads
+
+        parameters:
+            fields (tuple): fields to copy
+            last (int): only the newest `last` samples
+            start (int): only samples numbered start and later (see total_count)
+
+        Returns: (total_count, dict of field -> array, oldest first)
+        """
+        with self._lock:
+            if start is not None:
+                last = max(0, self._count - start)
+            window = self._window(last)
+            return self._count, {name: window[name].copy() for name in fields}
+
+    def status(self, last=None):
+        """Status names for the window (this one is a copy)"""
+        return np.array(STATUS_NAMES)[self._window(last)["status"]]
+
+    def _to_sample(self, record):
+        values = record.tolist()
+        timestamp = str(record["timestamp"]).replace("T", " ")
+        return HealthSample(timestamp, *values[1:-1], STATUS_NAMES[values[-1]])
+
+    def __getitem__(self, index):
+        window = self._window()
+        if isinstance(index, slice):
+            return [self._to_sample(record) for record in window[index]]
+        return self._to_sample(window[index])
+
+    def __iter__(self):
+        for record in self._window():
+            yield self._to_sample(record)
+
+    def latest(self):
+        if self._count == 0:
+            return None
+        return self[-1]
@@ -0,0 +1,560 @@
+import re
+import json
+import logging
+import operator
+import time
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import List, Union
+
+try:
+    import msgspec
+except ImportError:  # falls back to the json module
+    msgspec = None
+
+try:
+    from websockets.asyncio.server import serve as websocket_serve
+except ImportError:  # WebSocket endpoint is optional
+    websocket_serve = None
+
+from alerts import AlertEngine
+from coach_pipeline import CoachPipeline
+from data_storage import create_storage_backend
+from llm_batch import LLMBatchCoordinator
+from llm_cache import CoachResponseCache
+from records import SAMPLE_FIELDS, TIMESTAMP_FORMAT, HealthSample
+from session_manager import session_storage_options
+from terminal import HealthDataSimulator
+from trigger_policy import TriggerPolicy
+
+# what a StreamSimulator does when a sample arrives and its buffer is full
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "coalesce")
+
+# how often run() flushes the per-athlete writers, in seconds
+FLUSH_INTERVAL = 5.0
+
+# athlete ids end up in storage paths, so only plain names are accepted
+ATHLETE_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# shape of TIMESTAMP_FORMAT, such timestamps are kept as they are
+CANONICAL_TIMESTAMP = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2}")
+
+# largest accepted HTTP body / TCP line, in bytes
+MAX_PACKET_SIZE = 4 * 1024 * 1024
+
+# packet fields besides athlete; timestamp defaults to the arrival time,
+# status is derived from heart rate and blood oxygen when missing
+PACKET_FIELDS = SAMPLE_FIELDS[1:-1]
+
+logger = logging.getLogger(__name__)
+
+
+def sample_status(heart_rate, blood_oxygen):
+    """Same thresholds as HealthDataSimulator.generate_health_data"""
+    if heart_rate > 180 or blood_oxygen < 90:
+        return "critical"
+    if heart_rate > 160 or blood_oxygen < 95:
+        return "warning"
+    return "normal"
+
+
+def normalize_timestamp(value):
+    """
+    A packet timestamp written in TIMESTAMP_FORMAT, local time
+
+    Accepts TIMESTAMP_FORMAT itself, ISO 8601 (with "T", fractions of a
+    second or a UTC offset such as "Z") and epoch seconds. An empty value
+    means the arrival time.
+
+    Raises: ValueError for anything else
+    """
+    if value is None or value == "":
+        return datetime.now().strftime(TIMESTAMP_FORMAT)
+    try:
+        if isinstance(value, str):
+            parsed = datetime.fromisoformat(value)
+            if CANONICAL_TIMESTAMP.fullmatch(value) and parsed.year >= 1000:
+                return value
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone().replace(tzinfo=None)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            parsed = datetime.fromtimestamp(value)
+        else:
+            raise ValueError(f"Invalid timestamp: {value!r}")
+    except (OverflowError, OSError) as e:
+        raise ValueError(f"Invalid timestamp {value!r}: {e}") from None
+    if parsed.year < 1000:
+        # %Y would not be zero padded
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    return parsed.strftime(TIMESTAMP_FORMAT)
+
+
+def packet_to_sample(athlete, timestamp, values, status):
+    """
+    Turn one decoded packet into (athlete id, HealthSample)
+
+    Raises: ValueError for a timestamp or values that cannot be used
+    """
+    timestamp = normalize_timestamp(timestamp)
+    if not status:
+        try:
+            status = sample_status(values[0], values[3])
+        except TypeError:
+            raise ValueError("Heart rate and blood oxygen must be numbers") from None
+    return str(athlete), HealthSample(timestamp, *values, status)
+
+
+if msgspec is not None:
+    Number = Union[int, float]
+
+    class SensorPacket(msgspec.Struct):
+        """One sensor reading: the flat sample schema plus the athlete id"""
+        athlete: Union[str, int]
+        heart_rate: Number
+        blood_pressure_systolic: Number
+        blood_pressure_diastolic: Number
+        blood_oxygen: Number
+        pace: Number
+        stride: Number
+        cadence: Number
+        duration: Number
+        distance: Number
+        calories: Number
+        altitude: Number
+        temperature: Number
+        pressure: Number
+        humidity: Number
+        timestamp: Union[str, int, float] = ""
+        status: str = ""
+
+    _decoder = msgspec.json.Decoder(Union[SensorPacket, List[SensorPacket]])
+    _get_values = operator.attrgetter(*PACKET_FIELDS)
+
+    def decode_packets(payload):
+        """
+        Parse a JSON packet or array of packets
+
+        Returns: list of (athlete, timestamp, values, status), see packet_to_sample
+        Raises: ValueError for malformed JSON or packets not matching the schema
+        """
+        try:
+            packets = _decoder.decode(payload)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from None
+        if not isinstance(packets, list):
+            packets = (packets,)
+        return [(packet.athlete, packet.timestamp, _get_values(packet), packet.status)
+                for packet in packets]
+else:
+    def decode_packets(payload):
+        """
+        Parse a JSON packet or array of packets
+
+        Returns: list of (athlete, timestamp, values, status), see packet_to_sample
+        Raises: ValueError for malformed JSON or packets not matching the schema
+        """
+        packets = json.loads(payload)
+        if not isinstance(packets, list):
+            packets = (packets,)
+        try:
+            return [(packet["athlete"], packet.get("timestamp"),
+                     [packet[field] for field in PACKET_FIELDS], packet.get("status"))
+                    for packet in packets]
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Invalid packet: {e}") from None
+
+
+class StreamSimulator(HealthDataSimulator):
+    """
+    Push source fed by an ingestion server, one per athlete
+
+    Incoming samples wait in a buffer of at most `queue_size` samples.
+    When it is full, `policy` decides: "drop_oldest" discards the oldest
+    waiting sample, "drop_newest" refuses the new one, and "coalesce"
+    overwrites the newest waiting sample, so a slow consumer always sees
+    the latest reading. CoachPipeline awaits next_sample(); every sample
+    goes through the usual validation, trend and history updates when it
+    is taken from the buffer.
+
+    parameters:
+        queue_size (int): max samples waiting for the pipeline
+        policy (str): one of OVERFLOW_POLICIES
+        **kwargs: passed to HealthDataSimulator
+    """
+
+    def __init__(self, queue_size=64, policy="drop_oldest", **kwargs):
+        super().__init__(**kwargs)
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.stats = {"received": 0, "dropped": 0, "coalesced": 0}
+        self._buffer = deque()
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def offer(self, sample):
+        """
+        Hand over one arriving sample, must be called from the event loop thread
+
+        Returns: False when the sample was refused (drop_newest on a full buffer)
+        """
+        self.stats["received"] += 1
+        if len(self._buffer) >= self.queue_size:
+            if self.policy == "drop_newest":
+                self.stats["dropped"] += 1
+                return False
+            if self.policy == "coalesce":
+                self._buffer[-1] = sample
+                self.stats["coalesced"] += 1
+                return True
+            self._buffer.popleft()
+            self.stats["dropped"] += 1
+        self._buffer.append(sample)
+        self._ready.set()
+        return True
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        """No more samples; next_sample() returns None once the buffer is empty"""
+        self._closed = True
+        self._ready.set()
+
+    async def next_sample(self):
+        """Wait for the next buffered sample; None after close() once drained"""
+        while not self._buffer:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        sample = self._buffer.popleft()
+        self.record(sample)
+        return sample
+
+    def generate_health_data(self):
+        raise TypeError("StreamSimulator is a push source, use next_sample()")
+
+
+class IngestServer:
+    """
+    Asyncio ingestion endpoint for wearable sensor packets
+
+    Accepts JSON packets (the flat sample schema plus an "athlete" id, or
+    an array of them) over
+      - TCP: one packet or array per line (newline-delimited JSON)
+      - HTTP: POST /ingest with a JSON body; GET /stats returns metrics()
+      - WebSocket: one packet or array per message (needs `websockets`)
+    and decodes them with msgspec when it is installed.
+
+    Every athlete gets a StreamSimulator with a bounded buffer and its own
+    CoachPipeline (see `pipeline_factory`), created on its first packet.
+    All pipelines run on the server's event loop and share one
+    LLMBatchCoordinator and response cache. A pipeline that fails is
+    logged, counted in `pipeline_failures` and restarted on the same
+    buffer. Client timestamps are normalized to TIMESTAMP_FORMAT (see
+    normalize_timestamp) before a sample is queued.
+
+    parameters:
+        host (str): interface to listen on
+        tcp_port, http_port, ws_port (int): 0 for a free port, None to disable
+        queue_size (int): per-athlete buffer size
+        history_capacity (int): samples each athlete keeps in memory for trends
+        policy (str): overflow policy, see StreamSimulator
+        max_athletes (int): packets for further athletes are rejected, as are
+            athlete ids not matching ATHLETE_ID_PATTERN
+        pipeline_factory (callable): (athlete_id, simulator) -> CoachPipeline,
+            defaults to storage plus event-driven LLM analysis and alerts
+        storage (str): "parquet" or "csv" for the default factory, None to not store
+    """
+
+    def __init__(self, host="127.0.0.1", tcp_port=9000, http_port=8080, ws_port=None,
+                 queue_size=64, policy="drop_oldest", max_athletes=10_000,
+                 pipeline_factory=None, storage="parquet", history_capacity=300):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        if ws_port is not None and websocket_serve is None:
+            raise ValueError("The WebSocket endpoint requires the websockets package")
+        self.host = host
+        self.ports = {"tcp": tcp_port, "http": http_port, "ws": ws_port}
+        self.queue_size = queue_size
+        self.history_capacity = history_capacity
+        self.policy = policy
+        self.max_athletes = max_athletes
+        self.pipeline_factory = pipeline_factory or self._default_pipeline
+        self.storage = storage
+
+        self.athletes = {}   # athlete id -> (StreamSimulator, CoachPipeline, task)
+        self.stats = {"packets": 0, "samples": 0, "decode_errors": 0, "rejected": 0,
+                      "pipeline_failures": 0}
+        # counters of pipelines replaced after a failure
+        self._retired = {"processed": 0, "invalid": 0, "analyses": 0}
+        self._servers = []
+        self._coordinator = None
+        self._cache = None
+        self._writers = []
+        self._windows = {}   # caller -> (time, samples) of its previous metrics() call
+
+    def _default_pipeline(self, athlete_id, simulator):
+        writer = None
+        if self.storage is not None:
+            # no per-writer flush thread, run() flushes all writers itself
+            writer = create_storage_backend(self.storage, flush_interval=None,
+                                            **session_storage_options(self.storage, athlete_id))
+            self._writers.append(writer)
+        return CoachPipeline(
+            simulator,
+            writer=writer,
+            llm=self._coordinator.llm_for(athlete_id),
+            cache=self._cache,
+            trigger=TriggerPolicy(),
+            alerts=AlertEngine(),
+        )
+
+    def _athlete(self, athlete_id):
+        entry = self.athletes.get(athlete_id)
+        if entry is None:
+            if len(self.athletes) >= self.max_athletes or not ATHLETE_ID_PATTERN.fullmatch(athlete_id):
+                return None
+            simulator = StreamSimulator(queue_size=self.queue_size, policy=self.policy,
+                                        history_capacity=self.history_capacity)
+            self._start_pipeline(athlete_id, simulator)
+            return simulator
+        return entry[0]
+
+    def _start_pipeline(self, athlete_id, simulator):
+        pipeline = self.pipeline_factory(athlete_id, simulator)
+        task = asyncio.create_task(pipeline.run())
+        task.add_done_callback(lambda task: self._pipeline_done(athlete_id, task))
+        self.athletes[athlete_id] = (simulator, pipeline, task)
+
+    def _pipeline_done(self, athlete_id, task):
+        if task.cancelled() or task.exception() is None:
+            return
+        simulator, pipeline, _ = self.athletes[athlete_id]
+        self.stats["pipeline_failures"] += 1
+        logger.error("Pipeline of athlete %s failed", athlete_id, exc_info=task.exception())
+        # keep its counters and storage consistent, then start over with the same buffer
+        self._retired["processed"] += pipeline.stats["samples"]
+        self._retired["invalid"] += pipeline.stats["invalid"]
+        self._retired["analyses"] += pipeline.stats["completed"]
+        if pipeline.writer is not None and pipeline.writer in self._writers:
+            self._writers.remove(pipeline.writer)
+            pipeline.writer.close()
+        if not simulator.closed:
+            self._start_pipeline(athlete_id, simulator)
+
+    def ingest(self, payload):
+        """
+        Decode one payload and route its samples to the athletes' buffers
+
+        Packets with an unusable timestamp or athlete id are counted in
+        `rejected` and skipped, the rest of the payload is still accepted.
+
+        Returns: number of samples accepted
+        Raises: ValueError when the payload cannot be decoded
+        """
+        self.stats["packets"] += 1
+        try:
+            packets = decode_packets(payload)
+        except ValueError:
+            self.stats["decode_errors"] += 1
+            raise
+        accepted = 0
+        for packet in packets:
+            try:
+                athlete_id, sample = packet_to_sample(*packet)
+            except ValueError:
+                self.stats["rejected"] += 1
+                continue
+            simulator = self._athlete(athlete_id)
+            if simulator is None:
+                self.stats["rejected"] += 1
+            elif simulator.offer(sample):
+                accepted += 1
+        self.stats["samples"] += accepted
+        return accepted
+
+    def metrics(self, window="report"):
+        """
+        Counters, buffer depths and the ingest rate
+
+        parameters:
+            window (str): the rate covers the time since the previous call with
+                the same window, so GET /stats does not reset the reports
+        """
+        now = time.monotonic()
+        metrics = dict(self.stats)
+        previous_time, previous_samples = self._windows.get(window, (None, 0))
+        if previous_time is not None and now > previous_time:
+            metrics["ingest_rate"] = (self.stats["samples"] - previous_samples) / (now - previous_time)
+        else:
+            metrics["ingest_rate"] = 0.0
+        self._windows[window] = (now, self.stats["samples"])
+
+        depths = [len(simulator) for simulator, _, _ in self.athletes.values()]
+        metrics.update({
+            "athletes": len(self.athletes),
+            "queue_depth": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "dropped": sum(simulator.stats["dropped"] for simulator, _, _ in self.athletes.values()),
+            "coalesced": sum(simulator.stats["coalesced"] for simulator, _, _ in self.athletes.values()),
+            "processed": self._retired["processed"] + sum(
+                pipeline.stats["samples"] for _, pipeline, _ in self.athletes.values()),
+            "invalid": self._retired["invalid"] + sum(
+                pipeline.stats["invalid"] for _, pipeline, _ in self.athletes.values()),
+            "analyses": self._retired["analyses"] + sum(
+                pipeline.stats["completed"] for _, pipeline, _ in self.athletes.values()),
+        })
+        return metrics
+
+    async def _handle_tcp(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    try:
+                        self.ingest(line)
+                    except ValueError:
+                        pass
+        except (ConnectionError, ValueError):
+            # ValueError: line longer than MAX_PACKET_SIZE
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_http(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_PACKET_SIZE:
+                    await self._respond(writer, 413, {"error": "payload too large"})
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                if method == "POST" and path == "/ingest":
+                    try:
+                        await self._respond(writer, 202, {"accepted": self.ingest(body)})
+                    except ValueError as e:
+                        await self._respond(writer, 400, {"error": str(e)})
+                elif method == "GET" and path == "/stats":
+                    await self._respond(writer, 200, self.metrics(window="http"))
+                else:
+                    await self._respond(writer, 404, {"error": "not found"})
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, payload):
+        reasons = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+                   413: "Payload Too Large"}
+        body = json.dumps(payload).encode()
+        writer.write(b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s"
+                     % (status, reasons[status].encode(), len(body), body))
+        await writer.drain()
+
+    async def _handle_websocket(self, connection):
+        async for message in connection:
+            try:
+                self.ingest(message.encode() if isinstance(message, str) else message)
+            except ValueError:
+                pass
+
+    async def start(self):
+        """Start listening; the ports actually bound are stored in `ports`"""
+        self._coordinator = LLMBatchCoordinator()
+        self._cache = CoachResponseCache()
+        if self.ports["tcp"] is not None:
+            server = await asyncio.start_server(self._handle_tcp, self.host, self.ports["tcp"],
+                                                limit=MAX_PACKET_SIZE)
+            self.ports["tcp"] = server.sockets[0].getsockname()[1]
+            self._servers.append(server)
+        if self.ports["http"] is not None:
+            server = await asyncio.start_server(self._handle_http, self.host, self.ports["http"])
+            self.ports["http"] = server.sockets[0].getsockname()[1]
+            self._servers.append(server)
+        if self.ports["ws"] is not None:
+            server = await websocket_serve(self._handle_websocket, self.host, self.ports["ws"],
+                                           max_size=MAX_PACKET_SIZE)
+            self.ports["ws"] = next(iter(server.sockets)).getsockname()[1]
+            self._servers.append(server)
+
+    async def close(self):
+        """Stop listening, let every pipeline drain its buffer, then close storage"""
+        for server in self._servers:
+            server.close()
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
+        for simulator, _, _ in self.athletes.values():
+            simulator.close()
+        await asyncio.gather(*(task for _, _, task in self.athletes.values()), return_exceptions=True)
+        if self._coordinator is not None:
+            await self._coordinator.aclose()
+        for writer in self._writers:
+            writer.close()
+        if self._cache is not None:
+            self._cache.close()
+
+    def _flush_writers(self):
+        for writer in list(self._writers):
+            writer.flush()
+
+    async def run(self, duration=None, report_interval=5.0, on_report=None):
+        """
+        Serve until `duration` seconds have passed (or forever)
+
+        parameters:
+            on_report (callable): called with metrics() every report_interval seconds
+        """
+        await self.start()
+        started = time.monotonic()
+        next_report = started + report_interval
+        next_flush = started + FLUSH_INTERVAL
+        flushing = None
+        self.metrics()
+        try:
+            while duration is None or time.monotonic() - started < duration:
+                wake = min(next_report, next_flush)
+                if duration is not None:
+                    wake = min(wake, started + duration)
+                await asyncio.sleep(max(0.0, wake - time.monotonic()))
+                now = time.monotonic()
+                # flush in a thread so ingestion continues meanwhile
+                if now >= next_flush and (flushing is None or flushing.done()):
+                    flushing = asyncio.create_task(asyncio.to_thread(self._flush_writers))
+                    next_flush = now + FLUSH_INTERVAL
+                if now >= next_report:
+                    if on_report is not None:
+                        on_report(self.metrics())
+                    next_report = now + report_interval
+        finally:
+            if flushing is not None:
+                await asyncio.gather(flushing, return_exceptions=True)
+            await self.close()
+
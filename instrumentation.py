@@ -0,0 +1,161 @@
+import os
+import time
+
+try:
+    from prometheus_client import CollectorRegistry, Counter, Histogram, start_http_server
+except ImportError:  # instrumentation is optional
+    CollectorRegistry = None
+
+_FAST = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+_SLOW = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+# name -> (description, buckets in seconds, label names)
+HISTOGRAMS = {
+    "simulator_generate": ("Time to generate one simulated sample", _FAST, ()),
+    "validation": ("Time to validate one sample", _FAST, ()),
+    "trend_update": ("Time to update the rolling trends with one sample", _FAST, ()),
+    "prompt_build": ("Time to render one analysis prompt", _FAST, ()),
+    "llm_latency": ("Time until the whole LLM reply has arrived", _SLOW, ()),
+    "llm_ttft": ("Time until the first streamed LLM token", _SLOW, ()),
+    "storage_write": ("Time to buffer one sample, including any flush it triggers", _FAST,
+                      ("backend",)),
+    "storage_flush": ("Time to write one batch of buffered samples", _FAST + _SLOW[1:],
+                      ("backend",)),
+}
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+# port for the /metrics endpoint of a process started by main.py (the Streamlit UI)
+METRICS_PORT_ENV = "COACH_METRICS_PORT"
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class _Metrics:
+    """The Prometheus collectors, created once instrumentation is enabled"""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.histograms = {
+            name: Histogram(f"coach_{name}_seconds", description, labels, buckets=buckets, registry=registry)
+            for name, (description, buckets, labels) in HISTOGRAMS.items()
+        }
+        self.llm_tokens = Histogram("coach_llm_completion_tokens", "Completion tokens per LLM reply",
+                                    buckets=TOKEN_BUCKETS, registry=registry)
+        self.llm_calls = Counter("coach_llm_calls", "LLM requests by outcome", ["outcome"],
+                                 registry=registry)
+        self.status = Counter("coach_samples", "Samples by status level", ["status"], registry=registry)
+        self.validation_failures = Counter("coach_validation_failures", "Samples that failed validation",
+                                           ["reason"], registry=registry)
+
+
+_metrics = None
+
+
+def enable(port=None, addr="127.0.0.1", registry=None):
+    """
+    Start collecting metrics, optionally serving them on http://addr:port/metrics
+
+    Safe to call more than once: only the first call creates the
+    collectors, later calls may still start the HTTP endpoint.
+
+    Returns: the CollectorRegistry holding the metrics
+    """
+    global _metrics
+    if CollectorRegistry is None:
+        raise RuntimeError("Metrics require the prometheus_client package")
+    if _metrics is None:
+        _metrics = _Metrics(registry or CollectorRegistry())
+    if port is not None:
+        start_http_server(port, addr=addr, registry=_metrics.registry)
+    return _metrics.registry
+
+
+def enable_from_env(addr="127.0.0.1"):
+    """
+    enable() with the port from the COACH_METRICS_PORT environment variable
+
+    Returns: True when metrics were enabled
+    """
+    port = os.environ.get(METRICS_PORT_ENV)
+    if not port:
+        return False
+    enable(int(port), addr=addr)
+    return True
+
+
+def disable():
+    """Stop collecting; the HTTP endpoint (if any) keeps serving the last values"""
+    global _metrics
+    _metrics = None
+
+
+def is_enabled():
+    return _metrics is not None
+
+
+def timer(name, backend=None):
+    """
+    Context manager observing the duration of a block in histogram `name`
+
+    Returns a shared no-op object while instrumentation is disabled.
+    """
+    if _metrics is None:
+        return _NULL_TIMER
+    histogram = _metrics.histograms[name]
+    return _Timer(histogram if backend is None else histogram.labels(backend=backend))
+
+
+def observe(name, value, backend=None):
+    """Record one already measured duration in histogram `name`"""
+    if _metrics is None or value is None:
+        return
+    histogram = _metrics.histograms[name]
+    (histogram if backend is None else histogram.labels(backend=backend)).observe(value)
+
+
+def count_status(status):
+    if _metrics is not None:
+        _metrics.status.labels(status=status).inc()
+
+
+def count_validation_failure(reason):
+    if _metrics is not None:
+        _metrics.validation_failures.labels(reason=reason).inc()
+
+
+def record_llm_call(duration, ttft=None, tokens=None, outcome="ok"):
+    """Latency, time to first token and completion tokens of one LLM request"""
+    if _metrics is None:
+        return
+    _metrics.llm_calls.labels(outcome=outcome).inc()
+    if duration is not None:
+        _metrics.histograms["llm_latency"].observe(duration)
+    if ttft is not None:
+        _metrics.histograms["llm_ttft"].observe(ttft)
+    if tokens:
+        _metrics.llm_tokens.observe(tokens)
@@ -0,0 +1,186 @@
+import asyncio
+import json
+
+from fetch_llm import get_llm_response_async
+
+BATCH_INSTRUCTIONS = """You are coaching several athletes at once. Analyze each athlete below separately, following the instructions in their section.
+
+Reply with a single JSON object and nothing else. Use the athlete ids as keys and the analysis text for that athlete as the value, e.g. {"1": "...", "2": "..."}.
+"""
+
+BATCH_SECTION = "\n### Athlete {athlete_id}\n{prompt}\n"
+
+
+def build_batch_prompt(prompts):
+    """
+    Combine per-athlete prompts into one request
+
+    parameters:
+        prompts (list): (athlete_id, prompt) pairs
+    """
+    sections = "".join(BATCH_SECTION.format(athlete_id=athlete_id, prompt=prompt.strip())
+                       for athlete_id, prompt in prompts)
+    return BATCH_INSTRUCTIONS + sections
+
+
+def split_batch_reply(reply, athlete_ids):
+    """
+    Demultiplex a combined reply
+
+    Returns: dict athlete_id -> analysis for every id found in the reply
+    """
+    start, end = reply.find("{"), reply.rfind("}")
+    if start == -1 or end < start:
+        return {}
+    try:
+        data = json.loads(reply[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {
+        athlete_id: str(data[str(athlete_id)])
+        for athlete_id in athlete_ids
+        if str(athlete_id) in data
+    }
+
+
+class LLMBatchCoordinator:
+    """
+    Collects analysis prompts from many athlete sessions into batches
+
+    Prompts submitted within `window` seconds of each other (up to
+    `max_batch`) are sent together. In "combined" mode a batch becomes
+    one multi-athlete request whose JSON reply is split back per
+    athlete; athletes missing from the reply are retried one by one. In
+    "concurrent" mode every prompt of a batch is sent as its own request.
+    Either way at most `max_concurrency` requests are in flight, to stay
+    within provider rate limits.
+
+    Must be used from a single event loop. Use llm_for(athlete_id) as the
+    `llm` argument of each athlete's CoachPipeline.
+
+    parameters:
+        window (float): seconds to wait for more prompts after the first one
+        max_batch (int): prompts per batch, a full batch is sent immediately
+        mode (str): "combined" or "concurrent"
+        max_concurrency (int): max requests in flight
+        llm (coroutine function): prompt -> reply, defaults to get_llm_response_async
+    """
+
+    def __init__(self, window=0.5, max_batch=8, mode="combined", max_concurrency=4,
+                 llm=get_llm_response_async):
+        if mode not in ("combined", "concurrent"):
+            raise ValueError(f"Unsupported batch mode: {mode}")
+        self.window = window
+        self.max_batch = max_batch
+        self.mode = mode
+        self.max_concurrency = max_concurrency
+        self.llm = llm
+
+        self._pending = []
+        self._timer = None
+        self._semaphore = None
+        self._tasks = set()
+
+        self.stats = {
+            "prompts": 0,
+            "batches": 0,
+            "requests": 0,
+            "fallbacks": 0,    # athletes retried alone after a combined reply
+            "errors": 0,
+        }
+
+    def llm_for(self, athlete_id):
+        """Coroutine function prompt -> reply routed through this coordinator"""
+        async def llm(prompt):
+            return await self.submit(athlete_id, prompt)
+        return llm
+
+    async def submit(self, athlete_id, prompt):
+        """Queue a prompt and wait for this athlete's reply"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        # one prompt per athlete per batch, so replies can be matched by id
+        if any(pending_id == athlete_id for pending_id, _, _ in self._pending):
+            self.flush()
+
+        future = loop.create_future()
+        self._pending.append((athlete_id, prompt, future))
+        self.stats["prompts"] += 1
+        if len(self._pending) >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        """Send whatever is pending now"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.stats["batches"] += 1
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _request(self, prompt, futures):
+        async with self._semaphore:
+            # every waiting session may have given up while this queued for a slot
+            if all(future.done() for future in futures):
+                return None
+            self.stats["requests"] += 1
+            return await self.llm(prompt)
+
+    async def _send_one(self, prompt, future):
+        try:
+            reply = await self._request(prompt, [future])
+        except Exception as e:
+            self.stats["errors"] += 1
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(reply)
+
+    async def _send(self, batch):
+        # sessions may have cancelled (stale) requests while they waited
+        batch = [entry for entry in batch if not entry[2].done()]
+        if not batch:
+            return
+        if self.mode == "concurrent" or len(batch) == 1:
+            await asyncio.gather(*(self._send_one(prompt, future) for _, prompt, future in batch))
+            return
+
+        try:
+            reply = await self._request(build_batch_prompt([(athlete_id, prompt) for athlete_id, prompt, _ in batch]),
+                                        [future for _, _, future in batch])
+        except Exception:
+            self.stats["errors"] += 1
+            replies = {}
+        else:
+            if reply is None:
+                return
+            replies = split_batch_reply(reply, [athlete_id for athlete_id, _, _ in batch])
+
+        retries = []
+        for athlete_id, prompt, future in batch:
+            if future.done():
+                continue
+            if athlete_id in replies:
+                future.set_result(replies[athlete_id])
+            else:
+                self.stats["fallbacks"] += 1
+                retries.append(self._send_one(prompt, future))
+        if retries:
+            await asyncio.gather(*retries)
+
+    async def aclose(self):
+        """Send pending prompts and wait for every batch in flight"""
+        self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,143 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from records import HealthSample
+
+try:
+    import diskcache
+except ImportError:  # optional, only needed for the on-disk tier
+    diskcache = None
+
+# bucket width per field; fields not listed here are left out of the key
+DEFAULT_QUANTIZATION = {
+    "heart_rate": 10,
+    "blood_oxygen": 2.0,
+    "blood_pressure_systolic": 20,
+    "blood_pressure_diastolic": 20,
+    "pace": 1.0,
+}
+
+TREND_KEYS = ("heart_rate_trend", "blood_pressure_trend", "blood_oxygen_trend", "pace_trend")
+
+
+class CoachResponseCache:
+    """
+    Response cache for coach analyses keyed on quantized inputs
+
+    Prompts that differ only in small sample-to-sample noise map to the
+    same key: each field in `quantization` is bucketed by its width and
+    combined with the trend labels and status. Entries live in an
+    in-memory LRU with a TTL, optionally backed by a diskcache tier that
+    survives restarts and is shared between processes.
+
+    parameters:
+        max_entries (int): LRU size of the in-memory tier
+        ttl (float): seconds an entry stays valid
+        quantization (dict): field -> bucket width, see DEFAULT_QUANTIZATION
+        namespace (str): mixed into every key, change it when the prompt or model changes
+        disk_path (str): directory for the on-disk tier, None to disable
+    """
+
+    def __init__(self, max_entries=256, ttl=300.0, quantization=None,
+                 namespace="default", disk_path=None):
+        if disk_path is not None and diskcache is None:
+            raise ValueError("disk_path requires the diskcache package")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.quantization = dict(DEFAULT_QUANTIZATION if quantization is None else quantization)
+        self.namespace = namespace
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = diskcache.Cache(disk_path) if disk_path is not None else None
+
+        self.stats = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def make_key(self, sample, trends):
+        """Cache key for a sample and its trend labels"""
+        sample = HealthSample.from_dict(sample)
+        buckets = tuple(
+            (field, math.floor(getattr(sample, field) / width))
+            for field, width in sorted(self.quantization.items())
+        )
+        labels = tuple(trends.get(key, "") for key in TREND_KEYS)
+        return (self.namespace, buckets, labels, sample.status)
+
+    def get(self, key):
+        """Return the cached analysis for key, or None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+                del self._entries[key]
+                self.stats["expirations"] += 1
+
+        if self._disk is not None:
+            value = self._disk.get(key)
+            if value is not None:
+                self._store(key, value)
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                return value
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def put(self, key, value):
+        self._store(key, value)
+        if self._disk is not None:
+            self._disk.set(key, value, expire=self.ttl)
+
+    def get_or_compute(self, sample, trends, compute):
+        """Return the cached analysis or call compute() and cache its result"""
+        key = self.make_key(sample, trends)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    async def get_or_compute_async(self, sample, trends, compute):
+        """Async version of get_or_compute, compute() returns an awaitable"""
+        key = self.make_key(sample, trends)
+        value = self.get(key)
+        if value is None:
+            value = await compute()
+            self.put(key, value)
+        return value
+
+    def hit_rate(self):
+        lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        return (self.stats["hits"] + self.stats["disk_hits"]) / lookups if lookups else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
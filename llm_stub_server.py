@@ -0,0 +1,150 @@
+import re
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = ("Vitals are within safe exercise ranges. Heart rate and blood pressure "
+                 "are rising steadily with effort, SpO2 is stable. Keep the current pace, "
+                 "stay hydrated and ease off if heart rate climbs above zone 4.")
+
+# section header used by llm_batch.build_batch_prompt
+BATCH_SECTION_RE = re.compile(r"^### Athlete (\S+)$", re.MULTILINE)
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible /v1/chat/completions endpoint"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.request_count += 1
+
+        time.sleep(self.server.latency)
+        reply = self.server.reply
+        # multi-athlete prompts get a JSON object with one reply per athlete
+        athlete_ids = BATCH_SECTION_RE.findall(request.get("messages", [{}])[-1].get("content", ""))
+        if athlete_ids:
+            reply = json.dumps({athlete_id: reply for athlete_id in athlete_ids})
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in request.get("messages", []))
+        completion_tokens = len(reply.split())
+
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        if request.get("stream"):
+            self._stream_reply(request, reply, usage)
+            return
+
+        body = json.dumps({
+            "id": f"stub-{self.server.request_count}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        }).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client cancelled the request
+            pass
+
+    def _send_event(self, payload):
+        data = b"data: " + payload + b"\n\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _stream_reply(self, request, reply, usage):
+        """Send the reply word by word as server-sent events, plus a usage chunk if asked for"""
+        chunk = {
+            "id": f"stub-{self.server.request_count}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]
+        }
+        words = reply.split(" ")
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self._send_event(json.dumps(chunk).encode())
+            for i, word in enumerate(words):
+                time.sleep(self.server.token_delay)
+                chunk["choices"][0]["delta"] = {"content": word if i == 0 else " " + word}
+                self._send_event(json.dumps(chunk).encode())
+            chunk["choices"][0]["delta"] = {}
+            chunk["choices"][0]["finish_reason"] = "stop"
+            self._send_event(json.dumps(chunk).encode())
+            if (request.get("stream_options") or {}).get("include_usage"):
+                chunk["choices"] = []
+                chunk["usage"] = usage
+                self._send_event(json.dumps(chunk).encode())
+            self._send_event(b"[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0, reply=DEFAULT_REPLY, token_delay=0.0):
+    """
+    Start the stub server on a background thread
+
+    latency is the wait before the first byte, token_delay the wait
+    between words when the client asks for a stream.
+
+    Returns: (server, base_url) - call server.shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), StubLLMHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.reply = reply
+    server.token_delay = token_delay
+    server.request_count = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}/v1"
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local OpenAI-compatible stub LLM server')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before replying')
+    parser.add_argument('--token-delay', type=float, default=0.0,
+                        help='Seconds between words of a streamed reply')
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.host, args.port, args.latency, token_delay=args.token_delay)
+    print(f"Stub LLM listening on {base_url} (set LLM_BASE_URL to use it)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,18 @@
-from fetch_llm import get_llm_response, analyze_health_data
-from terminal import simulate_real_time_data, HealthDataSimulator
-from data_storage import save_data_to_csv
+from terminal import HealthDataSimulator, SimulatedClock, WorkoutPlan
+from data_storage import create_storage_backend
+from coach_pipeline import CoachPipeline
+from llm_cache import CoachResponseCache
+from trigger_policy import TriggerPolicy
+from llm_batch import LLMBatchCoordinator
+from alerts import AlertEngine
+from replay import ReplaySimulator
+from validation import Validator
+from llm_stub_server import start_stub_server
+from fetch_llm import configure_llm_client, run_async
+from session_manager import SessionManager, session_storage_options
+from ingest_server import IngestServer, OVERFLOW_POLICIES
+import instrumentation
+import asyncio
 import json
 import time
 from datetime import datetime
@@ -8,47 +20,268 @@ import argparse
 import subprocess
 import sys
 import os
-import csv
-from pathlib import Path
 
-def run_terminal_mode(simulator):
+def print_sample(simulator, health_data):
+    """Print the current sample, recent history and trends"""
+    print("\nCurrent Health Data:")
+    print(json.dumps(health_data.to_dict(), indent=2))
+    
+    if len(simulator.data_history) > 1:
+        print("\n=== Historical Data (Last 5 records) ===")
+        
+        recent_history = simulator.data_history[-10:]
+        
+        for i, record in enumerate(recent_history):
+            print(f"\nRecord {i+1} - {record.timestamp}:")
+            print(f"  HR: {record.heart_rate} bpm | BP: {record.blood_pressure_systolic}/{record.blood_pressure_diastolic} | SpO2: {record.blood_oxygen}%")
+            print(f"  Pace: {record.pace:.2f} min/km | Distance: {record.distance:.3f} km")
+        
+        print("\n=== Trend Analysis ===")
+        trends = simulator.trend_tracker.trends()
+        
+        print(f"❤️ Heart Rate Trend: {trends['heart_rate_trend']}")
+        print(f"🩺 Blood Pressure Trend: {trends['blood_pressure_trend']}")
+        print(f"🫁 Blood Oxygen Trend: {trends['blood_oxygen_trend']}")
+        print(f"⚡ Pace Trend: {trends['pace_trend']}")
+        print(f"📈 Overall Performance Trend: {trends['performance_trend']}")
+
+def print_analysis(health_data, response):
+    print(f"\nAI Coach Analysis ({health_data.timestamp}):")
+    print(response)
+
+def print_alert(health_data, alert):
+    icon = "🚨" if alert.severity == "critical" else "⚠️"
+    print(f"\n{icon} ALERT ({health_data.timestamp}): {alert}", flush=True)
+
+def print_stream_stats(stats):
+    ttft = stats["last_ttft"]
+    ttft_text = f"{ttft:.2f}s" if ttft is not None else "n/a"
+    if stats["last_tokens_per_sec"] is not None:
+        rate_text = f"{stats['last_tokens_per_sec']:.1f} tok/s"
+    elif stats["last_chunks_per_sec"] is not None:
+        # 服务器没有返回token用量时只能按流式块计数
+        rate_text = f"{stats['last_chunks_per_sec']:.1f} chunks/s"
+    else:
+        rate_text = "n/a"
+    print(f"\n(time to first token: {ttft_text}, {rate_text})")
+
+def run_terminal_mode(simulator, storage="csv", sample_interval=10.0, analysis_interval=10.0,
+                      llm_policy="event", stream=True):
     """在终端模式下运行"""
+    writer = create_storage_backend(storage)
+    # 流式输出：收到第一个片段时打印标题，之后逐段打印
+    streamed = {"sample": None}
+
+    def print_delta(health_data, delta):
+        if streamed["sample"] is not health_data:
+            streamed["sample"] = health_data
+            print(f"\nAI Coach Analysis ({health_data.timestamp}):")
+        print(delta, end="", flush=True)
+
+    def on_analysis(health_data, response):
+        if streamed["sample"] is health_data:
+            print_stream_stats(pipeline.metrics())
+        else:
+            # 缓存命中或非流式模式，直接打印完整回复
+            print_analysis(health_data, response)
+
+    # 采样按固定节奏运行，LLM分析在同一个事件循环中并发进行
+    pipeline = CoachPipeline(
+        simulator,
+        writer=writer,
+        sample_interval=sample_interval,
+        analysis_interval=analysis_interval,
+        on_sample=lambda health_data: print_sample(simulator, health_data),
+        on_analysis=on_analysis,
+        stream=stream,
+        on_delta=print_delta,
+        cache=CoachResponseCache(),
+        # event模式下只在状态、趋势或阈值变化时调用LLM
+        trigger=TriggerPolicy() if llm_policy == "event" else None,
+        # 本地规则立即报警，不等待LLM
+        alerts=AlertEngine(),
+        on_alert=print_alert,
+    )
     try:
-        while True:
-            health_data = simulator.generate_health_data()
-            
-            save_data_to_csv(health_data)
-        
-            print("\nCurrent Health Data:")
-            print(json.dumps(health_data, indent=2))
-            
-            if len(simulator.data_history) > 1:
-                print("\n=== Historical Data (Last 5 records) ===")
-                
-                recent_history = simulator.data_history[-10:] if len(simulator.data_history) >= 10 else simulator.data_history
-                
-                for i, record in enumerate(recent_history):
-                    print(f"\nRecord {i+1} - {record['timestamp']}:")
-                    print(f"  HR: {record['heart_rate']} bpm | BP: {record['blood_pressure']['systolic']}/{record['blood_pressure']['diastolic']} | SpO2: {record['blood_oxygen']}%")
-                    print(f"  Pace: {record['performance']['pace']:.2f} min/km | Distance: {record['performance']['distance']:.3f} km")
-                
-                print("\n=== Trend Analysis ===")
-                from fetch_llm import analyze_trends
-                trends = analyze_trends(simulator.data_history)
-                
-                print(f"❤️ Heart Rate Trend: {trends['heart_rate_trend']}")
-                print(f"🩺 Blood Pressure Trend: {trends['blood_pressure_trend']}")
-                print(f"🫁 Blood Oxygen Trend: {trends['blood_oxygen_trend']}")
-                print(f"⚡ Pace Trend: {trends['pace_trend']}")
-                print(f"📈 Overall Performance Trend: {trends['performance_trend']}")
-            
-            prompt = analyze_health_data(health_data, simulator.data_history)
-            response = get_llm_response(prompt)
-            
-            print("\nAI Coach Analysis:")
+        run_async(pipeline.run())
+    except KeyboardInterrupt:
+        print("\nProgram stopped")
+        if pipeline.trigger is not None:
+            stats = pipeline.metrics()
+            print(f"LLM calls issued: {stats['llm_calls_issued']}, skipped: {stats['llm_calls_skipped']}")
+    finally:
+        # flush buffered rows before exiting
+        writer.close()
+
+async def run_squad(pipelines, coordinator):
+    try:
+        await asyncio.gather(*(pipeline.run() for pipeline in pipelines))
+    finally:
+        await coordinator.aclose()
+
+def run_squad_mode(n_athletes, storage="csv", sample_interval=10.0, analysis_interval=10.0,
+                   llm_policy="event", batch_mode="combined"):
+    """多名运动员同时监控：各会话的分析请求合并成批发送"""
+    coordinator = LLMBatchCoordinator(mode=batch_mode)
+    cache = CoachResponseCache()
+    writers = []
+    pipelines = []
+    for athlete_id in range(1, n_athletes + 1):
+        writer = create_storage_backend(storage, **session_storage_options(storage, athlete_id))
+        writers.append(writer)
+
+        def on_analysis(health_data, response, athlete_id=athlete_id):
+            print(f"\n[Athlete {athlete_id}] AI Coach Analysis ({health_data.timestamp}):")
             print(response)
-            print("\nWaiting 10 seconds...")
-            time.sleep(10)
+
+        def on_alert(health_data, alert, athlete_id=athlete_id):
+            print(f"\n[Athlete {athlete_id}] ALERT ({health_data.timestamp}): {alert}", flush=True)
+
+        pipelines.append(CoachPipeline(
+            HealthDataSimulator(),
+            writer=writer,
+            sample_interval=sample_interval,
+            analysis_interval=analysis_interval,
+            on_analysis=on_analysis,
+            alerts=AlertEngine(),
+            on_alert=on_alert,
+            llm=coordinator.llm_for(athlete_id),
+            cache=cache,
+            trigger=TriggerPolicy() if llm_policy == "event" else None,
+        ))
+    try:
+        run_async(run_squad(pipelines, coordinator))
+    except KeyboardInterrupt:
+        print("\nProgram stopped")
+        stats = coordinator.stats
+        print(f"Prompts: {stats['prompts']}, batches: {stats['batches']}, LLM requests: {stats['requests']}")
+    finally:
+        for writer in writers:
+            writer.close()
+
+def replay_storage_options(storage):
+    """Replayed samples are written next to, never over, the recordings"""
+    if storage == "parquet":
+        return {"root_dir": "./data/replay/parquet"}
+    return {"csv_path": "./data/replay/data.csv"}
+
+def print_replay_report(pipeline, simulator, elapsed):
+    print(f"\nReplayed {simulator.replayed} records in {elapsed:.2f}s "
+          f"({simulator.replayed / elapsed:.0f} records/sec)")
+    print(f"\n{'Stage':<12}{'count':>10}{'mean (us)':>14}{'max (us)':>14}")
+    for stage, (count, total, longest) in pipeline.timings.items():
+        print(f"{stage:<12}{count:>10}{total / count * 1e6:>14.1f}{longest * 1e6:>14.1f}")
+    stats = pipeline.metrics()
+    print(f"\nAnalyses: {stats['completed']} completed, {stats['errors']} failed, "
+          f"{stats['dropped']} dropped while the LLM was busy")
+    if "llm_calls_issued" in stats:
+        print(f"LLM calls issued: {stats['llm_calls_issued']}, skipped: {stats['llm_calls_skipped']}")
+    print(f"Alerts: {pipeline.alerts.stats['alerts']} ({pipeline.alerts.stats['critical']} critical)")
+    print(f"Invalid records: {stats['invalid']} (not analyzed, {pipeline.writer.rejected} not stored)")
+
+def run_replay_mode(source, kind=None, speed=0.0, storage="csv", analysis_interval=10.0,
+                    llm_policy="event", invalid="keep"):
+    """回放已记录的数据，尽可能快地（或按倍速）通过完整管道"""
+    simulator = ReplaySimulator(source, kind=kind)
+    # speed为0时不等待，按CPU能力全速回放
+    sample_interval = simulator.recorded_interval / speed if speed > 0 else 0.0
+    # 无效记录：保留、丢弃，或写入单独的隔离文件
+    validator = Validator() if invalid != "keep" else None
+    quarantine = None
+    if invalid == "quarantine":
+        quarantine = create_storage_backend("csv", csv_path="./data/replay/quarantine.csv", max_size_mb=None)
+    writer = create_storage_backend(storage, validator=validator, quarantine=quarantine,
+                                    **replay_storage_options(storage))
+    pipeline = CoachPipeline(
+        simulator,
+        writer=writer,
+        sample_interval=sample_interval,
+        analysis_interval=analysis_interval,
+        # 批量回放时保留等待分析的快照，不取消进行中的请求
+        queue_size=100,
+        stale_after=None,
+        on_analysis=print_analysis,
+        cache=CoachResponseCache(),
+        # 触发策略和报警使用记录中的时间，而不是当前时间
+        trigger=TriggerPolicy(clock=simulator.clock) if llm_policy == "event" else None,
+        alerts=AlertEngine(clock=simulator.clock),
+        profile=True,
+    )
+    started = time.perf_counter()
+    try:
+        run_async(pipeline.run())
+    except KeyboardInterrupt:
+        print("\nReplay stopped")
+    finally:
+        writer.close()
+        if quarantine is not None:
+            quarantine.close()
+    print_replay_report(pipeline, simulator, time.perf_counter() - started)
+
+def workout_storage_options(storage, athlete_id):
+    """Generated workouts go to their own directory, one file or session per athlete"""
+    if storage == "parquet":
+        return {"root_dir": "./data/workout/parquet", "session_id": f"athlete-{athlete_id}"}
+    return {"csv_path": f"./data/workout/athlete_{athlete_id}.csv", "max_size_mb": None}
+
+def run_workout_mode(plan, n_athletes=1, storage="csv", seed=0, start="2024-01-01 08:00:00",
+                     interval=1.0):
+    """用模拟时钟快进生成完整的训练课数据，相同的种子得到相同的数据"""
+    plan = WorkoutPlan.parse(plan)
+    start = datetime.fromisoformat(start)
+    started = time.perf_counter()
+    total = 0
+    for athlete_id in range(1, n_athletes + 1):
+        simulator = HealthDataSimulator(clock=SimulatedClock(start), seed=seed + athlete_id)
+        writer = create_storage_backend(storage, flush_interval=None,
+                                        **workout_storage_options(storage, athlete_id))
+        with writer:
+            for phase, sample in simulator.simulate_workout_session(plan, interval=interval):
+                writer.write(sample)
+                total += 1
+    elapsed = time.perf_counter() - started
+    print(f"Generated {total} samples ({n_athletes} x {plan.total_seconds / 60:.0f} min workout) "
+          f"in {elapsed:.2f}s ({total / elapsed:.0f} samples/sec) under ./data/workout/")
+
+def print_session_report(totals):
+    print(f"[{datetime.now():%H:%M:%S}] sessions: {totals['sessions']} on {totals['workers_reporting']} workers | "
+          f"samples: {totals['samples']} | analyses: {totals['completed']} "
+          f"(LLM requests: {totals['llm_requests']}, skipped: {totals['llm_calls_skipped']}) | "
+          f"alerts: {totals['alerts']} | errors: {totals['errors']}", flush=True)
+
+def run_sharded_mode(n_athletes, workers, storage="parquet", sample_interval=10.0,
+                     analysis_interval=10.0, llm_policy="event", batch_mode="combined",
+                     llm_base_url=None):
+    """多进程运行大量运动员会话，每个进程有自己的事件循环和存储"""
+    manager = SessionManager(n_athletes, workers=workers, storage=storage,
+                             sample_interval=sample_interval,
+                             analysis_interval=analysis_interval,
+                             llm_policy=llm_policy, batch_mode=batch_mode,
+                             llm_base_url=llm_base_url)
+    print(f"Starting {n_athletes} sessions on {manager.workers} worker processes (Ctrl+C to stop)")
+    totals = manager.run(on_report=print_session_report)
+    print("\nProgram stopped")
+    print_session_report(totals)
+    if not manager.clean_shutdown:
+        print("Warning: some workers did not confirm their final flush")
+
+def print_ingest_report(metrics):
+    print(f"[{datetime.now():%H:%M:%S}] ingest: {metrics['ingest_rate']:.0f} samples/s "
+          f"({metrics['samples']} total, {metrics['decode_errors']} bad packets, {metrics['rejected']} rejected) | "
+          f"athletes: {metrics['athletes']} | queued: {metrics['queue_depth']} (max {metrics['max_queue_depth']}) | "
+          f"dropped: {metrics['dropped']} | coalesced: {metrics['coalesced']} | "
+          f"processed: {metrics['processed']} | analyses: {metrics['analyses']}", flush=True)
+
+def run_ingest_mode(host="127.0.0.1", tcp_port=9000, http_port=8080, ws_port=None, storage="parquet",
+                    queue_size=64, policy="drop_oldest", history_capacity=300, report_interval=5.0):
+    """接收真实可穿戴设备的数据流，每个运动员一个有界缓冲区和分析管道"""
+    server = IngestServer(host=host, tcp_port=tcp_port, http_port=http_port, ws_port=ws_port,
+                          queue_size=queue_size, policy=policy, storage=storage,
+                          history_capacity=history_capacity)
+    endpoints = [f"{name} port {port}" for name, port in server.ports.items() if port is not None]
+    print(f"Listening on {host}: {', '.join(endpoints)} (Ctrl+C to stop)")
+    try:
+        run_async(server.run(report_interval=report_interval, on_report=print_ingest_report))
     except KeyboardInterrupt:
         print("\nProgram stopped")
 
@@ -60,15 +293,106 @@ def run_ui_mode():
         sys.exit(1)
 
 def main():
-    import argparse
     parser = argparse.ArgumentParser(description='Exercise Monitoring System')
-    parser.add_argument('--mode', type=str, choices=['terminal', 'ui'], 
-                       default='ui', help='Run mode: terminal or ui')
+    parser.add_argument('--mode', type=str, choices=['terminal', 'ui', 'replay', 'workout', 'ingest'], 
+                       default='ui', help='Run mode: terminal, ui, replay, workout (generate workout data) or ingest (receive sensor streams)')
+    parser.add_argument('--storage', type=str, choices=['csv', 'parquet'],
+                       default='csv', help='Storage backend for terminal mode')
+    parser.add_argument('--sample-interval', type=float, default=10.0,
+                       help='Seconds between samples in terminal mode')
+    parser.add_argument('--analysis-interval', type=float, default=10.0,
+                       help='Seconds between AI coach analyses in terminal mode')
+    parser.add_argument('--llm-policy', type=str, choices=['event', 'interval'],
+                       default='event', help='Call the AI coach on changes (event) or every --analysis-interval (interval)')
+    parser.add_argument('--no-stream', action='store_true',
+                       help='Wait for the full AI coach reply instead of streaming it')
+    parser.add_argument('--athletes', type=int, default=1,
+                       help='Number of athletes to monitor in terminal mode')
+    parser.add_argument('--batch-mode', type=str, choices=['combined', 'concurrent'],
+                       default='combined', help='With several athletes: one combined LLM request per batch, or concurrent requests')
+    parser.add_argument('--workers', type=int, default=0,
+                       help='Shard --athletes sessions across this many processes (0 runs everything in one process)')
+    parser.add_argument('--replay-source', type=str, default='./data/data.csv',
+                       help='CSV file or Parquet dataset directory to replay')
+    parser.add_argument('--speed', type=float, default=0.0,
+                       help='Replay speed factor relative to the recording, 0 for as fast as possible')
+    parser.add_argument('--invalid-records', type=str, choices=['keep', 'drop', 'quarantine'],
+                       default='keep', help='Replay mode: store invalid records, drop them, or move them to data/replay/quarantine.csv')
+    parser.add_argument('--workout-plan', type=str, default='warmup:5,running:20,intervals:10,cooldown:5',
+                       help='Workout mode: phase:minutes list, phases are warmup, running, intervals, recovery, cooldown')
+    parser.add_argument('--seed', type=int, default=0,
+                       help='Workout mode: random seed, the same seed generates the same data')
+    parser.add_argument('--start', type=str, default='2024-01-01 08:00:00',
+                       help='Workout mode: timestamp of the first sample')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                       help='Ingest mode: interface to listen on')
+    parser.add_argument('--tcp-port', type=int, default=9000,
+                       help='Ingest mode: port for newline-delimited JSON over TCP (-1 to disable)')
+    parser.add_argument('--http-port', type=int, default=8080,
+                       help='Ingest mode: port for POST /ingest and GET /stats (-1 to disable)')
+    parser.add_argument('--ws-port', type=int, default=-1,
+                       help='Ingest mode: port for the WebSocket endpoint (-1 to disable)')
+    parser.add_argument('--queue-size', type=int, default=64,
+                       help='Ingest mode: samples buffered per athlete')
+    parser.add_argument('--overflow-policy', type=str, choices=OVERFLOW_POLICIES, default='drop_oldest',
+                       help='Ingest mode: what to do when an athlete buffer is full')
+    parser.add_argument('--history-capacity', type=int, default=300,
+                       help='Ingest mode: samples kept in memory per athlete')
+    parser.add_argument('--stub-llm', action='store_true',
+                       help='Answer AI coach requests with a local stub server instead of the real LLM')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                       help='Serve Prometheus metrics on http://127.0.0.1:PORT/metrics (0 to disable)')
     args = parser.parse_args()
-    
-    if args.mode == 'terminal':
+
+    if args.metrics_port:
+        if args.mode == 'ui':
+            # the Streamlit process enables metrics itself, see ui.py
+            os.environ[instrumentation.METRICS_PORT_ENV] = str(args.metrics_port)
+        else:
+            instrumentation.enable(port=args.metrics_port)
+
+    base_url = None
+    if args.stub_llm:
+        _, base_url = start_stub_server()
+        configure_llm_client(base_url=base_url)
+
+    if args.mode == 'ingest':
+        run_ingest_mode(host=args.host,
+                        tcp_port=args.tcp_port if args.tcp_port >= 0 else None,
+                        http_port=args.http_port if args.http_port >= 0 else None,
+                        ws_port=args.ws_port if args.ws_port >= 0 else None,
+                        storage=args.storage,
+                        queue_size=args.queue_size,
+                        policy=args.overflow_policy,
+                        history_capacity=args.history_capacity)
+    elif args.mode == 'workout':
+        run_workout_mode(args.workout_plan, n_athletes=args.athletes, storage=args.storage,
+                         seed=args.seed, start=args.start)
+    elif args.mode == 'replay':
+        run_replay_mode(args.replay_source, speed=args.speed, storage=args.storage,
+                        analysis_interval=args.analysis_interval,
+                        llm_policy=args.llm_policy,
+                        invalid=args.invalid_records)
+    elif args.mode == 'terminal' and args.workers > 0:
+        run_sharded_mode(args.athletes, args.workers, storage=args.storage,
+                         sample_interval=args.sample_interval,
+                         analysis_interval=args.analysis_interval,
+                         llm_policy=args.llm_policy,
+                         batch_mode=args.batch_mode,
+                         llm_base_url=base_url)
+    elif args.mode == 'terminal' and args.athletes > 1:
+        run_squad_mode(args.athletes, storage=args.storage,
+                       sample_interval=args.sample_interval,
+                       analysis_interval=args.analysis_interval,
+                       llm_policy=args.llm_policy,
+                       batch_mode=args.batch_mode)
+    elif args.mode == 'terminal':
         simulator = HealthDataSimulator()
-        run_terminal_mode(simulator)
+        run_terminal_mode(simulator, storage=args.storage,
+                          sample_interval=args.sample_interval,
+                          analysis_interval=args.analysis_interval,
+                          llm_policy=args.llm_policy,
+                          stream=not args.no_stream)
     else:
         run_ui_mode()
 
@@ -0,0 +1,156 @@
+import os
+import string
+from functools import lru_cache
+from operator import attrgetter
+from pathlib import Path
+
+from records import SAMPLE_FIELDS, HealthSample
+
+try:
+    import tiktoken
+except ImportError:  # token counts fall back to an estimate
+    tiktoken = None
+
+TEMPLATE_DIR = Path(__file__).parent / "prompt_templates"
+
+# template name -> version used by default, override with LLM_PROMPT_<NAME>=<version>
+DEFAULT_VERSIONS = {
+    "system": "v1",
+    "exercise_analysis": "v2",
+}
+
+# placeholders a template may use besides the sample fields
+TREND_PLACEHOLDERS = ("heart_rate_trend", "blood_pressure_trend", "blood_oxygen_trend",
+                      "pace_trend", "performance_trend")
+
+TOKEN_ENCODING = "cl100k_base"
+
+
+class PromptTemplate:
+    """
+    Template parsed once into literal text and field lookups
+
+    Placeholders are sample field names (see records.SAMPLE_FIELDS) or
+    trend labels (TREND_PLACEHOLDERS), optionally with a format spec,
+    e.g. "{pace:.2f}". Unknown placeholders are rejected at load time.
+    render() reads attributes straight off a HealthSample.
+
+    parameters:
+        text (str): template text in str.format syntax
+        name (str): template name, used in error messages
+        version (str): template version
+    """
+
+    def __init__(self, text, name="", version=""):
+        self.text = text
+        self.name = name
+        self.version = version
+        self._parts = []
+        self.fields = []
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            if field is None:
+                self._parts.append((literal, None, None, None))
+                continue
+            if conversion:
+                raise ValueError(f"Template {name} {version}: conversions are not supported ({{{field}!{conversion}}})")
+            if field in SAMPLE_FIELDS:
+                source, lookup = "sample", attrgetter(field)
+            elif field in TREND_PLACEHOLDERS:
+                source, lookup = "trends", field
+            else:
+                raise ValueError(f"Template {name} {version}: unknown placeholder {{{field}}}")
+            self._parts.append((literal, source, lookup, spec))
+            self.fields.append(field)
+
+    @property
+    def is_static(self):
+        """True if the template has no placeholders"""
+        return not self.fields
+
+    def render(self, sample=None, trends=None):
+        """Fill the template from a HealthSample (or health data dict) and trend labels"""
+        if sample is not None:
+            sample = HealthSample.from_dict(sample)
+        pieces = []
+        for literal, source, lookup, spec in self._parts:
+            pieces.append(literal)
+            if source is None:
+                continue
+            value = lookup(sample) if source == "sample" else trends[lookup]
+            pieces.append(format(value, spec) if spec else str(value))
+        return "".join(pieces)
+
+
+@lru_cache(maxsize=None)
+def load_template(name, version=None):
+    """
+    Load and validate prompt_templates/<name>.<version>.txt once
+
+    The version defaults to LLM_PROMPT_<NAME> from the environment or
+    DEFAULT_VERSIONS.
+    """
+    if version is None:
+        version = os.environ.get(f"LLM_PROMPT_{name.upper()}", DEFAULT_VERSIONS.get(name, "v1"))
+    path = TEMPLATE_DIR / f"{name}.{version}.txt"
+    if not path.exists():
+        raise ValueError(f"No prompt template {name} version {version} ({path})")
+    return PromptTemplate(path.read_text(encoding="utf-8"), name, version)
+
+
+def get_system_message(version=None):
+    """The system message text, identical for every request so its prefix can be cached"""
+    return load_template("system", version).text
+
+
+def render_analysis_prompt(sample, trends, version=None):
+    """Exercise analysis prompt for one sample and its trend labels"""
+    return load_template("exercise_analysis", version).render(sample, trends)
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception:
+        # the encoding file is downloaded on first use, which fails offline
+        return None
+
+
+def count_tokens(text):
+    """
+    Number of tokens in text
+
+    Uses the tiktoken cl100k_base encoding, which is close to but not
+    exactly the serving model's tokenizer. Without tiktoken (or its
+    encoding file) it falls back to an estimate of 4 characters per token.
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+@lru_cache(maxsize=16)
+def _count_static_tokens(text):
+    return count_tokens(text)
+
+
+def prompt_token_count(prompt, system_message=None):
+    """Tokens of the user prompt plus the (cached) system message count"""
+    if system_message is None:
+        system_message = get_system_message()
+    return _count_static_tokens(system_message) + count_tokens(prompt)
+
+
+def check_prompt_budget(prompt, max_tokens, system_message=None):
+    """
+    Raise ValueError if the prompt is over budget
+
+    Returns: the token count
+    """
+    tokens = prompt_token_count(prompt, system_message)
+    if max_tokens is not None and tokens > max_tokens:
+        raise ValueError(f"Prompt is {tokens} tokens, over the budget of {max_tokens}")
+    return tokens
@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# flat field order shared by CSV rows, Parquet columns and HealthSample
+SAMPLE_FIELDS = (
+    "timestamp",
+    "heart_rate",
+    "blood_pressure_systolic",
+    "blood_pressure_diastolic",
+    "blood_oxygen",
+    "pace",
+    "stride",
+    "cadence",
+    "duration",
+    "distance",
+    "calories",
+    "altitude",
+    "temperature",
+    "pressure",
+    "humidity",
+    "status",
+)
+
+# how timestamps are written everywhere (CSV, Parquet partitions, prompts)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# NumPy dtypes for struct-of-arrays batches (see BatchHealthSimulator)
+COLUMN_DTYPES = {
+    "timestamp": "datetime64[s]",
+    "heart_rate": np.int16,
+    "blood_pressure_systolic": np.int16,
+    "blood_pressure_diastolic": np.int16,
+    "blood_oxygen": np.float64,
+    "pace": np.float64,
+    "stride": np.float64,
+    "cadence": np.int16,
+    "duration": np.float64,
+    "distance": np.float64,
+    "calories": np.float64,
+    "altitude": np.int16,
+    "temperature": np.float64,
+    "pressure": np.int16,
+    "humidity": np.int16,
+    "status": "U8",
+}
+
+# nested layout of the original health data dicts
+_NESTED = {
+    "blood_pressure": (("systolic", "blood_pressure_systolic"),
+                       ("diastolic", "blood_pressure_diastolic")),
+    "performance": (("pace", "pace"), ("stride", "stride"), ("cadence", "cadence"),
+                    ("duration", "duration"), ("distance", "distance"),
+                    ("calories", "calories")),
+    "environment": (("altitude", "altitude"), ("temperature", "temperature"),
+                    ("pressure", "pressure"), ("humidity", "humidity")),
+}
+
+
+class HealthSample:
+    """
+    Compact flat record for one health data sample
+
+    Uses __slots__ instead of three levels of nested dicts. Supports
+    read-only dict-style access, including the nested keys
+    ("blood_pressure", "performance", "environment"), so code written
+    against generate_health_data dicts keeps working. Use to_dict() where
+    a real dict is needed (e.g. json.dumps).
+    """
+
+    __slots__ = SAMPLE_FIELDS
+
+    def __init__(self, timestamp, heart_rate, blood_pressure_systolic,
+                 blood_pressure_diastolic, blood_oxygen, pace, stride, cadence,
+                 duration, distance, calories, altitude, temperature, pressure,
+                 humidity, status="normal"):
+        self.timestamp = timestamp
+        self.heart_rate = heart_rate
+        self.blood_pressure_systolic = blood_pressure_systolic
+        self.blood_pressure_diastolic = blood_pressure_diastolic
+        self.blood_oxygen = blood_oxygen
+        self.pace = pace
+        self.stride = stride
+        self.cadence = cadence
+        self.duration = duration
+        self.distance = distance
+        self.calories = calories
+        self.altitude = altitude
+        self.temperature = temperature
+        self.pressure = pressure
+        self.humidity = humidity
+        self.status = status
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a sample from a nested health data dict"""
+        if isinstance(data, cls):
+            return data
+        blood_pressure = data["blood_pressure"]
+        performance = data["performance"]
+        environment = data["environment"]
+        return cls(
+            data["timestamp"],
+            data["heart_rate"],
+            blood_pressure["systolic"],
+            blood_pressure["diastolic"],
+            data["blood_oxygen"],
+            performance["pace"],
+            performance["stride"],
+            performance["cadence"],
+            performance["duration"],
+            performance["distance"],
+            performance["calories"],
+            environment["altitude"],
+            environment["temperature"],
+            environment["pressure"],
+            environment["humidity"],
+            data["status"],
+        )
+
+    def as_tuple(self):
+        """Field values in SAMPLE_FIELDS order"""
+        return (self.timestamp, self.heart_rate, self.blood_pressure_systolic,
+                self.blood_pressure_diastolic, self.blood_oxygen, self.pace,
+                self.stride, self.cadence, self.duration, self.distance,
+                self.calories, self.altitude, self.temperature, self.pressure,
+                self.humidity, self.status)
+
+    def to_row(self):
+        """Flat dict keyed by SAMPLE_FIELDS"""
+        return dict(zip(SAMPLE_FIELDS, self.as_tuple()))
+
+    def to_dict(self):
+        """Nested dict in the original generate_health_data format"""
+        return {
+            "timestamp": self.timestamp,
+            "heart_rate": self.heart_rate,
+            "blood_pressure": self["blood_pressure"],
+            "blood_oxygen": self.blood_oxygen,
+            "performance": self["performance"],
+            "environment": self["environment"],
+            "status": self.status
+        }
+
+    def __getitem__(self, key):
+        nested = _NESTED.get(key)
+        if nested is not None:
+            return {name: getattr(self, field) for name, field in nested}
+        if key in SAMPLE_FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in _NESTED or key in SAMPLE_FIELDS
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        if not isinstance(other, HealthSample):
+            return NotImplemented
+        return self.as_tuple() == other.as_tuple()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={value!r}" for name, value in zip(SAMPLE_FIELDS, self.as_tuple()))
+        return f"HealthSample({fields})"
+
+
+def to_sample_tuple(data):
+    """Flat SAMPLE_FIELDS tuple from a HealthSample or a nested dict"""
+    if isinstance(data, HealthSample):
+        return data.as_tuple()
+    return HealthSample.from_dict(data).as_tuple()
+
+
+def samples_to_columns(samples):
+    """
+    Convert a sequence of samples into typed struct-of-arrays columns
+
+    Returns: dict of contiguous NumPy arrays keyed by SAMPLE_FIELDS
+    """
+    rows = [to_sample_tuple(sample) for sample in samples]
+    if not rows:
+        return {name: np.empty(0, dtype=COLUMN_DTYPES[name]) for name in SAMPLE_FIELDS}
+    return {
+        name: np.array(values, dtype=COLUMN_DTYPES[name])
+        for name, values in zip(SAMPLE_FIELDS, zip(*rows))
+    }
+
+
+def columns_to_samples(columns):
+    """Convert struct-of-arrays columns back into HealthSample objects"""
+    values = [columns[name].tolist() for name in SAMPLE_FIELDS[1:]]
+    timestamps = np.datetime_as_string(np.asarray(columns["timestamp"], dtype="datetime64[s]"), unit="s")
+    return [
+        HealthSample(timestamp.replace("T", " ") if timestamp != "NaT" else timestamp, *row)
+        for timestamp, row in zip(timestamps.tolist(), zip(*values))
+    ]
+
+
+def columns_to_arrow(columns):
+    """
+    Wrap struct-of-arrays columns in an Arrow table
+
+    Numeric columns are contiguous NumPy buffers without nulls, so Arrow
+    reuses their memory instead of copying. The status strings are
+    dictionary-encoded.
+    """
+    arrays = []
+    for name in SAMPLE_FIELDS:
+        column = np.asarray(columns[name])
+        if name == "status":
+            arrays.append(pa.array(column.astype(object)).dictionary_encode())
+        else:
+            arrays.append(pa.array(np.ascontiguousarray(column)))
+    return pa.Table.from_arrays(arrays, names=list(SAMPLE_FIELDS))
+
+
+def columns_to_dataframe(columns):
+    """Wrap struct-of-arrays columns in a DataFrame without copying numeric data"""
+    frame = pd.DataFrame({name: columns[name] for name in SAMPLE_FIELDS}, copy=False)
+    frame["status"] = frame["status"].astype("category")
+    return frame
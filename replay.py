@@ -0,0 +1,132 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as pads
+
+from data_storage import list_segments
+from records import SAMPLE_FIELDS, TIMESTAMP_FORMAT, columns_to_samples
+from terminal import HealthDataSimulator
+
+
+def replay_sources(path, include_segments=True):
+    """
+    Files to replay for a CSV path, oldest first
+
+    With include_segments the rotated (and possibly compressed) segments
+    of path are replayed before the active file.
+    """
+    sources = list_segments(path) if include_segments else []
+    if os.path.isfile(path):
+        sources.append(path)
+    return sources
+
+
+def _frame_to_columns(frame):
+    frame = frame.dropna(subset=list(SAMPLE_FIELDS))
+    columns = {name: frame[name].to_numpy() for name in SAMPLE_FIELDS}
+    # a malformed timestamp becomes NaT and is reported by the validator
+    timestamps = frame["timestamp"]
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps, format=TIMESTAMP_FORMAT, errors="coerce")
+    columns["timestamp"] = timestamps.to_numpy().astype("datetime64[s]")
+    columns["status"] = frame["status"].astype(str).to_numpy()
+    return columns
+
+
+class ReplaySimulator(HealthDataSimulator):
+    """
+    Plays recorded samples back through the HealthDataSimulator interface
+
+    Reads a CSV file (plus its rotated segments) or a Parquet dataset in
+    chunks, so sessions of any length replay in constant memory. Each
+    chunk is validated at once with Validator.validate_columns; every
+    sample then goes through the same trend and history updates as a
+    generated one. generate_health_data() returns None once the recording
+    is exhausted.
+
+    parameters:
+        source (str): CSV path or Parquet dataset directory
+        kind (str): "csv" or "parquet", guessed from source when None
+        chunk_size (int): rows read at a time
+        include_segments (bool): also replay rotated CSV segments
+        **kwargs: passed to HealthDataSimulator
+    """
+
+    def __init__(self, source, kind=None, chunk_size=10_000, include_segments=True, **kwargs):
+        super().__init__(**kwargs)
+        if kind is None:
+            kind = "parquet" if os.path.isdir(source) or source.endswith(".parquet") else "csv"
+        if kind not in ("csv", "parquet"):
+            raise ValueError(f"Unknown replay source kind: {kind}")
+        self.source = source
+        self.kind = kind
+        self.chunk_size = chunk_size
+        self.include_segments = include_segments
+
+        self.replayed = 0
+        self.current_time = None    # recorded timestamp of the last sample, epoch seconds
+        self._chunks = self._iter_columns()
+        self._samples = iter(())
+        self._times = iter(())
+        self._violations = iter(())
+        self._first = next(self._chunks, None)
+        # median seconds between recorded samples in the first chunk
+        self.recorded_interval = self._median_interval(self._first)
+
+    def _iter_columns(self):
+        if self.kind == "parquet":
+            dataset = pads.dataset(self.source, format="parquet", partitioning="hive")
+            for batch in dataset.to_batches(columns=list(SAMPLE_FIELDS), batch_size=self.chunk_size):
+                yield _frame_to_columns(batch.to_pandas())
+            return
+        sources = replay_sources(self.source, self.include_segments)
+        if not sources:
+            raise ValueError(f"Nothing to replay at {self.source}")
+        for path in sources:
+            for frame in pd.read_csv(path, chunksize=self.chunk_size):
+                yield _frame_to_columns(frame)
+
+    @staticmethod
+    def _median_interval(columns):
+        if columns is None or len(columns["timestamp"]) < 2:
+            return 1.0
+        gaps = np.diff(columns["timestamp"].astype("int64"))
+        gaps = gaps[gaps > 0]
+        return float(np.median(gaps)) if len(gaps) else 1.0
+
+    def clock(self):
+        """Recorded time of the current sample, for trigger policies and alert engines"""
+        return self.current_time if self.current_time is not None else 0.0
+
+    def _next_chunk(self):
+        if self._first is not None:
+            columns, self._first = self._first, None
+        else:
+            columns = next(self._chunks, None)
+        if columns is None:
+            return False
+        self._samples = iter(columns_to_samples(columns))
+        self._times = iter(columns["timestamp"].astype("int64").tolist())
+        # violations per row, validated for the whole chunk at once
+        violations = [[] for _ in range(len(columns["timestamp"]))]
+        for violation in self.validator.validate_columns(columns).violations(columns):
+            violations[violation.index].append(violation)
+        self._violations = iter(violations)
+        return True
+
+    def generate_health_data(self):
+        """
+        Next recorded sample
+
+        Returns: HealthSample, or None when the recording is exhausted
+        """
+        data = next(self._samples, None)
+        while data is None:
+            if not self._next_chunk():
+                return None
+            data = next(self._samples, None)
+        self.current_time = float(next(self._times))
+        self.record(data, next(self._violations))
+        self.replayed += 1
+        return data
@@ -0,0 +1,267 @@
+import os
+import time
+import queue
+import signal
+import asyncio
+import multiprocessing
+from contextlib import suppress
+
+from alerts import AlertEngine
+from coach_pipeline import CoachPipeline
+from data_storage import create_storage_backend
+from fetch_llm import configure_llm_client, run_async
+from llm_batch import LLMBatchCoordinator
+from llm_cache import CoachResponseCache
+from terminal import HealthDataSimulator
+from trigger_policy import TriggerPolicy
+
+# pipeline counters that are summed across sessions and workers
+SUMMED_STATS = ("samples", "snapshots", "dropped", "cancelled", "completed", "errors",
+                "llm_calls_issued", "llm_calls_skipped")
+
+# how often a worker checks the stop flag, in seconds
+STOP_POLL_INTERVAL = 0.2
+
+
+def session_storage_options(storage, athlete_id):
+    """One Parquet session (or CSV file) per athlete"""
+    if storage == "parquet":
+        return {"session_id": f"athlete-{athlete_id}"}
+    return {"csv_path": f"./data/athlete_{athlete_id}.csv"}
+
+
+def _worker_metrics(worker_id, pipelines, coordinator, final=False):
+    metrics = dict.fromkeys(SUMMED_STATS, 0)
+    alerts = 0
+    for pipeline in pipelines:
+        stats = pipeline.metrics()
+        for key in SUMMED_STATS:
+            metrics[key] += stats.get(key, 0)
+        alerts += pipeline.alerts.stats["alerts"]
+    metrics.update({
+        "worker": worker_id,
+        "pid": os.getpid(),
+        "sessions": len(pipelines),
+        "alerts": alerts,
+        "llm_requests": coordinator.stats["requests"],
+        "final": final,
+    })
+    return metrics
+
+
+def _flush_writers(writers):
+    for writer in writers:
+        writer.flush()
+
+
+async def _run_staggered(pipeline, delay, stopping):
+    # spread session start times so samples do not arrive in lockstep
+    with suppress(asyncio.TimeoutError):
+        await asyncio.wait_for(stopping.wait(), delay)
+    if stopping.is_set():
+        return
+    await pipeline.run()
+
+
+async def _run_worker(worker_id, athlete_ids, config, stop_event, metrics_queue):
+    coordinator = LLMBatchCoordinator(mode=config["batch_mode"])
+    cache = CoachResponseCache()
+    writers = []
+    pipelines = []
+    for athlete_id in athlete_ids:
+        # no per-writer flush thread, the worker flushes all writers itself
+        writer = create_storage_backend(config["storage"], flush_interval=None,
+                                        **session_storage_options(config["storage"], athlete_id))
+        writers.append(writer)
+        pipelines.append(CoachPipeline(
+            HealthDataSimulator(history_capacity=config["history_capacity"]),
+            writer=writer,
+            sample_interval=config["sample_interval"],
+            analysis_interval=config["analysis_interval"],
+            llm=coordinator.llm_for(athlete_id),
+            cache=cache,
+            trigger=TriggerPolicy() if config["llm_policy"] == "event" else None,
+            alerts=AlertEngine(),
+        ))
+
+    stopping = asyncio.Event()
+    spread = config["sample_interval"] / max(len(pipelines), 1)
+    tasks = [asyncio.create_task(_run_staggered(pipeline, i * spread, stopping))
+             for i, pipeline in enumerate(pipelines)]
+    flushing = None
+    try:
+        next_report = time.monotonic() + config["report_interval"]
+        next_flush = time.monotonic() + config["flush_interval"]
+        while not stop_event.is_set():
+            await asyncio.sleep(STOP_POLL_INTERVAL)
+            now = time.monotonic()
+            # flush in the background so the stop flag is still checked on time
+            if now >= next_flush and (flushing is None or flushing.done()):
+                flushing = asyncio.create_task(asyncio.to_thread(_flush_writers, writers))
+                next_flush = now + config["flush_interval"]
+            if now >= next_report:
+                metrics_queue.put(_worker_metrics(worker_id, pipelines, coordinator))
+                next_report = now + config["report_interval"]
+    finally:
+        stopping.set()
+        for pipeline in pipelines:
+            pipeline.stop()
+        if flushing is not None:
+            tasks.append(flushing)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await coordinator.aclose()
+        for writer in writers:
+            writer.close()
+        cache.close()
+    # only sent once every writer has been flushed and closed
+    metrics_queue.put(_worker_metrics(worker_id, pipelines, coordinator, final=True))
+
+
+def _worker_main(worker_id, athlete_ids, config, stop_event, metrics_queue):
+    # Ctrl+C goes to the whole process group; the manager decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if config["llm_base_url"]:
+        configure_llm_client(base_url=config["llm_base_url"])
+    run_async(_run_worker(worker_id, athlete_ids, config, stop_event, metrics_queue))
+
+
+class SessionManager:
+    """
+    Runs many athlete sessions sharded across a process pool
+
+    Athletes are dealt round-robin to `workers` processes. Each worker
+    owns its simulators, trend state and storage writers, and runs all
+    its sessions as CoachPipelines on one event loop with a shared
+    LLMBatchCoordinator and response cache. Workers send their summed
+    counters every `report_interval` seconds. stop() asks them to stop,
+    waits until every writer is flushed and closed, and only terminates
+    a worker that does not finish within the timeout.
+
+    Use Parquet storage for large session counts: CSV keeps one open file
+    per athlete.
+
+    parameters:
+        n_sessions (int): number of athlete sessions
+        workers (int): worker processes, defaults to the CPU count
+        storage (str): "parquet" or "csv"
+        sample_interval (float): seconds between samples per session
+        analysis_interval (float): seconds between analyses with the interval policy
+        llm_policy (str): "event" or "interval"
+        batch_mode (str): "combined" or "concurrent", see LLMBatchCoordinator
+        report_interval (float): seconds between metric reports
+        flush_interval (float): seconds between storage flushes in each worker
+        history_capacity (int): samples kept in memory per session
+        llm_base_url (str): point workers at another OpenAI-compatible server
+    """
+
+    def __init__(self, n_sessions, workers=None, storage="parquet", sample_interval=1.0,
+                 analysis_interval=10.0, llm_policy="event", batch_mode="combined",
+                 report_interval=5.0, flush_interval=30.0, history_capacity=300,
+                 llm_base_url=None):
+        self.n_sessions = n_sessions
+        self.workers = max(1, min(workers or os.cpu_count() or 1, n_sessions))
+        self.report_interval = report_interval
+        self.config = {
+            "storage": storage,
+            "sample_interval": sample_interval,
+            "analysis_interval": analysis_interval,
+            "llm_policy": llm_policy,
+            "batch_mode": batch_mode,
+            "report_interval": report_interval,
+            "flush_interval": flush_interval,
+            "history_capacity": history_capacity,
+            "llm_base_url": llm_base_url,
+        }
+
+        # spawn, so workers do not inherit threads (writer flushers, HTTP pools) from the parent
+        self._context = multiprocessing.get_context("spawn")
+        self._stop_event = None
+        self._queue = None
+        self._processes = []
+        self.worker_metrics = {}
+
+    def shards(self):
+        """Athlete ids per worker"""
+        athlete_ids = list(range(1, self.n_sessions + 1))
+        return [athlete_ids[worker::self.workers] for worker in range(self.workers)]
+
+    def start(self):
+        self._stop_event = self._context.Event()
+        self._queue = self._context.Queue()
+        for worker_id, athlete_ids in enumerate(self.shards()):
+            process = self._context.Process(
+                target=_worker_main,
+                args=(worker_id, athlete_ids, self.config, self._stop_event, self._queue),
+                name=f"coach-worker-{worker_id}",
+            )
+            process.start()
+            self._processes.append(process)
+
+    def poll(self, timeout=0.0):
+        """Collect pending worker reports, waiting up to `timeout` seconds for the first"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                metrics = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return
+            self.worker_metrics[metrics["worker"]] = metrics
+            deadline = 0
+
+    def aggregate(self):
+        """Counters summed over the latest report of every worker"""
+        totals = dict.fromkeys(SUMMED_STATS + ("sessions", "alerts", "llm_requests"), 0)
+        for metrics in self.worker_metrics.values():
+            for key in totals:
+                totals[key] += metrics[key]
+        totals["workers_reporting"] = len(self.worker_metrics)
+        return totals
+
+    @property
+    def clean_shutdown(self):
+        """True once every worker has confirmed that its writers are flushed"""
+        return (len(self.worker_metrics) == self.workers
+                and all(metrics["final"] for metrics in self.worker_metrics.values()))
+
+    def stop(self, timeout=30.0):
+        """Ask workers to stop, wait for their final flush, terminate stragglers"""
+        if self._stop_event is None:
+            return
+        self._stop_event.set()
+        deadline = time.monotonic() + timeout
+        # keep draining the queue, a worker cannot exit while its reports are unread
+        while any(process.is_alive() for process in self._processes) and time.monotonic() < deadline:
+            self.poll(timeout=0.1)
+            for process in self._processes:
+                process.join(timeout=0)
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self.poll()
+        self._processes = []
+
+    def run(self, duration=None, on_report=None):
+        """
+        Start the workers and report until `duration` passes or Ctrl+C
+
+        parameters:
+            on_report (callable): called with aggregate() every report_interval
+        """
+        self.start()
+        started = time.monotonic()
+        next_report = started + self.report_interval
+        try:
+            while duration is None or time.monotonic() - started < duration:
+                self.poll(timeout=max(0.0, next_report - time.monotonic()))
+                if time.monotonic() >= next_report:
+                    next_report += self.report_interval
+                    if on_report is not None and self.worker_metrics:
+                        on_report(self.aggregate())
+                if not any(process.is_alive() for process in self._processes):
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+        return self.aggregate()
@@ -1,10 +1,111 @@
+import math
+import bisect
 import random
+import numpy as np
 import time
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+from trends import TrendTracker
+from records import TIMESTAMP_FORMAT, HealthSample, columns_to_samples
+from history import HistoryBuffer
+from validation import Validator
+import instrumentation
+
+DEFAULT_VALIDATOR = Validator()
+
+# workout phase -> (target heart rate zone in bpm, pace in min/km)
+WORKOUT_PHASES = {
+    "warmup": ((95, 125), 7.5),
+    "running": ((140, 160), 6.0),
+    "intervals": ((165, 180), 4.5),
+    "recovery": ((115, 135), 7.5),
+    "cooldown": ((95, 115), 8.0),
+}
+# an "intervals" phase alternates work bouts with recovery jogs, in seconds
+INTERVAL_WORK_SECONDS = 60
+INTERVAL_RECOVERY_SECONDS = 60
+# seconds for the heart rate to cover ~63% of the gap to a new target
+HEART_RATE_RESPONSE = 30.0
+
+
+class SimulatedClock:
+    """
+    Clock that only moves when advanced
+
+    Call it like datetime.now. Passing one to HealthDataSimulator lets a
+    workout session run as fast as the CPU allows with realistic timestamps.
+
+    parameters:
+        start (datetime): time of the first sample, defaults to now
+    """
+
+    def __init__(self, start=None):
+        self.current = (start or datetime.now()).replace(microsecond=0)
+
+    def __call__(self):
+        return self.current
+
+    def advance(self, seconds):
+        self.current += timedelta(seconds=seconds)
+
+
+class WorkoutPlan:
+    """
+    Sequence of timed workout phases
+
+    parameters:
+        phases (list): (phase, minutes) pairs, phase one of WORKOUT_PHASES, e.g.
+            [("warmup", 5), ("intervals", 10), ("cooldown", 5)]
+    """
+
+    def __init__(self, phases):
+        if not phases:
+            raise ValueError("A workout plan needs at least one phase")
+        self.phases = []
+        self._ends = []
+        total = 0.0
+        for name, minutes in phases:
+            if name not in WORKOUT_PHASES:
+                raise ValueError(f"Unknown workout phase: {name}")
+            if minutes <= 0:
+                raise ValueError(f"Phase {name} must last more than 0 minutes")
+            self.phases.append((name, minutes))
+            total += minutes * 60
+            self._ends.append(total)
+        self.total_seconds = total
+
+    @classmethod
+    def parse(cls, text):
+        """Plan from text like "warmup:5,running:20,cooldown:5" """
+        phases = []
+        for item in text.split(","):
+            name, _, minutes = item.strip().partition(":")
+            phases.append((name, float(minutes)))
+        return cls(phases)
+
+    def phase_at(self, elapsed):
+        """
+        Phase active `elapsed` seconds into the workout
+
+        Returns: (phase, (low, high) heart rate zone, pace), or None once the plan is over
+        """
+        index = bisect.bisect_right(self._ends, elapsed)
+        if index == len(self._ends):
+            return None
+        name = self.phases[index][0]
+        if name == "intervals":
+            started = self._ends[index - 1] if index else 0.0
+            cycle = INTERVAL_WORK_SECONDS + INTERVAL_RECOVERY_SECONDS
+            if (elapsed - started) % cycle >= INTERVAL_WORK_SECONDS:
+                zone, pace = WORKOUT_PHASES["recovery"]
+                return "intervals", zone, pace
+        zone, pace = WORKOUT_PHASES[name]
+        return name, zone, pace
+
 
 class HealthDataSimulator:
-    def __init__(self):
+    def __init__(self, trend_window=10, history_capacity=1000, downsample_bucket=None,
+                 clock=None, seed=None, validator=None):
         # Basic physiological data
         self.base_heart_rate = 75
         self.base_blood_pressure_systolic = 120
@@ -29,97 +130,328 @@ class HealthDataSimulator:
         
         self.abnormal_probability = 0.1
 
-        self.data_history = []
-        self.max_history = 10  # store last 10 records
+        # time source for sample timestamps (datetime.now or a SimulatedClock)
+        # and the seconds of exercise each sample stands for
+        self.sample_clock = clock or datetime.now
+        self.sample_seconds = 1.0
+        # own random stream for reproducible sessions, the global one otherwise
+        self.random = random.Random(seed) if seed is not None else random
 
-    def generate_performance_data(self):
-        """Generate exercise performance data"""
-        pace = round(self.base_pace + random.uniform(-1, 1), 2)
-        stride = round(self.base_stride + random.uniform(-0.1, 0.1), 2)
-        cadence = round(self.base_cadence + random.uniform(-10, 10))
+        # compiled rule table, shared by every simulator unless one is passed in
+        self.validator = validator or DEFAULT_VALIDATOR
+        self.last_violations = []
+
+        # set during a workout session: the heart rate the current phase aims for
+        self.target_heart_rate = None
+        self.heart_rate_level = self.base_heart_rate
+
+        # preallocated ring buffer, the oldest records are overwritten in place
+        self.max_history = history_capacity
+        self.data_history = HistoryBuffer(capacity=history_capacity,
+                                          downsample_bucket=downsample_bucket)
+
+        # rolling trend statistics, updated once per generated sample
+        self.trend_tracker = TrendTracker(window=trend_window)
+
+    def _next_performance(self):
+        """Advance the cumulative data and return the performance values as a tuple"""
+        pace = round(self.base_pace + self.random.uniform(-1, 1), 2)
+        stride = round(self.base_stride + self.random.uniform(-0.1, 0.1), 2)
+        cadence = round(self.base_cadence + self.random.uniform(-10, 10))
         
         # Update cumulative data
-        self.exercise_duration += 1/60  # add 1 second each update
-        distance_delta = (1000/pace)/60  # distance moved per second
+        self.exercise_duration += self.sample_seconds / 60  # sample_seconds each update
+        distance_delta = (1000/pace)/60 * self.sample_seconds  # distance moved since the last update
         self.total_distance = round(self.total_distance + distance_delta/1000, 3)
-        self.calories_burned = round(self.calories_burned + random.uniform(0.1, 0.2), 1)
+        self.calories_burned = round(self.calories_burned + self.random.uniform(0.1, 0.2) * self.sample_seconds, 1)
         
-        return {
-            "pace": pace,
-            "stride": stride,
-            "cadence": cadence,
-            "duration": round(self.exercise_duration, 2),
-            "distance": self.total_distance,
-            "calories": self.calories_burned
-        }
+        return (pace, stride, cadence, round(self.exercise_duration, 2),
+                self.total_distance, self.calories_burned)
+
+    def _next_environment(self):
+        return (
+            round(self.base_altitude + self.random.uniform(-5, 5)),
+            round(self.base_temperature + self.random.uniform(-1, 1), 1),
+            round(self.base_pressure + self.random.uniform(-5, 5)),
+            round(self.base_humidity + self.random.uniform(-5, 5))
+        )
+
+    def generate_performance_data(self):
+        """Generate exercise performance data"""
+        return dict(zip(("pace", "stride", "cadence", "duration", "distance", "calories"),
+                        self._next_performance()))
 
     def generate_environmental_data(self):
         """生成环境数据"""
-        return {
-            "altitude": round(self.base_altitude + random.uniform(-5, 5)),
-            "temperature": round(self.base_temperature + random.uniform(-1, 1), 1),
-            "pressure": round(self.base_pressure + random.uniform(-5, 5)),
-            "humidity": round(self.base_humidity + random.uniform(-5, 5))
-        }
+        return dict(zip(("altitude", "temperature", "pressure", "humidity"),
+                        self._next_environment()))
 
     def generate_health_data(self):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Adjust physiological data based on exercise duration
-        exercise_factor = min(self.exercise_duration / 30, 1)  # max intensity at 30 minutes
-        hr_adjustment = 40 * exercise_factor  # max increase of 40bpm
-        
-        heart_rate = round(self.base_heart_rate + hr_adjustment + random.uniform(-10, 10))
-        blood_pressure = {
-            "systolic": round(self.base_blood_pressure_systolic + 20 * exercise_factor + random.uniform(-10, 10)),
-            "diastolic": round(self.base_blood_pressure_diastolic + 10 * exercise_factor + random.uniform(-5, 5))
-        }
-        blood_oxygen = round(self.base_blood_oxygen - exercise_factor + random.uniform(-1, 1), 1)
-
-        data = {
-            "timestamp": timestamp,
-            "heart_rate": heart_rate,
-            "blood_pressure": blood_pressure,
-            "blood_oxygen": blood_oxygen,
-            "performance": self.generate_performance_data(),
-            "environment": self.generate_environmental_data(),
-            "status": "normal"
-        }
-        
-        # Status assessment
-        if (heart_rate > 160 or blood_oxygen < 95):
-            data["status"] = "warning"
-        if (heart_rate > 180 or blood_oxygen < 90):
-            data["status"] = "critical"
+        """
+        Generate one sample
+
+        Returns: HealthSample (supports the old nested dict access, use to_dict() for a real dict)
+        """
+        with instrumentation.timer("simulator_generate"):
+            timestamp = self.sample_clock().strftime(TIMESTAMP_FORMAT)
+            
+            if self.target_heart_rate is None:
+                # Adjust physiological data based on exercise duration
+                exercise_factor = min(self.exercise_duration / 30, 1)  # max intensity at 30 minutes
+                hr_adjustment = 40 * exercise_factor  # max increase of 40bpm
+            else:
+                # Workout phase: heart rate moves towards the phase target with a lag
+                response = 1 - math.exp(-self.sample_seconds / HEART_RATE_RESPONSE)
+                self.heart_rate_level += (self.target_heart_rate - self.heart_rate_level) * response
+                hr_adjustment = self.heart_rate_level - self.base_heart_rate
+                exercise_factor = min(max(hr_adjustment / 40, 0), 2)
+            
+            heart_rate = round(self.base_heart_rate + hr_adjustment + self.random.uniform(-10, 10))
+            systolic = round(self.base_blood_pressure_systolic + 20 * exercise_factor + self.random.uniform(-10, 10))
+            diastolic = round(self.base_blood_pressure_diastolic + 10 * exercise_factor + self.random.uniform(-5, 5))
+            blood_oxygen = round(self.base_blood_oxygen - exercise_factor + self.random.uniform(-1, 1), 1)
+
+            # Status assessment
+            status = "normal"
+            if (heart_rate > 160 or blood_oxygen < 95):
+                status = "warning"
+            if (heart_rate > 180 or blood_oxygen < 90):
+                status = "critical"
 
+            data = HealthSample(timestamp, heart_rate, systolic, diastolic, blood_oxygen,
+                                *self._next_performance(), *self._next_environment(), status)
+        self.record(data)
+        return data
+
+    def record(self, data, violations=None):
+        """
+        Validate a sample and add it to the trends and history
+
+        Invalid samples are kept out of the trends and history, their
+        violations are left in `last_violations`.
+
+        parameters:
+            violations (list): result of validating the sample beforehand
+                (e.g. in a batch), None to validate it here
+        """
         # Add validation before storing or returning data
-        is_valid, message = self.validate_health_data(data)
-        if not is_valid:
-            print(f"Warning: {message}")
-            # Could add logic to regenerate data or adjust values
+        if violations is None:
+            with instrumentation.timer("validation"):
+                violations = self.validator.validate(data)
+        self.last_violations = violations
+        if self.last_violations:
+            for violation in self.last_violations:
+                instrumentation.count_validation_failure(violation.rule)
+            print(f"Warning: {'; '.join(str(violation) for violation in self.last_violations)}")
+            return
+
+        instrumentation.count_status(data["status"])
 
         # Add data to history
+        with instrumentation.timer("trend_update"):
+            self.trend_tracker.update(data)
         self.data_history.append(data)
-        if len(self.data_history) > self.max_history:
-            self.data_history.pop(0)
-            
-        return data
     
+    def simulate_workout_session(self, workout_plan, interval=1.0):
+        """
+        Generate the samples of a complete workout session
+
+        Each phase sets the target heart rate zone and pace, see
+        WORKOUT_PHASES. One sample is generated every `interval` seconds of
+        workout time. With a SimulatedClock as the simulator clock it is
+        advanced instead of waiting, so a 60 minute session takes
+        milliseconds; with the wall clock the session runs in real time.
+
+        parameters:
+            workout_plan: WorkoutPlan or list of (phase, minutes), e.g.
+                [("warmup", 5), ("running", 20), ("cooldown", 5)]
+            interval (float): seconds between samples
+
+        Returns: iterator of (phase, HealthSample)
+        """
+        if not isinstance(workout_plan, WorkoutPlan):
+            workout_plan = WorkoutPlan(workout_plan)
+        self.sample_seconds = interval
+        fast_forward = isinstance(self.sample_clock, SimulatedClock)
+        base_pace = self.base_pace
+        elapsed = 0.0
+        try:
+            while True:
+                phase = workout_plan.phase_at(elapsed)
+                if phase is None:
+                    return
+                name, (low, high), self.base_pace = phase
+                self.target_heart_rate = (low + high) / 2
+                yield name, self.generate_health_data()
+
+                elapsed += interval
+                if fast_forward:
+                    self.sample_clock.advance(interval)
+                else:
+                    time.sleep(interval)
+        finally:
+            self.target_heart_rate = None
+            self.base_pace = base_pace
+            self.sample_seconds = 1.0
+
     def validate_health_data(self, data):
         """
-        Validate health data is within acceptable ranges
+        Validate health data is within acceptable ranges, see validation.VALIDATION_RULES
         Returns: (is_valid, message)
         """
-        if not (40 <= data["heart_rate"] <= 200):
-            return False, "Heart rate out of range"
-        if not (85 <= data["blood_pressure"]["systolic"] <= 200):
-            return False, "Systolic pressure out of range"
-        # ============================================================
-        # Add your code here 
-        # Task1 : more validation rules
-        # ============================================================
+        violations = self.validator.validate(data)
+        if violations:
+            return False, "; ".join(violation.message for violation in violations)
         return True, "Data valid"
 
+STATUS_LEVELS = np.array(["normal", "warning", "critical"])
+
+# uniform draws consumed per athlete per tick, in this order
+_NOISE_RANGES = np.array([
+    (-10, 10),    # heart rate
+    (-10, 10),    # systolic
+    (-5, 5),      # diastolic
+    (-1, 1),      # blood oxygen
+    (-1, 1),      # pace
+    (-0.1, 0.1),  # stride
+    (-10, 10),    # cadence
+    (0.1, 0.2),   # calories per tick
+    (-5, 5),      # altitude
+    (-1, 1),      # temperature
+    (-5, 5),      # pressure
+    (-5, 5),      # humidity
+])
+
+
+class BatchHealthSimulator:
+    """
+    Vectorized simulator for many athletes at once
+
+    Uses the same physiology as HealthDataSimulator, but all arithmetic is
+    done on NumPy arrays and results are returned as struct-of-arrays
+    columns keyed like records.SAMPLE_FIELDS (plus an "athlete" index).
+    Every athlete has its own RNG stream spawned from `seed`, so an
+    athlete's data does not depend on how many others are simulated or
+    on whether it is advanced with step() or run().
+
+    parameters:
+        n_athletes (int): number of simulated athletes
+        seed (int): root seed for the per-athlete RNG streams
+    """
+
+    def __init__(self, n_athletes, seed=None):
+        self.n_athletes = n_athletes
+        seed_sequence = np.random.SeedSequence(seed)
+        self.rngs = [np.random.default_rng(s) for s in seed_sequence.spawn(n_athletes)]
+
+        self.base_heart_rate = np.full(n_athletes, 75.0)
+        self.base_blood_pressure_systolic = np.full(n_athletes, 120.0)
+        self.base_blood_pressure_diastolic = np.full(n_athletes, 80.0)
+        self.base_blood_oxygen = np.full(n_athletes, 98.0)
+        self.base_pace = np.full(n_athletes, 6.0)
+        self.base_stride = np.full(n_athletes, 0.8)
+        self.base_cadence = np.full(n_athletes, 160.0)
+        self.base_altitude = np.full(n_athletes, 50.0)
+        self.base_temperature = np.full(n_athletes, 25.0)
+        self.base_pressure = np.full(n_athletes, 1013.0)
+        self.base_humidity = np.full(n_athletes, 60.0)
+
+        # cumulative totals are kept unrounded, only reported values are rounded
+        self.exercise_duration = np.zeros(n_athletes)
+        self.total_distance = np.zeros(n_athletes)
+        self.calories_burned = np.zeros(n_athletes)
+
+    def _columns(self, athletes, noise, duration_before, timestamps):
+        """Turn uniform draws into health data columns"""
+        low, high = _NOISE_RANGES[:, 0], _NOISE_RANGES[:, 1]
+        noise = low + noise * (high - low)
+
+        exercise_factor = np.minimum(duration_before / 30, 1)
+        heart_rate = np.round(self.base_heart_rate[athletes] + 40 * exercise_factor + noise[:, 0]).astype(np.int16)
+        blood_oxygen = np.round(self.base_blood_oxygen[athletes] - exercise_factor + noise[:, 3], 1)
+
+        pace = np.round(self.base_pace[athletes] + noise[:, 4], 2)
+
+        status = np.zeros(len(heart_rate), dtype=np.int8)
+        status[(heart_rate > 160) | (blood_oxygen < 95)] = 1
+        status[(heart_rate > 180) | (blood_oxygen < 90)] = 2
+
+        return {
+            "timestamp": timestamps,
+            "heart_rate": heart_rate,
+            "blood_pressure_systolic": np.round(self.base_blood_pressure_systolic[athletes] + 20 * exercise_factor + noise[:, 1]).astype(np.int16),
+            "blood_pressure_diastolic": np.round(self.base_blood_pressure_diastolic[athletes] + 10 * exercise_factor + noise[:, 2]).astype(np.int16),
+            "blood_oxygen": blood_oxygen,
+            "pace": pace,
+            "stride": np.round(self.base_stride[athletes] + noise[:, 5], 2),
+            "cadence": np.round(self.base_cadence[athletes] + noise[:, 6]).astype(np.int16),
+            "altitude": np.round(self.base_altitude[athletes] + noise[:, 8]).astype(np.int16),
+            "temperature": np.round(self.base_temperature[athletes] + noise[:, 9], 1),
+            "pressure": np.round(self.base_pressure[athletes] + noise[:, 10]).astype(np.int16),
+            "humidity": np.round(self.base_humidity[athletes] + noise[:, 11]).astype(np.int16),
+            "status": STATUS_LEVELS[status],
+        }, noise
+
+    def step(self, timestamp=None):
+        """
+        Advance every athlete by one tick
+
+        Returns: dict of arrays of length n_athletes
+        """
+        timestamp = np.datetime64(timestamp or datetime.now(), "s")
+        noise = np.stack([rng.random(len(_NOISE_RANGES)) for rng in self.rngs])
+        athletes = np.arange(self.n_athletes)
+
+        columns, noise = self._columns(athletes, noise, self.exercise_duration,
+                                       np.full(self.n_athletes, timestamp))
+
+        self.exercise_duration += 1/60
+        self.total_distance += (1000 / columns["pace"]) / 60 / 1000
+        self.calories_burned += noise[:, 7]
+
+        columns["duration"] = np.round(self.exercise_duration, 2)
+        columns["distance"] = np.round(self.total_distance, 3)
+        columns["calories"] = np.round(self.calories_burned, 1)
+        columns["athlete"] = athletes
+        return columns
+
+    def run(self, athlete, ticks, start_time=None):
+        """
+        Advance one athlete by `ticks` one-second ticks
+
+        Returns: dict of arrays of length ticks
+        """
+        start = np.datetime64(start_time or datetime.now(), "s")
+        timestamps = start + np.arange(ticks).astype("timedelta64[s]")
+        noise = self.rngs[athlete].random((ticks, len(_NOISE_RANGES)))
+
+        duration = self.exercise_duration[athlete] + np.arange(1, ticks + 1) / 60
+        duration_before = duration - 1/60
+        athletes = np.full(ticks, athlete)
+
+        columns, noise = self._columns(athletes, noise, duration_before, timestamps)
+
+        distance = self.total_distance[athlete] + np.cumsum((1000 / columns["pace"]) / 60 / 1000)
+        calories = self.calories_burned[athlete] + np.cumsum(noise[:, 7])
+        self.exercise_duration[athlete] = duration[-1]
+        self.total_distance[athlete] = distance[-1]
+        self.calories_burned[athlete] = calories[-1]
+
+        columns["duration"] = np.round(duration, 2)
+        columns["distance"] = np.round(distance, 3)
+        columns["calories"] = np.round(calories, 1)
+        columns["athlete"] = athletes
+        return columns
+
+
+def columns_to_records(columns):
+    """
+    Convert simulator columns into the nested dicts produced by
+    HealthDataSimulator.generate_health_data(...).to_dict()
+    """
+    return [sample.to_dict() for sample in columns_to_samples(columns)]
+
+
 def simulate_real_time_data(duration_seconds=None, interval=1):
     """Real-time data generator simulator"""
     simulator = HealthDataSimulator()
@@ -131,7 +463,7 @@ def simulate_real_time_data(duration_seconds=None, interval=1):
             health_data = simulator.generate_health_data()
             
             # Convert to JSON and print
-            print(json.dumps(health_data, indent=2))
+            print(json.dumps(health_data.to_dict(), indent=2))
             
             # Check if specified duration has been reached
             if duration_seconds and (time.time() - start_time) >= duration_seconds:
@@ -143,21 +475,6 @@ def simulate_real_time_data(duration_seconds=None, interval=1):
         print("\nSimulator Stopped")
 
 
-def simulate_workout_session(self, workout_plan):
-    """
-    workout_plan example:
-    [
-        ("warmup", 5),      # 5 minutes warmup
-        ("running", 20),    # 20 minutes running
-        ("cooldown", 5)     # 5 minutes cooldown
-    ]
-    """
-    # ============================================================
-    # Add your code here 
-    # Task1: Create a method that simulates a complete workout session with different phases
-    # ============================================================
-    pass
-
 if __name__ == "__main__":
     print("Simulation started (Press Ctrl+C to Stop)...")
     # Generate new data every 60 seconds
@@ -0,0 +1,188 @@
+import os
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+import data_storage
+from data_storage import CSVTailReader, apply_retention, list_segments, rotate_file
+from ingest_server import normalize_timestamp, packet_to_sample
+from records import TIMESTAMP_FORMAT, HealthSample
+from validation import Validator
+
+VALUES = (150, 130, 85, 97, 5.5, 1.1, 170, 20.0, 3.5, 250.0, 40, 21.0, 1012, 55)
+
+
+def write_file(path, size=100):
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+
+
+# rotation and retention
+
+def test_rotations_within_one_second_sort_in_rotation_order(tmp_path):
+    csv_path = str(tmp_path / "data.csv")
+    rotated = []
+    for _ in range(4):
+        write_file(csv_path)
+        rotated.append(rotate_file(csv_path))
+    # mtime must not matter, compression rewrites it
+    os.utime(rotated[0], (time.time() + 60, time.time() + 60))
+    assert list_segments(csv_path) == rotated
+
+
+def test_rotation_suffix_stays_above_deleted_segments(tmp_path):
+    csv_path = str(tmp_path / "data.csv")
+    rotated = []
+    for _ in range(3):
+        write_file(csv_path)
+        rotated.append(rotate_file(csv_path))
+    os.remove(rotated[1])
+    write_file(csv_path)
+    newest = rotate_file(csv_path)
+    assert newest not in rotated
+    assert list_segments(csv_path)[-1] == newest
+
+
+def test_list_segments_orders_by_name_and_ignores_other_files(tmp_path):
+    csv_path = str(tmp_path / "data.csv")
+    names = ["data-20240101-120000-2.csv.gz", "data-20240101-115959.csv",
+             "data-20240101-120000.csv.gz", "data-20240101-120000-10.csv", "data-backup.csv"]
+    for name in names:
+        write_file(tmp_path / name)
+    assert [os.path.basename(path) for path in list_segments(csv_path)] == [
+        "data-20240101-115959.csv", "data-20240101-120000.csv.gz",
+        "data-20240101-120000-2.csv.gz", "data-20240101-120000-10.csv"]
+
+
+def test_retention_deletes_oldest_segments_first(tmp_path):
+    csv_path = str(tmp_path / "data.csv")
+    for second in range(5):
+        write_file(tmp_path / f"data-20240101-12000{second}.csv", size=400 * 1024)
+    deleted = apply_retention(csv_path, max_total_size_mb=1)
+    assert [os.path.basename(path) for path in deleted] == [
+        "data-20240101-120000.csv", "data-20240101-120001.csv", "data-20240101-120002.csv"]
+    assert len(list_segments(csv_path)) == 2
+
+
+def test_retention_spares_segments_queued_for_compression(tmp_path):
+    csv_path = str(tmp_path / "data.csv")
+    paths = []
+    for second in range(4):
+        paths.append(str(tmp_path / f"data-20240101-12000{second}.csv"))
+        write_file(paths[-1], size=400 * 1024)
+    data_storage._pending_segments.add(paths[0])
+    try:
+        deleted = apply_retention(csv_path, max_total_size_mb=1)
+    finally:
+        data_storage._pending_segments.discard(paths[0])
+    assert os.path.exists(paths[0])
+    assert deleted == paths[1:3]
+
+
+# CSVTailReader
+
+def test_tail_reader_reads_only_complete_new_rows(tmp_path):
+    csv_path = tmp_path / "data.csv"
+    csv_path.write_text("a,b\n" + "".join(f"{i},{i * 2}\n" for i in range(100)))
+    reader = CSVTailReader(str(csv_path), max_rows=3, block_size=16)
+    assert reader.read()["a"].tolist() == [97, 98, 99]
+
+    with open(csv_path, "a") as f:
+        f.write("100,200\n101,")
+    assert reader.read()["a"].tolist() == [98, 99, 100]
+
+    with open(csv_path, "a") as f:
+        f.write("202\n")
+    frame = reader.read()
+    assert frame["a"].tolist() == [99, 100, 101]
+    assert frame["b"].tolist() == [198, 200, 202]
+
+
+def test_tail_reader_starts_over_after_rotation(tmp_path):
+    csv_path = tmp_path / "data.csv"
+    csv_path.write_text("a\n1\n2\n3\n")
+    reader = CSVTailReader(str(csv_path), max_rows=10)
+    assert reader.read()["a"].tolist() == [1, 2, 3]
+
+    os.replace(csv_path, tmp_path / "data-old.csv")
+    assert reader.read().empty
+    csv_path.write_text("a\n7\n")
+    assert reader.read()["a"].tolist() == [7]
+
+
+# Validator.validate_columns against Validator.validate
+
+def sample(**changes):
+    row = HealthSample("2024-01-01 08:00:00", *VALUES).to_row()
+    row.update(changes)
+    return HealthSample(*row.values())
+
+
+def batch_columns(samples):
+    return {name: [item.to_row()[name] for item in samples] for name in samples[0].to_row()}
+
+
+def test_validate_columns_reports_the_same_rows_as_validate():
+    samples = [
+        sample(),
+        sample(heart_rate=250),
+        sample(blood_pressure_systolic=80, blood_pressure_diastolic=90),
+        sample(blood_oxygen="n/a"),
+        sample(status="unknown"),
+        sample(timestamp="2024-01-01T08:00:00"),
+        sample(timestamp="2024-1-1 08:00:00"),
+        sample(timestamp="2024-02-30 08:00:00"),
+        sample(humidity=101, pressure=700),
+        sample(),
+    ]
+    validator = Validator()
+    expected = {(index, violation.rule)
+                for index, item in enumerate(samples) for violation in validator.validate(item)}
+
+    batch = validator.validate_columns(pd.DataFrame([item.to_row() for item in samples]))
+    found = {(violation.index, violation.rule) for violation in batch.violations(batch_columns(samples))}
+    assert found == expected
+    assert batch.valid.tolist() == [not validator.validate(item) for item in samples]
+
+
+
+# normalize_timestamp / packet_to_sample
+
+def test_canonical_timestamps_are_kept():
+    assert normalize_timestamp("2024-01-01 08:00:00") == "2024-01-01 08:00:00"
+
+
+def test_iso_and_epoch_timestamps_are_normalized():
+    assert normalize_timestamp("2024-01-01T08:00:00.250") == "2024-01-01 08:00:00"
+    utc = datetime(2024, 1, 1, 8, 0, tzinfo=timezone.utc)
+    local = utc.astimezone().strftime(TIMESTAMP_FORMAT)
+    assert normalize_timestamp("2024-01-01T08:00:00Z") == local
+    assert normalize_timestamp(utc.timestamp()) == local
+    assert normalize_timestamp(int(utc.timestamp())) == local
+
+
+def test_missing_timestamp_means_arrival_time():
+    value = normalize_timestamp("")
+    assert datetime.strptime(value, TIMESTAMP_FORMAT) <= datetime.now()
+
+
+@pytest.mark.parametrize("value", [
+    True, "yesterday", "0999-01-01 08:00:00", "2024-13-01 08:00:00", 1e20, float("nan"), [2024],
+])
+def test_unusable_timestamps_are_rejected(value):
+    with pytest.raises(ValueError):
+        normalize_timestamp(value)
+
+
+def test_packet_to_sample_derives_status():
+    athlete, sample = packet_to_sample(7, "2024-01-01 08:00:00", (185,) + VALUES[1:], "")
+    assert athlete == "7"
+    assert sample.status == "critical"
+    assert packet_to_sample("a", None, VALUES, "warning")[1].status == "warning"
+
+
+def test_packet_to_sample_rejects_non_numeric_vitals():
+    with pytest.raises(ValueError):
+        packet_to_sample("a", None, ("fast",) + VALUES[1:], "")
@@ -0,0 +1,179 @@
+import numpy as np
+from records import HealthSample
+
+# metrics tracked for trend analysis, in column order
+TREND_FIELDS = [
+    "heart_rate",
+    "blood_pressure_systolic",
+    "blood_pressure_diastolic",
+    "blood_oxygen",
+    "pace",
+    "distance",
+    "calories",
+]
+
+
+def extract_trend_values(data):
+    """Pull the tracked metrics out of a HealthSample or nested health data dict"""
+    if isinstance(data, HealthSample):
+        return (data.heart_rate, data.blood_pressure_systolic, data.blood_pressure_diastolic,
+                data.blood_oxygen, data.pace, data.distance, data.calories)
+    return (
+        data["heart_rate"],
+        data["blood_pressure"]["systolic"],
+        data["blood_pressure"]["diastolic"],
+        data["blood_oxygen"],
+        data["performance"]["pace"],
+        data["performance"]["distance"],
+        data["performance"]["calories"],
+    )
+
+
+def trend_label(first, last):
+    """Same rule as the original analyze_trends: +/-5% of the first value is stable"""
+    diff = last - first
+    if abs(diff) < 0.05 * first:
+        return "stable"
+    return "increasing" if diff > 0 else "decreasing"
+
+
+class TrendTracker:
+    """
+    Rolling-window trend statistics updated in O(1) per sample
+
+    Samples are stored in a fixed-size NumPy ring buffer (one column per
+    metric in TREND_FIELDS). Running sums are kept so that the window
+    mean, variance and least-squares slope never need a pass over the
+    buffer, and an EWMA is updated alongside. Sums are recomputed from the
+    buffer once per window to stop floating point drift.
+
+    parameters:
+        window (int): number of samples in the rolling window
+        alpha (float): EWMA smoothing factor
+    """
+
+    def __init__(self, window=10, alpha=0.3):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.window = window
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        n_fields = len(TREND_FIELDS)
+        self._values = np.zeros((self.window, n_fields))
+        self._count = 0  # total samples seen
+        self._sum = np.zeros(n_fields)
+        self._sum_sq = np.zeros(n_fields)
+        self._sum_xy = np.zeros(n_fields)  # x counts samples from self._x_base
+        self._x_base = 0
+        self._ewma = np.zeros(n_fields)
+
+    def __len__(self):
+        return min(self._count, self.window)
+
+    def update(self, data):
+        """Add one nested health data dict"""
+        self.update_values(extract_trend_values(data))
+
+    def update_values(self, values):
+        """Add one sample given as a sequence ordered like TREND_FIELDS"""
+        values = np.asarray(values, dtype=float)
+        x = self._count - self._x_base
+        slot = self._count % self.window
+
+        if self._count >= self.window:
+            old = self._values[slot]
+            self._sum -= old
+            self._sum_sq -= old * old
+            self._sum_xy -= (x - self.window) * old
+
+        self._values[slot] = values
+        self._sum += values
+        self._sum_sq += values * values
+        self._sum_xy += x * values
+
+        if self._count == 0:
+            self._ewma[:] = values
+        else:
+            self._ewma += self.alpha * (values - self._ewma)
+
+        self._count += 1
+        if self._count % self.window == 0:
+            self._recompute_sums()
+
+    def _recompute_sums(self):
+        n = len(self)
+        ordered = self.values()
+        # rebase x on the oldest sample so the sums stay small
+        self._x_base = self._count - n
+        x = np.arange(n, dtype=float)
+        self._sum = ordered.sum(axis=0)
+        self._sum_sq = (ordered * ordered).sum(axis=0)
+        self._sum_xy = x @ ordered
+
+    def values(self):
+        """Window contents, oldest first, shape (len, len(TREND_FIELDS))"""
+        n = len(self)
+        if self._count <= self.window:
+            return self._values[:n]
+        start = self._count % self.window
+        return np.concatenate((self._values[start:], self._values[:start]))
+
+    def first(self):
+        return self._values[(self._count - len(self)) % self.window]
+
+    def last(self):
+        return self._values[(self._count - 1) % self.window]
+
+    def _as_dict(self, array):
+        return dict(zip(TREND_FIELDS, array.tolist()))
+
+    def mean(self):
+        n = len(self)
+        if n == 0:
+            return {}
+        return self._as_dict(self._sum / n)
+
+    def variance(self):
+        """Population variance over the window"""
+        n = len(self)
+        if n == 0:
+            return {}
+        mean = self._sum / n
+        return self._as_dict(np.maximum(self._sum_sq / n - mean * mean, 0.0))
+
+    def ewma(self):
+        if self._count == 0:
+            return {}
+        return self._as_dict(self._ewma)
+
+    def slope(self):
+        """Least-squares slope per sample over the window"""
+        n = len(self)
+        if n < 2:
+            return self._as_dict(np.zeros(len(TREND_FIELDS))) if n else {}
+        # shift x to run over 0 .. n - 1, the slope does not depend on the offset
+        start = self._count - n - self._x_base
+        sum_xy = self._sum_xy - start * self._sum
+        sum_x = n * (n - 1) / 2
+        sum_xx = (n - 1) * n * (2 * n - 1) / 6
+        denominator = n * sum_xx - sum_x * sum_x
+        return self._as_dict((n * sum_xy - sum_x * self._sum) / denominator)
+
+    def trends(self):
+        """Trend labels in the format returned by analyze_trends"""
+        if self._count == 0:
+            return {}
+        if len(self) < 2:
+            labels = ["stable"] * len(TREND_FIELDS)
+        else:
+            labels = [trend_label(f, l) for f, l in zip(self.first().tolist(), self.last().tolist())]
+        by_field = dict(zip(TREND_FIELDS, labels))
+        return {
+            "heart_rate_trend": by_field["heart_rate"],
+            "blood_pressure_trend": by_field["blood_pressure_systolic"],
+            "blood_oxygen_trend": by_field["blood_oxygen"],
+            "pace_trend": by_field["pace"],
+            "performance_trend": by_field["distance"]
+        }
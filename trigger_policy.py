@@ -0,0 +1,132 @@
+import time
+from bisect import bisect_right
+
+from records import HealthSample
+
+# levels per field; moving into a different band since the last call is a crossing
+DEFAULT_THRESHOLDS = {
+    "heart_rate": (100, 140, 160, 180),
+    "blood_oxygen": (90, 95),
+    "blood_pressure_systolic": (140, 180),
+}
+
+TREND_KEYS = ("heart_rate_trend", "blood_pressure_trend", "blood_oxygen_trend", "pace_trend")
+
+REASONS = ("first", "status", "trend", "threshold", "stale")
+
+
+class TriggerPolicy:
+    """
+    Decide which samples are worth an LLM call
+
+    A call is issued when
+      - the status moves between normal/warning/critical,
+      - one of the trend labels flips,
+      - a field moves into a different band of its thresholds,
+      - or `max_staleness` seconds have passed since the last call.
+    Everything is compared against the state at the last issued call,
+    and no two calls are closer than `min_interval` seconds (status
+    changes to "critical" always go through). Trend labels are noisy, so
+    a label only counts once it has held for `trend_hold` samples in a row.
+
+    parameters:
+        thresholds (dict): field -> sorted levels, see DEFAULT_THRESHOLDS
+        max_staleness (float): seconds after which a call is forced
+        min_interval (float): minimum seconds between calls
+        trend_hold (int): consecutive samples a new trend label must hold
+        clock (callable): time source in seconds
+    """
+
+    def __init__(self, thresholds=None, max_staleness=60.0, min_interval=10.0,
+                 trend_hold=3, clock=time.monotonic):
+        self.thresholds = dict(DEFAULT_THRESHOLDS if thresholds is None else thresholds)
+        self.max_staleness = max_staleness
+        self.min_interval = min_interval
+        self.trend_hold = trend_hold
+        self.clock = clock
+
+        self._labels = None
+        self._pending = {}
+        self._last_state = None
+        self._last_call = None
+
+        self.stats = {"issued": 0, "skipped": 0}
+        self.stats.update({f"reason_{reason}": 0 for reason in REASONS})
+
+    def _state(self, sample, trends):
+        bands = tuple(
+            bisect_right(levels, getattr(sample, field))
+            for field, levels in sorted(self.thresholds.items())
+        )
+        return sample.status, self._stable_labels(trends), bands
+
+    def _stable_labels(self, trends):
+        current = tuple(trends.get(key) for key in TREND_KEYS)
+        if self._labels is None:
+            self._labels = current
+            return current
+        labels = list(self._labels)
+        for i, label in enumerate(current):
+            if label == labels[i]:
+                self._pending.pop(i, None)
+                continue
+            candidate, count = self._pending.get(i, (label, 0))
+            count = count + 1 if candidate == label else 1
+            if count >= self.trend_hold:
+                labels[i] = label
+                self._pending.pop(i, None)
+            else:
+                self._pending[i] = (label, count)
+        self._labels = tuple(labels)
+        return self._labels
+
+    def _reason(self, state, now):
+        if self._last_state is None:
+            return "first"
+        status, labels, bands = state
+        last_status, last_labels, last_bands = self._last_state
+        if status != last_status:
+            return "status"
+        if labels != last_labels:
+            return "trend"
+        if bands != last_bands:
+            return "threshold"
+        if self.max_staleness is not None and now - self._last_call >= self.max_staleness:
+            return "stale"
+        return None
+
+    def evaluate(self, sample, trends):
+        """
+        Check one sample and record the decision
+
+        Returns: (should_call, reason) where reason is one of REASONS or None
+        """
+        sample = HealthSample.from_dict(sample)
+        now = self.clock()
+        state = self._state(sample, trends)
+        reason = self._reason(state, now)
+
+        if reason is not None and self._last_call is not None and now - self._last_call < self.min_interval:
+            urgent = reason == "status" and sample.status == "critical"
+            if not urgent:
+                reason = None
+
+        if reason is None:
+            self.stats["skipped"] += 1
+            return False, None
+
+        self._last_state = state
+        self._last_call = now
+        self.stats["issued"] += 1
+        self.stats[f"reason_{reason}"] += 1
+        return True, reason
+
+    def skip_ratio(self):
+        total = self.stats["issued"] + self.stats["skipped"]
+        return self.stats["skipped"] / total if total else 0.0
+
+    def reset(self):
+        self._labels = None
+        self._pending = {}
+        self._last_state = None
+        self._last_call = None
@@ -1,179 +1,188 @@
 import streamlit as st
-import time
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import os
-import csv
 from pathlib import Path
-from terminal import simulate_real_time_data, HealthDataSimulator
-from fetch_llm import get_llm_response, analyze_health_data
+from terminal import HealthDataSimulator
+from data_storage import get_csv_writer, flush_all_writers, CSVTailReader, gzip_file_bytes
+from coach_pipeline import CoachPipeline
+from llm_cache import CoachResponseCache
+from trigger_policy import TriggerPolicy
+from alerts import AlertEngine
+from charts import CHART_PANELS, IncrementalChart, SharedChartFrames
+import instrumentation
 
-# 添加保存数据到CSV的函数
-def save_data_to_csv(health_data, csv_path="./data/data.csv"):
+# 环形缓冲区容量、降采样桶大小和图表显示的点数
+HISTORY_CAPACITY = 10_000
+DOWNSAMPLE_BUCKET = 60
+# 每个图表最多显示的点数（LTTB降采样）
+CHART_MAX_POINTS = 500
+# 采样间隔、LLM分析间隔和指标/报警刷新间隔（秒）
+SAMPLE_INTERVAL = 1.0
+ANALYSIS_INTERVAL = 10.0
+REFRESH_INTERVAL = 1.0
+# 图表重绘间隔（秒），与采样频率无关
+CHART_REFRESH_INTERVAL = 2.0
+# AI教练回复区域的刷新间隔（秒），流式输出时逐步显示
+STREAM_REFRESH_INTERVAL = 0.5
+# 共享管道的数据保存路径（服务级设置，所有标签页相同）
+CSV_PATH = "./data/data.csv"
+
+@st.cache_resource
+def get_response_cache():
+    """所有会话共享的AI教练回复缓存（内存LRU + 磁盘）"""
+    return CoachResponseCache(disk_path="./data/llm_cache")
+
+@st.cache_resource
+def start_metrics_server():
+    """main.py --metrics-port 时启动Prometheus /metrics端点（每个服务只启动一次）"""
+    return instrumentation.enable_from_env()
+
+@st.cache_resource
+def get_coach_pipeline():
     """
-    将健康数据保存到CSV文件
-    
-    参数:
-        health_data (dict): 包含健康数据的字典
-        csv_path (str): CSV文件保存路径
+    整个Streamlit服务共享的后台管道
+
+    数据生成和LLM分析只在一个后台线程的事件循环中运行，
+    每个浏览器标签页只读取它的最新状态，内存占用与标签页数量无关。
     """
-    # 确保目录存在
-    directory = os.path.dirname(csv_path)
-    Path(directory).mkdir(parents=True, exist_ok=True)
-    
-    # 将嵌套字典扁平化为一维字典
-    flat_data = {
-        "timestamp": health_data["timestamp"],
-        "heart_rate": health_data["heart_rate"],
-        "blood_pressure_systolic": health_data["blood_pressure"]["systolic"],
-        "blood_pressure_diastolic": health_data["blood_pressure"]["diastolic"],
-        "blood_oxygen": health_data["blood_oxygen"],
-        "pace": health_data["performance"]["pace"],
-        "stride": health_data["performance"]["stride"],
-        "cadence": health_data["performance"]["cadence"],
-        "duration": health_data["performance"]["duration"],
-        "distance": health_data["performance"]["distance"],
-        "calories": health_data["performance"]["calories"],
-        "altitude": health_data["environment"]["altitude"],
-        "temperature": health_data["environment"]["temperature"],
-        "pressure": health_data["environment"]["pressure"],
-        "humidity": health_data["environment"]["humidity"],
-        "status": health_data["status"]
-    }
-    
-    # 检查文件是否存在
-    file_exists = os.path.isfile(csv_path)
-    
-    # 写入CSV
-    with open(csv_path, mode='a', newline='') as file:
-        fieldnames = flat_data.keys()
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        
-        # 如果文件不存在，写入表头
-        if not file_exists:
-            writer.writeheader()
-        
-        # 写入数据行
-        writer.writerow(flat_data)
-    
-    return csv_path
+    simulator = HealthDataSimulator(history_capacity=HISTORY_CAPACITY,
+                                    downsample_bucket=DOWNSAMPLE_BUCKET)
+    pipeline = CoachPipeline(simulator,
+                             writer=get_csv_writer(CSV_PATH),
+                             sample_interval=SAMPLE_INTERVAL,
+                             analysis_interval=ANALYSIS_INTERVAL,
+                             cache=get_response_cache(),
+                             trigger=TriggerPolicy(),
+                             stream=True,
+                             alerts=AlertEngine())
+    pipeline.start_in_thread()
+    return pipeline
+
+@st.cache_resource
+def get_chart_frames():
+    """所有标签页共享的降采样图表数据，每个新样本只计算一次"""
+    return SharedChartFrames(get_coach_pipeline().simulator.data_history,
+                             max_points=CHART_MAX_POINTS)
 
 def initialize_session_state():
     """初始化Session State"""
-    if 'history' not in st.session_state:
-        st.session_state.history = {
-            'timestamp': [],
-            'heart_rate': [],
-            'blood_oxygen': [],
-            'systolic': [],
-            'diastolic': [],
-            'pace': [],
-            'distance': [],
-            'calories': [],
-            'temperature': [],
-            'humidity': []
-        }
-    if 'last_analysis' not in st.session_state:
-        st.session_state.last_analysis = "Waiting for data..."
-    if 'simulator' not in st.session_state:
-        st.session_state.simulator = HealthDataSimulator()
-    if 'csv_path' not in st.session_state:
-        st.session_state.csv_path = "./data/data.csv"
-    if 'save_data' not in st.session_state:
-        st.session_state.save_data = True
+    if 'tail_reader' not in st.session_state:
+        st.session_state.tail_reader = None
     # 添加语音反馈相关的状态
     if 'auto_read_feedback' not in st.session_state:
         st.session_state.auto_read_feedback = False
     if 'last_read_feedback' not in st.session_state:
         st.session_state.last_read_feedback = ""
-    # 添加一个计数器用于生成唯一的键
-    if 'button_counter' not in st.session_state:
-        st.session_state.button_counter = 0
+    if 'last_read_alerts' not in st.session_state:
+        st.session_state.last_read_alerts = []
 
-def update_history(data):
-    """更新历史数据"""
-    history = st.session_state.history
-    history['timestamp'].append(data['timestamp'])
-    history['heart_rate'].append(data['heart_rate'])
-    history['blood_oxygen'].append(data['blood_oxygen'])
-    history['systolic'].append(data['blood_pressure']['systolic'])
-    history['diastolic'].append(data['blood_pressure']['diastolic'])
-    history['pace'].append(data['performance']['pace'])
-    history['distance'].append(data['performance']['distance'])
-    history['calories'].append(data['performance']['calories'])
-    history['temperature'].append(data['environment']['temperature'])
-    history['humidity'].append(data['environment']['humidity'])
-    
-    # 保持历史记录在最近100个数据点
-    if len(history['timestamp']) > 100:
-        for key in history:
-            history[key] = history[key][-100:]
-    
-    # 保存数据到CSV
-    if st.session_state.save_data:
-        save_data_to_csv(data, st.session_state.csv_path)
+def create_metrics_charts():
+    """
+    创建3x2的图表网格
 
-def create_metrics_chart():
-    """创建实时指标图表"""
-    fig = make_subplots(
-        rows=3, cols=2,
-        subplot_titles=('Vital Signs', 'Blood Pressure', 
-                       'Performance', 'Progress',
-                       'Environment', 'Status')
-    )
+    占位符在片段外创建，片段重新运行时不会被清除，
+    所以片段只需把新样本追加到已有图表中。
+    """
+    shared = get_chart_frames()
+    charts = []
+    for row in range(0, len(CHART_PANELS), 2):
+        columns = st.columns(2)
+        for column, (title, fields) in zip(columns, CHART_PANELS[row:row + 2]):
+            with column:
+                st.caption(title)
+                charts.append(IncrementalChart(st.empty(), fields, max_points=CHART_MAX_POINTS,
+                                               full_frame=lambda title=title: shared.frame(title)))
+    # 每次完整运行都会重建占位符，图表也随之重新绘制
+    st.session_state.charts = charts
+    update_metrics_charts()
 
-    history = st.session_state.history
-    
-    # 心率和血氧
-    fig.add_trace(
-        go.Scatter(y=history['heart_rate'], name="Heart Rate",
-                  line=dict(color='red')),
-        row=1, col=1
-    )
-    fig.add_trace(
-        go.Scatter(y=history['blood_oxygen'], name="SpO2",
-                  line=dict(color='blue')),
-        row=1, col=1
-    )
+@st.fragment(run_every=CHART_REFRESH_INTERVAL)
+def update_metrics_charts():
+    """定时把新样本追加到图表中，没有新样本时不发送任何数据"""
+    history = get_coach_pipeline().simulator.data_history
+    if not history.total_count:
+        st.info("Waiting for data...")
+        return
+    for chart in st.session_state.charts:
+        chart.update(history)
 
-    # 血压
-    fig.add_trace(
-        go.Scatter(y=history['systolic'], name="Systolic",
-                  line=dict(color='orange')),
-        row=1, col=2
-    )
-    fig.add_trace(
-        go.Scatter(y=history['diastolic'], name="Diastolic",
-                  line=dict(color='green')),
-        row=1, col=2
-    )
+@st.fragment(run_every=REFRESH_INTERVAL)
+def show_current_status():
+    """显示安全报警和当前指标"""
+    pipeline = get_coach_pipeline()
 
-    # 配速和距离
-    fig.add_trace(
-        go.Scatter(y=history['pace'], name="Pace",
-                  line=dict(color='purple')),
-        row=2, col=1
-    )
-    fig.add_trace(
-        go.Scatter(y=history['distance'], name="Distance",
-                  line=dict(color='brown')),
-        row=2, col=2
-    )
+    # 本地规则报警：不等待LLM，立即显示并播报
+    alerts = pipeline.latest_alerts
+    for alert in alerts:
+        if alert.severity == "critical":
+            st.error(f"🚨 {alert.message} ({alert.timestamp})")
+        else:
+            st.warning(f"⚠️ {alert.message} ({alert.timestamp})")
+    # 每条报警只播报一次（报警恢复后列表会清空）
+    unread = [alert for alert in alerts if alert not in st.session_state.last_read_alerts]
+    if unread and st.session_state.auto_read_feedback:
+        text_to_speech(". ".join(alert.message for alert in unread))
+    st.session_state.last_read_alerts = alerts
 
-    # 温度和湿度
-    fig.add_trace(
-        go.Scatter(y=history['temperature'], name="Temperature",
-                  line=dict(color='red')),
-        row=3, col=1
-    )
-    fig.add_trace(
-        go.Scatter(y=history['humidity'], name="Humidity",
-                  line=dict(color='blue')),
-        row=3, col=2
-    )
-    
-    fig.update_layout(height=800, showlegend=True)
-    return fig
+    data = pipeline.latest_sample
+    if data is None:
+        return
+    st.subheader("📊 Current Metrics")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Heart Rate", f"{data.heart_rate} bpm")
+        st.metric("Blood Oxygen", f"{data.blood_oxygen}%")
+        st.metric("Distance", f"{data.distance:.2f} km")
+    with col2:
+        st.metric("Pace", f"{data.pace:.1f} min/km")
+        st.metric("Temperature", f"{data.temperature}°C")
+        st.metric("Humidity", f"{data.humidity}%")
+
+    # 添加数据保存状态提示
+    st.caption(f"✅ Data saved to {CSV_PATH}")
+
+@st.fragment(run_every=STREAM_REFRESH_INTERVAL)
+def show_coach_feedback():
+    """显示AI教练的回复，流式输出时逐步显示正在生成的内容"""
+    pipeline = get_coach_pipeline()
+    st.subheader("💡 AI Coach Feedback")
+
+    streaming_sample = pipeline.streaming_sample
+    partial = pipeline.partial_analysis
+    if streaming_sample is not None and partial:
+        st.markdown(f"**Latest Update ({streaming_sample.timestamp}):**")
+        st.markdown(partial + " ▌")
+        return
+
+    analysis = pipeline.latest_analysis
+    if analysis is None:
+        st.markdown("Waiting for data...")
+        return
+    st.markdown(f"**Latest Update ({pipeline.latest_analysis_sample.timestamp}):**")
+    st.markdown(analysis)
+    ttft = pipeline.stats["last_ttft"]
+    rate = pipeline.stats["last_tokens_per_sec"]
+    unit = "tok/s"
+    if rate is None:
+        # 服务器没有返回token用量时按流式块计数
+        rate = pipeline.stats["last_chunks_per_sec"]
+        unit = "chunks/s"
+    if ttft is not None and rate is not None:
+        st.caption(f"⏱️ First token {ttft:.2f}s · {rate:.1f} {unit}")
+
+    # 语音播报按钮使用固定的key，点击时只重新运行这个片段
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        if st.button("🔊 Read Feedback", key="read_feedback_button"):
+            text_to_speech(analysis)
+            st.session_state.last_read_feedback = analysis
+    with col2:
+        if st.session_state.auto_read_feedback:
+            st.success("Auto-read enabled")
+            # 只有当分析内容发生变化时才自动播报
+            if analysis != st.session_state.last_read_feedback:
+                text_to_speech(analysis)
+                st.session_state.last_read_feedback = analysis
+        else:
+            st.info("Auto-read disabled")
 
 # 添加语音播报功能
 def text_to_speech(text):
@@ -198,6 +207,7 @@ def text_to_speech(text):
 
 def main():
     st.set_page_config(page_title="Exercise Monitor", layout="wide")
+    start_metrics_server()
     
     initialize_session_state()
     
@@ -206,116 +216,52 @@ def main():
     # 添加侧边栏设置
     with st.sidebar:
         st.header("Settings")
-        st.session_state.save_data = st.checkbox("Save data to CSV", value=True)
-        
         # 添加语音反馈设置
         st.subheader("Voice Feedback Settings")
         st.session_state.auto_read_feedback = st.checkbox("Auto-read AI Coach Feedback", 
                                                          value=st.session_state.auto_read_feedback,
                                                          key="auto_read_checkbox")
         
-        if st.session_state.save_data:
-            # 允许用户自定义CSV文件路径
-            custom_path = st.text_input("CSV file path", value=st.session_state.csv_path)
-            if custom_path != st.session_state.csv_path:
-                st.session_state.csv_path = custom_path
+        # 数据保存位置由服务统一设置（所有标签页共享同一个管道）
+        st.subheader("Data Storage")
+        csv_file = Path(CSV_PATH)
+        if csv_file.exists():
+            st.success(f"Saving data to: {CSV_PATH}")
             
-            # 显示当前CSV文件路径和状态
-            csv_file = Path(st.session_state.csv_path)
-            if csv_file.exists():
-                st.success(f"Saving data to: {st.session_state.csv_path}")
-                
-                # 添加查看数据选项
-                if st.button("View Saved Data", key="view_data_button"):
-                    try:
-                        import pandas as pd
-                        df = pd.read_csv(st.session_state.csv_path)
-                        st.dataframe(df.tail(10))
-                        st.download_button(
-                            label="Download CSV",
-                            data=open(st.session_state.csv_path, 'rb').read(),
-                            file_name="exercise_data.csv",
-                            mime="text/csv",
-                            key="download_button"
-                        )
-                    except Exception as e:
-                        st.error(f"Error reading CSV: {e}")
-            else:
-                st.info(f"Will create: {st.session_state.csv_path} when data is generated")
+            # 添加查看数据选项
+            if st.button("View Saved Data", key="view_data_button"):
+                # 先把缓冲区中的数据写入磁盘
+                flush_all_writers()
+                try:
+                    # 只读取文件末尾新增的部分，而不是每次解析整个文件
+                    if st.session_state.tail_reader is None:
+                        st.session_state.tail_reader = CSVTailReader(CSV_PATH, max_rows=10)
+                    st.dataframe(st.session_state.tail_reader.read())
+                    # 分块压缩后下载，避免把整个CSV读入内存
+                    st.download_button(
+                        label="Download CSV (gzip)",
+                        data=gzip_file_bytes(CSV_PATH),
+                        file_name="exercise_data.csv.gz",
+                        mime="application/gzip",
+                        key="download_button"
+                    )
+                except Exception as e:
+                    st.error(f"Error reading CSV: {e}")
+        else:
+            st.info(f"Will create: {CSV_PATH} when data is generated")
     
-    # 创建两列布局
+    # 启动共享的后台管道
+    get_coach_pipeline()
+
+    # 创建两列布局，各区域由定时重新运行的片段刷新，脚本本身不阻塞
     col1, col2 = st.columns([2, 1])
-    
+
     with col1:
-        chart_placeholder = st.empty()
-    
+        create_metrics_charts()
+
     with col2:
-        # 为当前指标创建空占位符
-        metrics_placeholder = st.empty()
-        # 为分析结果创建空占位符
-        analysis_placeholder = st.empty()
-        # 为语音播报按钮创建空占位符
-        speech_button_placeholder = st.empty()
-    
-    # 主循环
-    while True:
-        # 生成新数据
-        data = st.session_state.simulator.generate_health_data()
-        update_history(data)
-        
-        # 更新图表
-        with chart_placeholder:
-            st.plotly_chart(create_metrics_chart(), use_container_width=True)
-        
-        # 更新指标 - 使用占位符
-        with metrics_placeholder.container():
-            st.subheader("📊 Current Metrics")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("Heart Rate", f"{data['heart_rate']} bpm")
-                st.metric("Blood Oxygen", f"{data['blood_oxygen']}%")
-                st.metric("Distance", f"{data['performance']['distance']:.2f} km")
-            with col2:
-                st.metric("Pace", f"{data['performance']['pace']:.1f} min/km")
-                st.metric("Temperature", f"{data['environment']['temperature']}°C")
-                st.metric("Humidity", f"{data['environment']['humidity']}%")
-            
-            # 添加数据保存状态提示
-            if st.session_state.save_data:
-                st.caption(f"✅ Data saved to {st.session_state.csv_path}")
-        
-        # 更新分析
-        prompt = analyze_health_data(data, st.session_state.simulator.data_history)
-        analysis = get_llm_response(prompt)
-        
-        # 使用空占位符更新分析结果
-        with analysis_placeholder.container():
-            st.subheader("💡 AI Coach Feedback")
-            st.markdown(f"**Latest Update ({data['timestamp']}):**")
-            st.markdown(analysis)
-        
-        # 递增按钮计数器以生成唯一key
-        st.session_state.button_counter += 1
-        button_key = f"read_feedback_{st.session_state.button_counter}"
-        
-        # 添加语音播报按钮 - 使用动态生成的唯一key
-        with speech_button_placeholder.container():
-            col1, col2 = st.columns([1, 1])
-            with col1:
-                if st.button("🔊 Read Feedback", key=button_key):
-                    text_to_speech(analysis)
-                    st.session_state.last_read_feedback = analysis
-            with col2:
-                if st.session_state.auto_read_feedback:
-                    st.success("Auto-read enabled")
-                    # 只有当分析内容发生变化时才自动播报
-                    if analysis != st.session_state.last_read_feedback:
-                        text_to_speech(analysis)
-                        st.session_state.last_read_feedback = analysis
-                else:
-                    st.info("Auto-read disabled")
-        
-        time.sleep(10)
+        show_current_status()
+        show_coach_feedback()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,309 @@
+import re
+import math
+import numbers
+import operator
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from records import TIMESTAMP_FORMAT, HealthSample
+
+# (name, kind, field, argument, message)
+# "range" takes an inclusive (low, high) pair, "choice" a tuple of allowed
+# values, "greater" the name of a field that must be smaller, "timestamp" the
+# strftime format the value must be written in exactly. Fields used by
+# "range" and "greater" rules must also be real numbers (not NaN); a value of
+# the wrong type is reported once under the rule "<field>_type".
+VALIDATION_RULES = (
+    ("timestamp_format", "timestamp", "timestamp", TIMESTAMP_FORMAT, "Malformed timestamp"),
+    ("heart_rate_range", "range", "heart_rate", (40, 200), "Heart rate out of range"),
+    ("systolic_range", "range", "blood_pressure_systolic", (85, 200), "Systolic pressure out of range"),
+    ("diastolic_range", "range", "blood_pressure_diastolic", (40, 130), "Diastolic pressure out of range"),
+    ("pulse_pressure", "greater", "blood_pressure_systolic", "blood_pressure_diastolic",
+     "Systolic pressure not above diastolic"),
+    ("blood_oxygen_range", "range", "blood_oxygen", (70, 100), "Blood oxygen out of range"),
+    ("pace_range", "range", "pace", (2, 20), "Pace out of range"),
+    ("stride_range", "range", "stride", (0.2, 2.5), "Stride length out of range"),
+    ("cadence_range", "range", "cadence", (60, 240), "Cadence out of range"),
+    ("duration_range", "range", "duration", (0, 1440), "Duration out of range"),
+    ("distance_range", "range", "distance", (0, 300), "Distance out of range"),
+    ("calories_range", "range", "calories", (0, 20000), "Calories out of range"),
+    ("altitude_range", "range", "altitude", (-500, 9000), "Altitude out of range"),
+    ("temperature_range", "range", "temperature", (-40, 55), "Temperature out of range"),
+    ("pressure_range", "range", "pressure", (800, 1100), "Air pressure out of range"),
+    ("humidity_range", "range", "humidity", (0, 100), "Humidity out of range"),
+    ("status_value", "choice", "status", ("normal", "warning", "critical"), "Unknown status"),
+)
+
+_KINDS = ("range", "choice", "greater", "timestamp")
+
+# shape of TIMESTAMP_FORMAT, checked before the (slower) parse
+_CANONICAL_TIMESTAMP = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2}")
+
+
+class Violation:
+    """One failed rule; index is the row number for batch validation"""
+
+    __slots__ = ("rule", "field", "value", "message", "index")
+
+    def __init__(self, rule, field, value, message, index=None):
+        self.rule = rule
+        self.field = field
+        self.value = value
+        self.message = message
+        self.index = index
+
+    def __str__(self):
+        return f"{self.message} ({self.field}={self.value})"
+
+    def __repr__(self):
+        return f"Violation({self.rule!r}, {self.field}={self.value!r})"
+
+
+def _is_number(value):
+    if value.__class__ is int:
+        return True
+    if value.__class__ is float:
+        return not math.isnan(value)
+    return (isinstance(value, numbers.Real) and not isinstance(value, bool)
+            and not math.isnan(value))
+
+
+def _is_timestamp(value, fmt):
+    """True if value is a string written exactly in strftime format fmt"""
+    if value.__class__ is not str:
+        return False
+    try:
+        if fmt == TIMESTAMP_FORMAT:
+            return _CANONICAL_TIMESTAMP.fullmatch(value) is not None and bool(datetime.fromisoformat(value))
+        return datetime.strptime(value, fmt).strftime(fmt) == value
+    except ValueError:
+        return False
+
+
+def _timestamp_mask(values, fmt):
+    """Rows of a timestamp column that are not valid timestamps in format fmt"""
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return np.isnat(values)
+    parsed = pd.to_datetime(pd.Series(values, copy=False), format=fmt, errors="coerce")
+    mask = parsed.isna().to_numpy()
+    # to_datetime accepts some variations (e.g. missing zero padding), compare the text too
+    written = parsed.dt.strftime(fmt).to_numpy(dtype=object)
+    return mask | (written != values.astype(object))
+
+
+def _numeric_column(values):
+    """Float or int array of a column, with NaN where a value is not a number"""
+    values = np.asarray(values)
+    if values.dtype.kind in "iuf":
+        return values
+    return pd.to_numeric(pd.Series(values, copy=False), errors="coerce").to_numpy(dtype=np.float64)
+
+
+class BatchValidation:
+    """
+    Result of Validator.validate_columns
+
+    parameters:
+        size (int): rows validated
+        failures (list): (rule, field, message, mask of failing rows) per failed rule
+    """
+
+    def __init__(self, size, failures):
+        self.size = size
+        self.failures = failures
+        valid = np.ones(size, dtype=bool)
+        for _, _, _, mask in failures:
+            valid &= ~mask
+        self.valid = valid
+
+    @property
+    def invalid_count(self):
+        return int(self.size - np.count_nonzero(self.valid))
+
+    def counts(self):
+        """Failing rows per rule"""
+        return {rule: int(np.count_nonzero(mask)) for rule, _, _, mask in self.failures}
+
+    def violations(self, columns, limit=None):
+        """Violation objects for the failing rows, in rule order"""
+        found = []
+        for rule, field, message, mask in self.failures:
+            values = columns.get(field) if hasattr(columns, "get") else None
+            for index in np.flatnonzero(mask).tolist():
+                if limit is not None and len(found) >= limit:
+                    return found
+                value = values[index] if values is not None else None
+                found.append(Violation(rule, field, value, message, index))
+        return found
+
+    def split(self, columns):
+        """Returns: (valid columns, invalid columns), both dicts of arrays"""
+        invalid = ~self.valid
+        return ({name: np.asarray(values)[self.valid] for name, values in columns.items()},
+                {name: np.asarray(values)[invalid] for name, values in columns.items()})
+
+
+class Validator:
+    """
+    Schema validation compiled once from a declarative rule table
+
+    validate() checks one HealthSample or nested dict with plain
+    comparisons. validate_columns() checks a struct-of-arrays batch (see
+    records.samples_to_columns) with one vectorized comparison per rule,
+    millions of rows per second. Both report structured Violations
+    instead of printing, so callers can decide to keep, drop or
+    quarantine a record.
+
+    parameters:
+        rules (tuple): rule table, see VALIDATION_RULES
+    """
+
+    def __init__(self, rules=VALIDATION_RULES):
+        self.rules = []
+        numeric = []
+        for name, kind, field, argument, message in rules:
+            if kind not in _KINDS:
+                raise ValueError(f"Unknown kind for rule {name}: {kind}")
+            if kind == "range":
+                low, high = argument
+                if low > high:
+                    raise ValueError(f"Empty range for rule {name}: {argument}")
+            if kind == "choice":
+                argument = tuple(argument)
+            for used in (field, argument) if kind == "greater" else (field,):
+                if kind in ("range", "greater") and used not in numeric:
+                    numeric.append(used)
+            self.rules.append((name, kind, field, argument, message))
+        # type rules run first, a field of the wrong type skips its other rules
+        self.numeric_fields = tuple(numeric)
+        self._checks = [self._compile(rule) for rule in self.rules]
+        self.stats = {"records": 0, "invalid": 0}
+
+        # fast path for valid samples: every numeric field in one attrgetter call,
+        # compared against per-field bounds (the intersection of its range rules)
+        self._get_numeric = operator.attrgetter(*numeric) if numeric else (lambda sample: ())
+        if len(numeric) == 1:
+            getter = self._get_numeric
+            self._get_numeric = lambda sample: (getter(sample),)
+        lows = dict.fromkeys(numeric, -math.inf)
+        highs = dict.fromkeys(numeric, math.inf)
+        self._pairs = []
+        self._choices = []
+        self._timestamps = []
+        for name, kind, field, argument, message in self.rules:
+            if kind == "range":
+                lows[field] = max(lows[field], argument[0])
+                highs[field] = min(highs[field], argument[1])
+            elif kind == "greater":
+                self._pairs.append((numeric.index(field), numeric.index(argument)))
+            elif kind == "timestamp":
+                self._timestamps.append((field, argument))
+            else:
+                self._choices.append((field, frozenset(argument)))
+        self._lows = tuple(lows.values())
+        self._highs = tuple(highs.values())
+
+    @staticmethod
+    def _compile(rule):
+        name, kind, field, argument, message = rule
+        if kind == "range":
+            low, high = argument
+            return name, field, (field,), lambda row: low <= row[field] <= high, message
+        if kind == "choice":
+            allowed = frozenset(argument)
+            return name, field, (), lambda row: row[field] in allowed, message
+        if kind == "timestamp":
+            return name, field, (), lambda row: _is_timestamp(row[field], argument), message
+        return name, field, (field, argument), lambda row: row[field] > row[argument], message
+
+    def validate(self, sample):
+        """
+        Check one HealthSample or nested health data dict
+
+        Returns: list of Violations, empty when the sample is valid
+        """
+        self.stats["records"] += 1
+        try:
+            sample = HealthSample.from_dict(sample)
+        except (KeyError, TypeError) as e:
+            self.stats["invalid"] += 1
+            return [Violation("missing_field", str(e).strip("'"), None, "Missing field")]
+
+        values = self._get_numeric(sample)
+        try:
+            if (all(map(operator.le, self._lows, values))
+                    and all(map(operator.le, values, self._highs))
+                    and all(values[i] > values[j] for i, j in self._pairs)
+                    and all(getattr(sample, field) in allowed for field, allowed in self._choices)
+                    and all(_is_timestamp(getattr(sample, field), fmt) for field, fmt in self._timestamps)):
+                # NaN fails both bound checks, so only bools can still slip through
+                if not any(value.__class__ is bool for value in values):
+                    return []
+        except TypeError:
+            pass    # a value that is not a number, reported below
+
+        row = sample.to_row()
+        violations = []
+        bad_fields = set()
+        for field in self.numeric_fields:
+            value = row[field]
+            if not _is_number(value):
+                bad_fields.add(field)
+                violations.append(Violation(f"{field}_type", field, value, "Not a number"))
+        for name, field, numeric, check, message in self._checks:
+            if bad_fields and not bad_fields.isdisjoint(numeric):
+                continue
+            if not check(row):
+                violations.append(Violation(name, field, row[field], message))
+        if violations:
+            self.stats["invalid"] += 1
+        return violations
+
+    def validate_columns(self, columns):
+        """
+        Check a batch given as struct-of-arrays columns (dict or DataFrame)
+
+        Returns: BatchValidation
+        """
+        names = list(columns.keys())
+        size = len(columns[names[0]]) if names else 0
+        failures = []
+        numeric = {}
+        for field in self.numeric_fields:
+            if field not in columns:
+                failures.append(("missing_field", field, "Missing field", np.ones(size, dtype=bool)))
+                continue
+            values = _numeric_column(columns[field])
+            numeric[field] = values
+            if values.dtype.kind == "f":
+                failures.append((f"{field}_type", field, "Not a number", np.isnan(values)))
+
+        for name, kind, field, argument, message in self.rules:
+            if kind in ("choice", "timestamp"):
+                if field not in columns:
+                    failures.append(("missing_field", field, "Missing field", np.ones(size, dtype=bool)))
+                    continue
+                if kind == "timestamp":
+                    mask = _timestamp_mask(columns[field], argument)
+                else:
+                    mask = ~np.isin(np.asarray(columns[field]), np.array(argument, dtype=object).astype(str))
+            elif kind == "range":
+                if field not in numeric:
+                    continue
+                values = numeric[field]
+                low, high = argument
+                # NaN compares False both ways, it is already reported as a type failure
+                mask = (values < low) | (values > high)
+            else:
+                if field not in numeric or argument not in numeric:
+                    continue
+                mask = numeric[field] <= numeric[argument]
+            failures.append((name, field, message, mask))
+
+        result = BatchValidation(size, [failure for failure in failures if failure[3].any()])
+        self.stats["records"] += size
+        self.stats["invalid"] += result.invalid_count
+        return result